@@ -0,0 +1,70 @@
+"""benchmarks/bench_batch.py
+Command throughput of script mode against the interactive prompt path.
+The interactive path drives a real PromptSession through a pipe input, so
+the difference is the cost of prompt_toolkit in the loop.
+"""
+
+import io
+
+from benchmarks.common import measure, report, scratch_history
+from src.lib.batch import run_script
+from src.lib.shell import Shell
+
+
+COMMANDS = 2000
+# The prompt is orders of magnitude slower, keep its run short
+INTERACTIVE_COMMANDS = 50
+TOOL = "examples.hello_world"
+
+
+def script_lines(count):
+    """Return a benchmark script of count commands as a list of lines."""
+    lines = [f"load {TOOL}"]
+    for index in range(count // 2):
+        lines.append(f"{TOOL} set name user{index}")
+        lines.append(f"run {TOOL}")
+    return lines
+
+
+def run_batch():
+    """Run the script through the batch executor."""
+    run_script(
+        Shell(out=io.StringIO()), script_lines(COMMANDS), io.StringIO())
+
+
+def run_interactive():
+    """Run the script through the interactive prompt."""
+    # pylint: disable=import-outside-toplevel
+    from prompt_toolkit import PromptSession
+    from prompt_toolkit.input import create_pipe_input
+    from prompt_toolkit.output import DummyOutput
+
+    from sak import input_handler
+
+    with create_pipe_input() as pipe:
+        lines = script_lines(INTERACTIVE_COMMANDS) + ["exit"]
+        pipe.send_text("\n".join(lines) + "\n")
+        session = PromptSession(input=pipe, output=DummyOutput())
+        input_handler(session, Shell(out=io.StringIO()))
+
+
+@scratch_history()
+def run():
+    """Run the batch vs interactive benchmarks."""
+    results = [(
+        "script mode (per command)",
+        [sample / COMMANDS for sample in measure(run_batch, repeat=5)],
+    )]
+    try:
+        samples = measure(run_interactive, repeat=3)
+    except ImportError:
+        return results
+    results.append((
+        "interactive prompt (per command)",
+        [sample / INTERACTIVE_COMMANDS for sample in samples],
+    ))
+    return results
+
+
+if __name__ == "__main__":
+    report(run())
@@ -0,0 +1,109 @@
+"""benchmarks/bench_completion.py
+Completion at the prompt with small and large tool catalogs. The prompt
+used to collect every tool name and input and build a WordCompleter before
+each prompt, which then scanned all of them on every completion; the shell
+now keeps a completion index that is updated as tools are loaded. The
+catalogs are synthetic and served by a registry that never changes, so the
+former path is timed without re-scanning any tool files.
+"""
+
+import io
+
+from benchmarks.common import measure, report
+from src.lib.shell import Shell
+
+
+SIZES = (1000, 20000)
+PACKAGES = ("examples", "network", "forensics", "malware", "osint")
+VERBS = ("lookup", "scan", "parse", "decode", "extract", "resolve", "fetch",
+         "enrich", "query", "convert")
+NOUNS = ("ip", "domain", "hash", "url", "email", "cert", "asn", "whois",
+         "dns", "pcap", "log", "registry", "pe", "elf", "yara", "mutex",
+         "process", "file", "header", "banner")
+
+
+class CatalogRegistry:
+    """A registry of synthetic tool names whose tools never change."""
+
+    def __init__(self, size):
+        base = [f"{package}.{verb}_{noun}" for package in PACKAGES
+                for verb in VERBS for noun in NOUNS]
+        names = base[:size]
+        # Beyond the base names, numbered copies: scan_ip2, scan_ip3, ...
+        for index in range(len(base), size):
+            names.append(f"{base[index % len(base)]}"
+                         f"{index // len(base) + 1}")
+        self.names = sorted(names)
+
+    def refresh(self):
+        return False
+
+    def tool_names(self):
+        return list(self.names)
+
+
+def make_shell(size):
+    """Return a shell over a synthetic catalog, with HelloWorld loaded."""
+    shell = Shell(registry=CatalogRegistry(size), out=io.StringIO())
+    # pylint: disable-next=import-outside-toplevel
+    from src.tools.examples.hello_world import HelloWorldTool
+
+    shell.loaded_tools["examples.hello_world"] = HelloWorldTool()
+    return shell
+
+
+def words_before(shell):
+    """The words the prompt collected before each prompt."""
+    words = shell.registry.tool_names()
+    words.extend(shell.commands)
+    words.extend(shell.tool_commands)
+    for tool_instance in shell.loaded_tools.values():
+        words.extend(tool_instance.required_inputs)
+        words.extend(tool_instance.optional_inputs)
+    return words
+
+
+def run():
+    """Run the completion benchmarks."""
+    # pylint: disable=import-outside-toplevel
+    from prompt_toolkit.completion import CompleteEvent, WordCompleter
+    from prompt_toolkit.document import Document
+
+    event = CompleteEvent(completion_requested=True)
+    document = Document("load network.sc")
+    results = []
+    for size in SIZES:
+        shell = make_shell(size)
+        index = shell.completion
+
+        def before():
+            completer = WordCompleter(words_before(shell))
+            return list(completer.get_completions(document, event))
+
+        results.append((f"WordCompleter rebuilt per prompt (before), "
+                        f"{size} tools", measure(before, repeat=5, number=10)))
+        results.append((f"index build (once), {size} tools",
+                        measure(index.build, repeat=5)))
+        results.append((f"index, tool name prefix, {size} tools",
+                        measure(lambda: index.complete("load network.sc"),
+                                repeat=5, number=1000)))
+        results.append((f"index, tool name segment, {size} tools",
+                        measure(lambda: index.complete("load whois"),
+                                repeat=5, number=1000)))
+        results.append((f"index, misspelt tool name, {size} tools",
+                        measure(lambda: index.complete("load netwrok.scan"),
+                                repeat=5, number=100)))
+        results.append((f"index, inputs after '<tool> set', {size} tools",
+                        measure(lambda: index.complete(
+                            "examples.hello_world set n"),
+                            repeat=5, number=1000)))
+        tool_instance = shell.loaded_tools["examples.hello_world"]
+        results.append((f"index, tool loaded (update), {size} tools",
+                        measure(lambda: index.tool_loaded(
+                            "examples.hello_world", tool_instance),
+                            repeat=5, number=1000)))
+    return results
+
+
+if __name__ == "__main__":
+    report(run())
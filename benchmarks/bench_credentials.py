@@ -0,0 +1,51 @@
+"""benchmarks/bench_credentials.py
+Credential lookups against a fake keyring with a simulated round trip:
+every call reaching the backend, served by the credential cache, and
+prefetched for many tools in one pass.
+"""
+
+from benchmarks.common import measure, report
+from src.lib.credentials import CredentialCache, MemoryBackend
+
+
+# Seconds per backend call, in the range of a Secret Service round trip
+LATENCY = 0.002
+TOOLS = 50
+
+
+def make_backend():
+    """Return a fake keyring holding a password for every tool."""
+    return MemoryBackend(
+        {(f"Tool{index}", "api_key"): f"secret{index}"
+         for index in range(TOOLS)},
+        latency=LATENCY,
+    )
+
+
+def run():
+    """Run the credential cache benchmarks."""
+    backend = make_backend()
+    cache = CredentialCache(backend)
+    keys = [(f"Tool{index}", "api_key") for index in range(TOOLS)]
+    cache.prefetch(keys)
+    return [
+        ("get_password, backend every call",
+         measure(lambda: backend.get_password("Tool0", "api_key"),
+                 repeat=5, number=20)),
+        ("get_password, cached",
+         measure(lambda: cache.get("Tool0", "api_key"),
+                 repeat=5, number=10000)),
+        (f"{TOOLS} tools, fetched on first use",
+         measure(lambda: [cache.get(*key) for key in keys],
+                 repeat=3, setup=cache.clear)),
+        (f"{TOOLS} tools, prefetch in one pass",
+         measure(lambda: cache.prefetch(keys), repeat=3,
+                 setup=cache.clear)),
+        (f"{TOOLS} tools, used after prefetch",
+         measure(lambda: [cache.get(*key) for key in keys], repeat=3,
+                 setup=lambda: (cache.clear(), cache.prefetch(keys)))),
+    ]
+
+
+if __name__ == "__main__":
+    report(run())
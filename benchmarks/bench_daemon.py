@@ -0,0 +1,94 @@
+"""benchmarks/bench_daemon.py
+Latency of running a tool through a resident daemon against a cold start.
+A cold start runs "python sak.py -", which imports the application, loads
+the tools and only then runs the command. A client either runs in this
+process, measuring the round trip over the socket alone, or is started as
+"python sak.py --connect", as automation calling the daemon would.
+"""
+
+import io
+import os
+import shutil
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.bench_startup import make_workdir, python
+from benchmarks.common import measure, report
+from src.lib.client import request
+
+
+TOOLS = "examples.hello_world examples.otx_lookup"
+SCRIPT = f"load {TOOLS}\nrun examples.hello_world\n"
+COMMAND = "run examples.hello_world\n"
+CLIENTS = 8
+REQUESTS = 200
+
+
+def start_daemon(workdir, socket_path):
+    """Start a daemon with the tools loaded and wait until it serves."""
+    with open(os.path.join(workdir, "setup.txt"), "w",
+              encoding="utf-8") as setup:
+        setup.write(f"load {TOOLS}\n")
+    daemon = subprocess.Popen(  # pylint: disable=consider-using-with
+        [sys.executable, "sak.py", "--daemon", socket_path, "setup.txt"],
+        cwd=workdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while not os.path.exists(socket_path):
+        if daemon.poll() is not None or time.monotonic() > deadline:
+            daemon.kill()
+            raise RuntimeError("The daemon did not start.")
+        time.sleep(0.01)
+    return daemon
+
+
+def round_trip(socket_path):
+    """Run the command on the daemon from this process."""
+    request(socket_path, [COMMAND], io.StringIO())
+
+
+def concurrent_round_trips(socket_path):
+    """Run the command from CLIENTS threads, REQUESTS times in all."""
+    with ThreadPoolExecutor(max_workers=CLIENTS) as pool:
+        for _ in pool.map(lambda _: round_trip(socket_path),
+                          range(REQUESTS)):
+            pass
+
+
+def run():
+    """Run the daemon latency benchmarks."""
+    workdir = make_workdir()
+    socket_path = os.path.join(workdir, "sak.sock")
+    daemon = start_daemon(workdir, socket_path)
+    try:
+        results = [
+            ("cold start, python sak.py - (load tools, run)",
+             measure(lambda: python(workdir, "sak.py", "-", stdin=SCRIPT),
+                     repeat=5)),
+            ("client process, python sak.py --connect (run)",
+             measure(lambda: python(workdir, "sak.py", "--connect",
+                                    socket_path, "-", stdin=COMMAND),
+                     repeat=10)),
+            ("client round trip in process (run)",
+             measure(lambda: round_trip(socket_path), repeat=5,
+                     number=200)),
+        ]
+        samples = measure(lambda: concurrent_round_trips(socket_path),
+                          repeat=3)
+        results.append((
+            f"client round trip, {CLIENTS} concurrent clients (per request)",
+            [sample / REQUESTS for sample in samples],
+        ))
+        request(socket_path, ["shutdown"], io.StringIO())
+        daemon.wait(timeout=10)
+    finally:
+        if daemon.poll() is None:
+            daemon.kill()
+            daemon.wait()
+        shutil.rmtree(workdir)
+    return results
+
+
+if __name__ == "__main__":
+    report(run())
@@ -0,0 +1,118 @@
+"""benchmarks/bench_database.py
+Configuration load/save throughput through Database, with a private
+connection opened and closed per call (the old behaviour), with the pooled
+per-thread connection, and with the batched Tool load/save.
+"""
+
+import os
+import shutil
+import tempfile
+
+from benchmarks.common import measure, report
+from src.lib import tool as tool_module
+from src.lib.migrations import ensure_schema
+from src.lib.sqlite import Database, close_database
+from src.lib.tool import Tool, load_all_configurations
+
+
+PARAMETERS = [f"parameter_{index}" for index in range(20)]
+CALLS = 200
+
+
+def create_schema(db_path):
+    """Create a configurations table to benchmark against."""
+    with Database(db_path) as db:
+        ensure_schema(db)
+
+
+def load(db_path, pooled):
+    """Load every parameter of a tool, one query each."""
+    db = Database(db_path, pooled=pooled)
+    db.connect()
+    try:
+        for parameter in PARAMETERS:
+            db.execute_query(
+                "SELECT value FROM configurations "
+                "WHERE tool_name = ? AND parameter = ?",
+                ("Benchmark", parameter)
+            )
+    finally:
+        db.close()
+
+
+def save(db_path, pooled):
+    """Save every parameter of a tool, one statement each."""
+    db = Database(db_path, pooled=pooled)
+    db.connect()
+    try:
+        for parameter in PARAMETERS:
+            db.execute_query(
+                "INSERT OR REPLACE INTO configurations "
+                "(tool_name, parameter, value) VALUES (?, ?, ?)",
+                ("Benchmark", parameter, "value")
+            )
+        db.commit()
+    finally:
+        db.close()
+
+
+def make_tools(count):
+    """Return count tools with every benchmark parameter configured."""
+    tools = []
+    for index in range(count):
+        tool = Tool(f"Benchmark{index}", "Benchmark tool", "1.0.0", "")
+        for parameter in PARAMETERS:
+            tool.add_configuration_parameter(parameter)
+            tool.set_configuration(parameter, "value")
+        tools.append(tool)
+    return tools
+
+
+def run():
+    """Run the database benchmarks."""
+    results = []
+    workdir = tempfile.mkdtemp(prefix="sak-database-")
+    db_path_before = tool_module.DB_PATH
+    db_path = os.path.join(workdir, "tools.db")
+    try:
+        create_schema(db_path)
+        save(db_path, True)
+        for pooled in (False, True):
+            label = "pooled" if pooled else "connect per call"
+            for name, func in (("load", load), ("save", save)):
+                results.append((
+                    f"config {name}, {label} (per call)",
+                    measure(lambda func=func, pooled=pooled: func(
+                        db_path, pooled), repeat=5, number=CALLS),
+                ))
+        tool_module.DB_PATH = db_path
+        tools = make_tools(50)
+        tool = tools[0]
+        results.append((
+            "config load, one query (per call)",
+            measure(tool.load_configuration, repeat=5, number=CALLS),
+        ))
+        results.append((
+            "config save, executemany (per call)",
+            measure(tool.save_configuration, repeat=5, number=CALLS),
+        ))
+        for each in tools:
+            each.save_configuration()
+        results.append((
+            f"config load, {len(tools)} tools one at a time",
+            measure(lambda: [each.load_configuration() for each in tools],
+                    repeat=5),
+        ))
+        results.append((
+            f"config load, {len(tools)} tools in bulk",
+            measure(lambda: load_all_configurations(tools), repeat=5),
+        ))
+    finally:
+        tool_module.DB_PATH = db_path_before
+        close_database(db_path)
+        shutil.rmtree(workdir)
+    return results
+
+
+if __name__ == "__main__":
+    report(run())
@@ -0,0 +1,136 @@
+"""benchmarks/bench_history.py
+Cost of recording tool runs in the run history, and of reading it back.
+Runs are recorded without history, through the batched background writer,
+and written one transaction per run. Pages deep into a large history are
+read with keyset pagination and, for comparison, with OFFSET.
+"""
+
+import os
+import shutil
+import tempfile
+
+from benchmarks.common import measure, report
+from src.lib import history
+from src.lib.executors import get_executor
+from src.lib.sqlite import close_database
+from src.tools.examples.hello_world import HelloWorldTool
+
+
+RUNS = 2000
+# Number of runs in the history pages are read from
+HISTORY_RUNS = 100000
+PAGE_SIZE = 20
+STREAM_RECORDS = 100000
+
+
+def record_runs(count):
+    """Return a function running HelloWorld count times."""
+    backend = get_executor("thread")
+    tool = HelloWorldTool()
+    tool.set_input_value("name", "benchmark")
+
+    def runs():
+        for _ in range(count):
+            backend.run(tool)
+        history.HISTORY.flush()
+    return runs
+
+
+def record_runs_unbatched(count):
+    """Return a function running HelloWorld, writing each run at once."""
+    runs = record_runs(1)
+
+    def unbatched():
+        for _ in range(count):
+            runs()
+    return unbatched
+
+
+def fill(count):
+    """Record count runs of HelloWorld with distinct inputs."""
+    backend = get_executor("thread")
+    tool = HelloWorldTool()
+    for index in range(count):
+        tool.set_input_value("name", f"user{index}")
+        backend.run(tool)
+    history.HISTORY.flush()
+
+
+def offset_page(offset):
+    """Read a page of the history with OFFSET, for comparison."""
+    db = history.HISTORY._database()  # pylint: disable=protected-access
+    return db.execute_query(
+        f"SELECT {', '.join(history.COLUMNS)} FROM runs "
+        "ORDER BY started_at DESC, id DESC LIMIT ? OFFSET ?",
+        (PAGE_SIZE, offset)
+    )
+
+
+def stream(count):
+    """Yield count records, as a streaming tool would."""
+    for index in range(count):
+        yield {'index': index, 'value': f"record {index}"}
+
+
+def run():
+    """Run the run history benchmarks."""
+    results = []
+    workdir = tempfile.mkdtemp(prefix="sak-history-")
+    history_before = history.HISTORY
+    db_path = os.path.join(workdir, "tools.db")
+    try:
+        history.HISTORY = history.RunHistory(db_path, enabled=False)
+        for label, enabled, func in (
+                ("no history", False, record_runs(RUNS)),
+                ("batched writer", True, record_runs(RUNS)),
+                ("one transaction per run", True,
+                 record_runs_unbatched(RUNS)),
+        ):
+            history.HISTORY.enabled = enabled
+            samples = measure(func, repeat=5)
+            results.append((
+                f"HelloWorld run, {label} (per run)",
+                [sample / RUNS for sample in samples],
+            ))
+        history.HISTORY.clear()
+        fill(HISTORY_RUNS)
+        deep = history.HISTORY.query(limit=HISTORY_RUNS - PAGE_SIZE)[-1]
+        results.append((
+            f"history page {HISTORY_RUNS // PAGE_SIZE - 1} of "
+            f"{HISTORY_RUNS // PAGE_SIZE}, keyset",
+            measure(lambda: history.HISTORY.query(
+                after=deep['id'], limit=PAGE_SIZE), repeat=5, number=100),
+        ))
+        results.append((
+            f"history page {HISTORY_RUNS // PAGE_SIZE - 1} of "
+            f"{HISTORY_RUNS // PAGE_SIZE}, OFFSET",
+            measure(lambda: offset_page(HISTORY_RUNS - PAGE_SIZE), repeat=5,
+                    number=10),
+        ))
+        tool = HelloWorldTool()
+
+        def record_stream():
+            for _ in history.HISTORY.finish(
+                    history.HISTORY.start(tool), stream(STREAM_RECORDS)):
+                pass
+            history.HISTORY.flush()
+        results.append((
+            f"record a stream of {STREAM_RECORDS} records",
+            measure(record_stream, repeat=3),
+        ))
+        run_id = history.HISTORY.query(limit=1)[0]['id']
+        results.append((
+            f"read back a stream of {STREAM_RECORDS} records",
+            measure(lambda: sum(1 for _ in history.HISTORY.iter_output(
+                run_id)), repeat=3),
+        ))
+    finally:
+        history.HISTORY.flush()
+        history.HISTORY = history_before
+        close_database(db_path)
+        shutil.rmtree(workdir)
+    return results
+
+
+if __name__ == "__main__":
+    report(run())
@@ -0,0 +1,83 @@
+"""benchmarks/bench_memo.py
+Repeat runs of a deterministic tool: computed every time, served from the
+in-memory tier of the memo cache, and served from its SQLite tier.
+"""
+
+import os
+import shutil
+import tempfile
+
+from benchmarks.common import measure, report
+from src.lib import history, memo
+from src.lib.executors import get_executor
+from src.lib.sqlite import close_database
+from src.tools.examples.hash_chain import HashChainTool
+
+
+ROUNDS = 200000
+
+
+class ThreadHashChainTool(HashChainTool):
+    """HashChain run in this process, so only the memo cache is measured."""
+
+    __slots__ = ()
+
+    executor = "thread"
+
+
+class UnmemoizedHashChainTool(ThreadHashChainTool):
+    """HashChain computed on every run."""
+
+    __slots__ = ()
+
+    deterministic = False
+
+
+def make_tool(deterministic):
+    """Return a hash chain tool, memoized or not."""
+    tool = ThreadHashChainTool() if deterministic \
+        else UnmemoizedHashChainTool()
+    tool.set_input_value("data", "benchmark")
+    tool.set_input_value("rounds", ROUNDS)
+    return tool
+
+
+def run():
+    """Run the memoization benchmarks."""
+    results = []
+    workdir = tempfile.mkdtemp(prefix="sak-memo-")
+    memo_before = memo.MEMO
+    history_before = history.HISTORY
+    backend = get_executor("thread")
+    db_path = os.path.join(workdir, "tools.db")
+    try:
+        memo.MEMO = memo.MemoCache(db_path)
+        history.HISTORY = history.RunHistory(db_path)
+        uncached = make_tool(False)
+        results.append((
+            f"hash chain ({ROUNDS} rounds), not memoized",
+            measure(lambda: backend.run(uncached), repeat=5),
+        ))
+        cached = make_tool(True)
+        backend.run(cached)
+        results.append((
+            "hash chain, memory tier hit",
+            measure(lambda: backend.run(cached), repeat=5, number=1000),
+        ))
+        # Without a memory tier every hit is read back from SQLite
+        memo.MEMO = memo.MemoCache(db_path, memory_entries=0)
+        results.append((
+            "hash chain, SQLite tier hit",
+            measure(lambda: backend.run(cached), repeat=5, number=200),
+        ))
+    finally:
+        history.HISTORY.flush()
+        memo.MEMO = memo_before
+        history.HISTORY = history_before
+        close_database(db_path)
+        shutil.rmtree(workdir)
+    return results
+
+
+if __name__ == "__main__":
+    report(run())
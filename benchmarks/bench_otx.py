@@ -0,0 +1,102 @@
+"""benchmarks/bench_otx.py
+Bulk OTX lookups against a local stub server, comparing the sequential
+get_indicator_details_full path with the pooled lookup_many path, and
+uncached with cached repeat lookups.
+"""
+
+import os
+import shutil
+import tempfile
+
+from benchmarks.common import measure, report
+from benchmarks.otx_stub import OTXStubServer
+from src.lib.cache import CACHES, ResponseCache, register_cache
+from src.lib.sqlite import close_database
+from src.tools.examples.otx_lookup import SECTION_TTLS, OTXLookupTool
+
+
+INDICATORS = [f"10.0.{index // 256}.{index % 256}" for index in range(20)]
+LATENCY = 0.01
+
+
+class StubKeyOTXLookupTool(OTXLookupTool):
+    """The OTX tool with a fixed API key instead of the keyring."""
+
+    __slots__ = ()
+
+    def get_api_key(self):
+        return "stub-key"
+
+
+def make_tool(server_url, workers, cache="off"):
+    """Return an OTX tool pointed at the stub server."""
+    tool = StubKeyOTXLookupTool()
+    tool.set_configuration("server", server_url)
+    tool.set_configuration("workers", workers)
+    tool.set_configuration("max_per_host", workers)
+    tool.set_configuration("cache", cache)
+    return tool
+
+
+def run():
+    """Run the OTX lookup benchmarks."""
+    workdir = tempfile.mkdtemp(prefix="sak-otx-")
+    db_path = os.path.join(workdir, "cache.db")
+    # The cached lookups use a cache of their own, in place of the
+    # process's "otx" cache until the benchmark is done
+    cache_before = CACHES.get("otx")
+    register_cache("otx", ResponseCache("otx", db_path=db_path,
+                                        ttls=SECTION_TTLS))
+    try:
+        return _run_lookups()
+    finally:
+        if cache_before is None:
+            CACHES.pop("otx", None)
+        else:
+            register_cache("otx", cache_before)
+        close_database(db_path)
+        shutil.rmtree(workdir)
+
+
+def _run_lookups():
+    """Run the lookups against the stub server and return the results."""
+    # pylint: disable=import-outside-toplevel
+    from OTXv2 import IndicatorTypes, OTXv2
+
+    results = []
+    with OTXStubServer(latency=LATENCY) as server:
+        def sequential():
+            otx = OTXv2("stub-key", server=server.url)
+            for indicator in INDICATORS:
+                otx.get_indicator_details_full(IndicatorTypes.IPv4, indicator)
+
+        results.append((
+            f"sequential lookup ({len(INDICATORS)} indicators)",
+            measure(sequential, repeat=3),
+        ))
+        for workers in (8, 32):
+            tool = make_tool(server.url, workers)
+
+            def bulk(tool=tool):
+                for _ in tool.lookup_many(INDICATORS, "ip"):
+                    pass
+
+            results.append((
+                f"bulk lookup, {workers} workers "
+                f"({len(INDICATORS)} indicators)",
+                measure(bulk, repeat=3),
+            ))
+
+        tool = make_tool(server.url, 8, cache="on")
+        tool.set_input_value("indicator", INDICATORS[0])
+        tool.set_input_value("indicator_type", "ip")
+        tool.run()
+        results.append((
+            "repeat lookup, cached (1 indicator)",
+            measure(tool.run, repeat=5, number=20),
+        ))
+    return results
+
+
+if __name__ == "__main__":
+    report(run())
@@ -0,0 +1,83 @@
+"""benchmarks/bench_process_pool.py
+Scaling of a CPU-bound tool across cores. The same batch of HashChain runs
+is executed concurrently on the thread backend, which is limited by the GIL,
+and on the process backend with an increasing number of workers.
+"""
+
+import os
+
+from benchmarks.common import measure, report, scratch_history
+from src.lib.executors import ProcessBackend, register_executor
+from src.lib.jobs import JobManager
+from src.tools.examples.hash_chain import HashChainTool
+
+
+RUNS = 8
+ROUNDS = 100000
+
+
+class BenchmarkHashChainTool(HashChainTool):
+    """
+    HashChain with the executor settable per instance.
+    Every repeat must do the work rather than hit the memo cache.
+    """
+
+    __slots__ = ('executor',)
+
+    deterministic = False
+
+    def __init__(self):
+        super().__init__()
+        self.executor = "thread"
+
+
+def make_tools():
+    """Return RUNS hash chain tools with distinct inputs."""
+    tools = {}
+    for index in range(RUNS):
+        tool = BenchmarkHashChainTool()
+        tool.set_input_value("data", f"benchmark-{index}")
+        tool.set_input_value("rounds", ROUNDS)
+        tools[f"hash_chain_{index}"] = tool
+    return tools
+
+
+def run_batch(jobs, tools, executor):
+    """Run every tool concurrently on the named executor."""
+    for tool in tools.values():
+        tool.executor = executor
+    for job in jobs.run_concurrently(tools).values():
+        if job.status == "failed":
+            raise job.future.exception()
+
+
+@scratch_history()
+def run():
+    """Run the process pool scaling benchmarks."""
+    jobs = JobManager()
+    tools = make_tools()
+    results = [(
+        f"{RUNS} hash chains, threads",
+        measure(lambda: run_batch(jobs, tools, "thread"), repeat=3),
+    )]
+    workers = 1
+    while workers <= (os.cpu_count() or 1):
+        backend = ProcessBackend(workers)
+        executor = f"benchmark-process-{workers}"
+        register_executor(executor, backend)
+        # Start the pool and import the tool in every worker up front
+        backend.pool([BenchmarkHashChainTool.__module__])
+        run_batch(jobs, tools, executor)
+        results.append((
+            f"{RUNS} hash chains, {workers} worker process(es)",
+            measure(lambda executor=executor: run_batch(
+                jobs, tools, executor), repeat=3),
+        ))
+        backend.shutdown()
+        workers *= 2
+    jobs.shutdown()
+    return results
+
+
+if __name__ == "__main__":
+    report(run())
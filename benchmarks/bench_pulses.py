@@ -0,0 +1,150 @@
+"""benchmarks/bench_pulses.py
+Matching indicators against an offline pulse index instead of looking each
+one up in OTX. Subscribed pulses are synced from a local stub server; local
+indicators, of which one in a hundred is in a pulse, are then matched
+through the Bloom filter, through database lookups alone, or looked up
+online one by one.
+"""
+
+import os
+import shutil
+import tempfile
+
+from benchmarks.bench_otx import LATENCY, make_tool
+from benchmarks.common import measure, report
+from benchmarks.otx_stub import OTXStubServer
+from src.lib import pulses
+from src.lib.pulses import PulseIndex
+
+
+PULSE_COUNT = 200
+INDICATORS_PER_PULSE = 500
+LOCAL_INDICATORS = 200000
+HIT_EVERY = 100
+ONLINE_INDICATORS = 20
+
+
+def make_pulses():
+    """Return the pulses served by the stub, with distinct indicators."""
+    return [{
+        "id": f"pulse-{number:04d}",
+        "name": f"Pulse {number}",
+        "author_name": "stub",
+        "modified": f"2026-01-01T00:{number // 60:02d}:{number % 60:02d}",
+        "TLP": "white",
+        "tags": [],
+        "indicators": [
+            {"indicator": f"10.{number // 256}.{number % 256}.{index}",
+             "type": "IPv4"}
+            for index in range(INDICATORS_PER_PULSE)
+        ],
+    } for number in range(PULSE_COUNT)]
+
+
+def local_indicators():
+    """Return the indicators to match, one in HIT_EVERY in a pulse."""
+    return [
+        f"10.{(index // HIT_EVERY) % PULSE_COUNT // 256}."
+        f"{(index // HIT_EVERY) % PULSE_COUNT % 256}."
+        f"{index % INDICATORS_PER_PULSE}"
+        if index % HIT_EVERY == 0
+        else f"192.168.{index // 65536 % 256}.{index % 65536}"
+        for index in range(LOCAL_INDICATORS)
+    ]
+
+
+def run():
+    """Run the pulse index benchmarks."""
+    # pylint: disable=import-outside-toplevel
+    from src.lib.cache import get_cache
+
+    results = []
+    workdir = tempfile.mkdtemp(prefix="sak-pulses-")
+    db_path = os.path.join(workdir, "tools.db")
+    get_cache("otx", db_path=db_path)
+    index_before = pulses.PULSES
+    indicators = local_indicators()
+    try:
+        with OTXStubServer(latency=LATENCY, pulses=make_pulses()) as server:
+            tool = make_tool(server.url, 8)
+
+            def full_sync():
+                pulses.PULSES = PulseIndex(db_path=db_path)
+                pulses.PULSES.clear()
+                tool.sync_pulses()
+
+            results.append((
+                f"full sync ({PULSE_COUNT} pulses, "
+                f"{PULSE_COUNT * INDICATORS_PER_PULSE} indicators)",
+                measure(full_sync, repeat=3),
+            ))
+            results.append((
+                "incremental sync, nothing modified",
+                measure(tool.sync_pulses, repeat=5),
+            ))
+
+            index = pulses.PULSES
+            results.append((
+                "build Bloom filter from the index",
+                measure(index._bloom,  # pylint: disable=protected-access
+                        repeat=3,
+                        setup=lambda: setattr(index, '_filter', None)),
+            ))
+
+            def bloom_match():
+                for _ in index.match(indicators):
+                    pass
+
+            samples = measure(bloom_match, repeat=3)
+            results.append((
+                f"match, Bloom filter (per indicator, "
+                f"{LOCAL_INDICATORS} indicators)",
+                [sample / LOCAL_INDICATORS for sample in samples],
+            ))
+
+            def database_match():
+                # Every indicator is confirmed against the database
+                for start in range(0, LOCAL_INDICATORS, 500):
+                    index._confirm(  # pylint: disable=protected-access
+                        set(indicators[start:start + 500]))
+
+            samples = measure(database_match, repeat=3)
+            results.append((
+                f"match, database only (per indicator, "
+                f"{LOCAL_INDICATORS} indicators)",
+                [sample / LOCAL_INDICATORS for sample in samples],
+            ))
+
+            online = indicators[:ONLINE_INDICATORS]
+
+            def online_lookup():
+                for _ in tool.lookup_many(online, "ip"):
+                    pass
+
+            samples = measure(online_lookup, repeat=3)
+            results.append((
+                f"lookup online, no index (per indicator, "
+                f"{ONLINE_INDICATORS} indicators)",
+                [sample / ONLINE_INDICATORS for sample in samples],
+            ))
+
+            prefiltered = indicators[:ONLINE_INDICATORS * HIT_EVERY]
+
+            def prefilter_lookup():
+                for _ in tool.lookup_hits(prefiltered, "ip"):
+                    pass
+
+            samples = measure(prefilter_lookup, repeat=3)
+            results.append((
+                f"lookup with prefilter (per indicator, "
+                f"{len(prefiltered)} indicators)",
+                [sample / len(prefiltered) for sample in samples],
+            ))
+    finally:
+        pulses.PULSES = index_before
+        shutil.rmtree(workdir)
+    return results
+
+
+if __name__ == "__main__":
+    report(run())
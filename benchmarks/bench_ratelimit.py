@@ -0,0 +1,128 @@
+"""benchmarks/bench_ratelimit.py
+Bulk requests against a stub API that serves only a few requests at once and
+answers 429 Too Many Requests beyond that. Firing requests without a limiter
+loses the refused ones; retrying them at a fixed concurrency recovers them
+but keeps tripping the limit; the adaptive limiter settles below it. The
+requests that failed and the 429s the stub sent per batch are printed
+before the timings.
+"""
+
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.bench_otx import make_tool
+from benchmarks.common import measure, report
+from benchmarks.otx_stub import OTXStubServer
+from src.lib import ratelimit
+from src.lib.ratelimit import Limiter, check_status
+
+
+LATENCY = 0.01
+SERVED_AT_ONCE = 4
+CLIENTS = 16
+REQUESTS = 200
+INDICATORS = [f"10.1.{index // 256}.{index % 256}" for index in range(20)]
+
+
+def fetch(session, url):
+    """Make one request, raising for throttled and failed responses."""
+    response = session.get(url)
+    _ = response.content
+    check_status(response.status_code, response.headers)
+    return response
+
+
+def fire(session, url, limiter=None):
+    """
+    Make REQUESTS requests from CLIENTS threads.
+
+    :return: Number of requests that failed
+    """
+    def one(_):
+        try:
+            if limiter is None:
+                fetch(session, url)
+            else:
+                limiter.call(fetch, session, url)
+        except ratelimit.RetryableError:
+            return 1
+        return 0
+
+    with ThreadPoolExecutor(max_workers=CLIENTS) as pool:
+        return sum(pool.map(one, range(REQUESTS)))
+
+
+def scenario(server, name, func, repeat=3):
+    """Time a batch and print its failures and 429s per batch."""
+    throttled_before = server.throttled
+    failures = []
+    samples = measure(lambda: failures.append(func()), repeat=repeat)
+    throttled = (server.throttled - throttled_before) / repeat
+    print(f"{name}: failed {sum(failures) / repeat:.0f}, "
+          f"429s {throttled:.0f}")
+    return name, samples
+
+
+def run():
+    """Run the rate limiting benchmarks."""
+    # pylint: disable=import-outside-toplevel
+    import requests
+
+    from src.lib.cache import get_cache
+
+    results = []
+    workdir = tempfile.mkdtemp(prefix="sak-ratelimit-")
+    get_cache("otx", db_path=os.path.join(workdir, "cache.db"))
+    limiters_before = dict(ratelimit.LIMITERS)
+    with OTXStubServer(latency=LATENCY, max_concurrent=SERVED_AT_ONCE) \
+            as server, requests.Session() as session:
+        session.mount("http://", requests.adapters.HTTPAdapter(
+            pool_maxsize=CLIENTS))
+        url = f"{server.url}/api/v1/indicators/IPv4/10.0.0.1/general"
+
+        results.append(scenario(
+            server, f"no limiter, {CLIENTS} clients ({REQUESTS} requests)",
+            lambda: fire(session, url)))
+
+        def fixed():
+            limiter = Limiter("fixed", max_concurrency=CLIENTS,
+                              backoff_base=0.01)
+            # Never lower the limit: retries with backoff alone
+            limiter.concurrency.decrease = 1.0
+            return fire(session, url, limiter)
+
+        results.append(scenario(
+            server, f"retries, fixed concurrency {CLIENTS} "
+            f"({REQUESTS} requests)", fixed))
+
+        def adaptive():
+            limiter = Limiter("adaptive", max_concurrency=CLIENTS,
+                              backoff_base=0.01)
+            return fire(session, url, limiter)
+
+        results.append(scenario(
+            server, f"retries, adaptive concurrency up to {CLIENTS} "
+            f"({REQUESTS} requests)", adaptive))
+
+        def lookups():
+            ratelimit.LIMITERS.clear()
+            tool = make_tool(server.url, CLIENTS)
+            return sum(
+                "error" in section
+                for _, details in tool.lookup_many(INDICATORS, "ip")
+                for section in details.values()
+            )
+
+        results.append(scenario(
+            server, f"OTX tool, {CLIENTS} workers "
+            f"({len(INDICATORS)} indicators)", lookups))
+    ratelimit.LIMITERS.clear()
+    ratelimit.LIMITERS.update(limiters_before)
+    shutil.rmtree(workdir)
+    return results
+
+
+if __name__ == "__main__":
+    report(run())
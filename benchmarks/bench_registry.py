@@ -0,0 +1,93 @@
+"""benchmarks/bench_registry.py
+Cold-start vs warm-start build time of the tool registry.
+A cold start parses every synthetic tool file; a warm start reads the
+on-disk index and only stats the files.
+"""
+
+import os
+import shutil
+import tempfile
+
+from benchmarks.common import measure, report
+from src.lib.registry import ToolRegistry
+
+
+SIZES = (10, 100, 1000)
+TOOLS_PER_PACKAGE = 50
+
+TOOL_TEMPLATE = '''"""Synthetic tool {index}."""
+
+from src.lib.tool import Tool
+
+
+class SyntheticTool{index}(Tool):
+    """Synthetic tool {index}."""
+
+    def __init__(self):
+        super().__init__(
+            name="Synthetic{index}",
+            description="Synthetic tool number {index}",
+            version="1.0.0",
+            author="Benchmark"
+        )
+        self.add_required_input("target")
+        self.add_optional_input("verbose")
+        self.add_output("result")
+        self.add_configuration_parameter("timeout")
+
+    def run(self):
+        """Execute the tool's main functionality."""
+        return self.input_values.get("target")
+'''
+
+
+def make_tree(directory, count):
+    """Write count synthetic tools into packages under directory."""
+    for index in range(count):
+        package = os.path.join(
+            directory, f"package{index // TOOLS_PER_PACKAGE}")
+        os.makedirs(package, exist_ok=True)
+        path = os.path.join(package, f"synthetic_{index}.py")
+        with open(path, "w", encoding="utf-8") as tool_file:
+            tool_file.write(TOOL_TEMPLATE.format(index=index))
+
+
+def run():
+    """Run the registry benchmarks."""
+    results = []
+    for count in SIZES:
+        workdir = tempfile.mkdtemp(prefix="sak-registry-")
+        try:
+            root = os.path.join(workdir, "tools")
+            index_path = os.path.join(workdir, "registry.json")
+            make_tree(root, count)
+
+            def remove_index():
+                if os.path.exists(index_path):
+                    os.remove(index_path)
+
+            def build():
+                ToolRegistry(root, index_path).refresh()
+
+            results.append((
+                f"registry cold start ({count} tools)",
+                measure(build, repeat=5, setup=remove_index),
+            ))
+            build()
+            results.append((
+                f"registry warm start ({count} tools)",
+                measure(build, repeat=5),
+            ))
+            registry = ToolRegistry(root, index_path)
+            registry.refresh()
+            results.append((
+                f"registry refresh, unchanged ({count} tools)",
+                measure(registry.refresh, repeat=5),
+            ))
+        finally:
+            shutil.rmtree(workdir)
+    return results
+
+
+if __name__ == "__main__":
+    report(run())
@@ -0,0 +1,89 @@
+"""benchmarks/bench_serializers.py
+Throughput of the output formats on a stream of OTX-like records, against
+the renderings they replace: pretty-printed JSON, as the OTX tool returned,
+and str() of each record, as the shell printed streamed records. Output is
+written to an in-memory buffer; the bytes per record and per second of
+each format are printed before the timings.
+"""
+
+import io
+import json
+
+from benchmarks.common import measure, report
+from src.lib.serializers import SERIALIZERS, get_serializer
+
+
+RECORDS = 5000
+
+
+def make_records():
+    """Return records shaped like the bulk output of the OTX tool."""
+    return [{
+        "indicator": f"10.0.{index // 256}.{index % 256}",
+        "otx_data": {
+            section: {
+                "indicator": f"10.0.{index // 256}.{index % 256}",
+                "type": "IPv4",
+                "section": section,
+                "reputation": index % 7,
+                "pulse_info": {"count": index % 3, "pulses": [
+                    {"id": f"pulse-{pulse}", "name": f"Pulse {pulse}"}
+                    for pulse in range(index % 3)
+                ]},
+            }
+            for section in ("general", "reputation", "geo", "malware")
+        },
+    } for index in range(RECORDS)]
+
+
+def pretty(records, buffer):
+    """The OTX tool's former rendering, one indented document per record."""
+    for record in records:
+        buffer.write(json.dumps(record, indent=3))
+        buffer.write("\n")
+
+
+def printed(records, buffer):
+    """The shell's former rendering of streamed records."""
+    for record in records:
+        buffer.write(f"{record}\n")
+
+
+def serialized(name):
+    """Return a function writing records in a format to a buffer."""
+    def write(records, buffer):
+        serializer = get_serializer(name)(buffer)
+        for record in records:
+            serializer.write(record)
+        serializer.close()
+    return write
+
+
+def throughput(name, render, records):
+    """Time a rendering of the records and print its bytes per second."""
+    binary = name in SERIALIZERS and get_serializer(name).binary
+    new_buffer = io.BytesIO if binary else io.StringIO
+    probe = new_buffer()
+    render(records, probe)
+    size = len(probe.getvalue()) if binary \
+        else len(probe.getvalue().encode("utf-8"))
+    samples = measure(lambda: render(records, new_buffer()), repeat=5)
+    print(f"{name}: {size / min(samples) / 1e6:.1f} MB/s, "
+          f"{size / len(records):.0f} bytes/record")
+    return (f"{name} ({len(records)} records)", samples)
+
+
+def run():
+    """Run the serializer benchmarks."""
+    records = make_records()
+    results = [
+        throughput("pretty JSON, indent=3 (before)", pretty, records),
+        throughput("str() of records (before)", printed, records),
+    ]
+    for name in sorted(SERIALIZERS):
+        results.append(throughput(name, serialized(name), records))
+    return results
+
+
+if __name__ == "__main__":
+    report(run())
@@ -0,0 +1,45 @@
+"""benchmarks/bench_shell.py
+Command throughput of the shell, measured through Shell.execute without
+prompt_toolkit in the loop.
+"""
+
+import io
+
+from benchmarks.common import measure, report, scratch_history
+from src.lib.shell import Shell
+
+
+COMMANDS = 10000
+TOOL = "examples.hello_world"
+
+
+@scratch_history()
+def run():
+    """Run the shell dispatch benchmarks."""
+    shell = Shell(out=io.StringIO())
+    shell.execute(f"load {TOOL}")
+
+    def execute(line):
+        def batch():
+            shell.out = io.StringIO()
+            for _ in range(COMMANDS):
+                shell.execute(line)
+        return batch
+
+    results = []
+    for label, line in (
+            ("unknown command", "nosuchcommand"),
+            ("list loaded", "list loaded"),
+            ("tool set input", f"{TOOL} set name Benchmark"),
+            ("tool run", f"{TOOL} run"),
+    ):
+        samples = measure(execute(line), repeat=5)
+        results.append((
+            f"shell {label} (per command)",
+            [sample / COMMANDS for sample in samples],
+        ))
+    return results
+
+
+if __name__ == "__main__":
+    report(run())
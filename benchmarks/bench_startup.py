@@ -0,0 +1,155 @@
+"""benchmarks/bench_startup.py
+Cold start of the application. Each sample starts a fresh interpreter, so
+nothing is cached in sys.modules. Run directly, the script also checks the
+median import time of sak and its shell, over several fresh interpreters,
+against a budget and that heavy dependencies are not imported at startup,
+and exits with status 1 if either check fails.
+"""
+
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.common import measure, report
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Cumulative import time of sak and its shell, in milliseconds
+BUDGET_MS = 100
+# Fresh interpreters the budget check takes the median of; a single import
+# varies by tens of percent from one run to the next
+CHECK_SAMPLES = 7
+# Modules imported by every run of the application but a daemon client
+STARTUP_MODULES = ("sak", "src.lib.shell")
+# Modules that must only be imported once they are needed
+DEFERRED_MODULES = (
+    "prompt_toolkit", "keyring", "OTXv2", "requests", "asyncio",
+    "multiprocessing",
+)
+SCRIPT = "list\nload examples.hello_world examples.otx_lookup\n"
+
+
+def make_workdir():
+    """
+    Return a directory to start the application in.
+    It links to the code of the repository but has its own, empty, dbs
+    directory so runs do not touch the repository's databases.
+    """
+    workdir = tempfile.mkdtemp(prefix="sak-startup-")
+    for name in ("sak.py", "src"):
+        os.symlink(os.path.join(ROOT, name), os.path.join(workdir, name))
+    os.mkdir(os.path.join(workdir, "dbs"))
+    return workdir
+
+
+def python(workdir, *args, stdin=None):
+    """Run a fresh interpreter in a working directory."""
+    return subprocess.run(
+        [sys.executable, *args], cwd=workdir, input=stdin, text=True,
+        capture_output=True, check=True
+    )
+
+
+def import_times(workdir, modules=STARTUP_MODULES):
+    """
+    Imports modules in a fresh interpreter with -X importtime.
+
+    :return: Dictionary of module name -> cumulative import time in seconds
+    """
+    stderr = python(workdir, "-X", "importtime", "-c",
+                    "import " + ", ".join(modules)).stderr
+    times = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        try:
+            times[name.strip()] = int(cumulative) / 1e6
+        except ValueError:
+            continue
+    return times
+
+
+def startup_time(times):
+    """Return the cumulative import time of the startup modules."""
+    return sum(times[module] for module in STARTUP_MODULES)
+
+
+def run():
+    """Run the startup benchmarks."""
+    workdir = make_workdir()
+    try:
+        return [
+            ("import sak and its shell (cumulative)",
+             [startup_time(import_times(workdir)) for _ in range(5)]),
+            ("import sak (cumulative, daemon client)",
+             [import_times(workdir, ("sak",))["sak"] for _ in range(5)]),
+            ("python sak.py - (list, load 2 tools)",
+             measure(lambda: python(workdir, "sak.py", "-", stdin=SCRIPT),
+                     repeat=5)),
+            ("python -c pass (interpreter baseline)",
+             measure(lambda: python(workdir, "-c", "pass"), repeat=5)),
+        ]
+    finally:
+        shutil.rmtree(workdir)
+
+
+def check(budget_ms=BUDGET_MS, samples=CHECK_SAMPLES):
+    """
+    Checks startup against its budget.
+    The median of several samples is compared to the budget, so a single
+    slow interpreter start does not fail the check.
+
+    :param budget_ms: Import time budget in milliseconds
+    :param samples: Number of fresh interpreters to sample
+    :return: List of failure messages, empty if within budget
+    """
+    failures = []
+    workdir = make_workdir()
+    try:
+        sampled = [import_times(workdir) for _ in range(max(samples, 1))]
+    finally:
+        shutil.rmtree(workdir)
+    elapsed_ms = [startup_time(times) * 1e3 for times in sampled]
+    median_ms = statistics.median(elapsed_ms)
+    if median_ms > budget_ms:
+        failures.append(
+            f"import {', '.join(STARTUP_MODULES)} took {median_ms:.1f} ms "
+            f"(median of {len(elapsed_ms)}, {min(elapsed_ms):.1f} to "
+            f"{max(elapsed_ms):.1f} ms), budget {budget_ms} ms")
+    for module in DEFERRED_MODULES:
+        if any(module in times for times in sampled):
+            failures.append(f"{module} is imported at startup")
+    return failures
+
+
+def main(argv=None):
+    """Report the startup benchmarks and check the budget."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--budget-ms", type=float, default=BUDGET_MS,
+        help=f"Import time budget of sak and its shell "
+             f"(default: {BUDGET_MS})."
+    )
+    parser.add_argument(
+        "--samples", type=int, default=CHECK_SAMPLES,
+        help=f"Fresh interpreters whose median import time is checked "
+             f"(default: {CHECK_SAMPLES})."
+    )
+    arguments = parser.parse_args(argv)
+    report(run())
+    failures = check(arguments.budget_ms, arguments.samples)
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if not failures:
+        print(f"Startup is within its budget of {arguments.budget_ms} ms "
+              f"(median of {arguments.samples} runs).")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
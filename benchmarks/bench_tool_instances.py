@@ -0,0 +1,102 @@
+"""benchmarks/bench_tool_instances.py
+Instantiating and configuring many tools. Tools declaring a class-level
+ToolSpec share it between instances; tools declaring their metadata with
+add_* calls in __init__ build a spec per instance. Memory is measured with
+tracemalloc as the bytes held by the list of live instances.
+"""
+
+import tracemalloc
+
+from benchmarks.common import measure, report
+from src.lib.tool import Tool, ToolSpec
+
+
+INSTANCES = 100000
+PARAMETERS = ("server", "workers", "timeout", "cache")
+
+
+class SpecTool(Tool):
+    """A tool with its metadata in a shared ToolSpec."""
+
+    __slots__ = ()
+
+    tool_spec = ToolSpec(
+        name="SpecTool",
+        description="Benchmark tool",
+        version="1.0.0",
+        author="Benchmark",
+        required_inputs=("indicator",),
+        optional_inputs=("name", "limit"),
+        outputs=("result",),
+        configuration_parameters=PARAMETERS,
+    )
+
+
+class InitTool(Tool):
+    """The same tool with its metadata declared in __init__."""
+
+    def __init__(self):
+        super().__init__("InitTool", "Benchmark tool", "1.0.0", "Benchmark")
+        self.add_required_input("indicator")
+        self.add_optional_input("name")
+        self.add_optional_input("limit")
+        self.add_output("result")
+        for parameter in PARAMETERS:
+            self.add_configuration_parameter(parameter)
+
+
+def configure(tool):
+    """Set every input and configuration parameter of a tool."""
+    tool.set_input_value("indicator", "10.0.0.1")
+    tool.set_input_value("name", "benchmark")
+    tool.set_input_value("limit", 10)
+    for parameter in PARAMETERS:
+        tool.set_configuration(parameter, "value")
+
+
+def memory(tool_class):
+    """Return the bytes held by INSTANCES configured instances."""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        tools = [tool_class() for _ in range(INSTANCES)]
+        for tool in tools:
+            configure(tool)
+        held = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+    del tools
+    return held
+
+
+def run():
+    """Run the tool instance benchmarks."""
+    results = []
+    for tool_class in (InitTool, SpecTool):
+        label = tool_class.__name__
+        results.append((
+            f"{label}: instantiate {INSTANCES}",
+            measure(lambda tool_class=tool_class: [
+                tool_class() for _ in range(INSTANCES)], repeat=3),
+        ))
+        results.append((
+            f"{label}: instantiate and configure {INSTANCES}",
+            measure(lambda tool_class=tool_class: [
+                configure(tool_class()) for _ in range(INSTANCES)],
+                repeat=3),
+        ))
+        tool = tool_class()
+        results.append((
+            f"{label}: set_input_value (per call)",
+            measure(lambda tool=tool: tool.set_input_value("limit", 1),
+                    repeat=5, number=100000),
+        ))
+    for tool_class in (InitTool, SpecTool):
+        held = memory(tool_class)
+        print(f"{tool_class.__name__}: {held / INSTANCES:.0f} bytes per "
+              f"configured instance")
+    return results
+
+
+if __name__ == "__main__":
+    report(run())
@@ -0,0 +1,51 @@
+"""benchmarks/bench_tools.py
+The lifecycle of a real tool, HelloWorld, outside the shell: discovering the
+tools of the tree, loading a tool module cold and warm, instantiating the
+tool, setting an input, and running it directly and through the executor.
+"""
+
+import sys
+
+from benchmarks.common import measure, report, scratch_history
+from src.lib.shell import list_tools, load_tool, run_tool
+from src.tools.examples.hello_world import HelloWorldTool
+
+
+TOOL = "examples.hello_world"
+MODULE = f"src.tools.{TOOL}"
+
+
+def forget_module():
+    """Drop the tool module, so the next load_tool imports it again."""
+    sys.modules.pop(MODULE, None)
+
+
+@scratch_history()
+def run():
+    """Run the tool lifecycle benchmarks."""
+    tool = HelloWorldTool()
+    tool.set_input_value("name", "benchmark")
+    results = [
+        ("list_tools, warm registry",
+         measure(list_tools, repeat=5, number=100)),
+        ("load_tool, module not imported",
+         measure(lambda: load_tool(TOOL), repeat=5, setup=forget_module)),
+        ("load_tool, module imported",
+         measure(lambda: load_tool(TOOL), repeat=5, number=1000)),
+        ("HelloWorldTool() (per instance)",
+         measure(HelloWorldTool, repeat=5, number=10000)),
+        ("set_input_value (per call)",
+         measure(lambda: tool.set_input_value("name", "benchmark"),
+                 repeat=5, number=100000)),
+        ("HelloWorldTool.run, direct (per run)",
+         measure(tool.run, repeat=5, number=100000)),
+        ("HelloWorldTool.run, through run_tool (per run)",
+         measure(lambda: run_tool(tool), repeat=5, number=10000)),
+    ]
+    # Leave the module imported for whoever runs next
+    load_tool(TOOL)
+    return results
+
+
+if __name__ == "__main__":
+    report(run())
@@ -0,0 +1,76 @@
+"""benchmarks/common.py
+Shared helpers for the benchmark scripts.
+Each benchmark module exposes a run() function returning a list of
+(name, samples) pairs, where samples are durations in seconds, and can be
+executed directly with "python -m benchmarks.<module>" from the repository
+root.
+"""
+
+import contextlib
+import os
+import shutil
+import statistics
+import tempfile
+import time
+
+from src.lib import history
+
+
+def measure(func, repeat=5, number=1, setup=None):
+    """Time a callable.
+    :param func: Callable to time
+    :param repeat: Number of samples to take
+    :param number: Number of calls per sample
+    :param setup: Optional callable run, untimed, before each sample
+    :return: List of per-call durations in seconds, one per sample
+    """
+    samples = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        samples.append((time.perf_counter() - start) / number)
+    return samples
+
+
+def format_duration(seconds):
+    """Format a duration with a unit suited to its magnitude."""
+    if seconds >= 1:
+        return f"{seconds:.3f} s"
+    if seconds >= 1e-3:
+        return f"{seconds * 1e3:.3f} ms"
+    return f"{seconds * 1e6:.3f} us"
+
+
+@contextlib.contextmanager
+def scratch_history():
+    """
+    Records tool runs in a temporary database for the duration of a
+    benchmark, so benchmarks do not fill the repository's run history.
+    Usable as a context manager or as a decorator of run().
+    """
+    workdir = tempfile.mkdtemp(prefix="sak-history-")
+    history_before = history.HISTORY
+    history.HISTORY = history.RunHistory(os.path.join(workdir, "tools.db"))
+    try:
+        yield
+    finally:
+        history.HISTORY.flush()
+        history.HISTORY = history_before
+        shutil.rmtree(workdir)
+
+
+def report(results):
+    """Print a table of benchmark results.
+    :param results: List of (name, samples) pairs
+    """
+    width = max((len(name) for name, _ in results), default=0)
+    for name, samples in results:
+        print(
+            f"{name:<{width}}  "
+            f"median {format_duration(statistics.median(samples)):>12}  "
+            f"min {format_duration(min(samples)):>12}  "
+            f"n={len(samples)}"
+        )
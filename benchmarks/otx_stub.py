@@ -0,0 +1,162 @@
+"""benchmarks/otx_stub.py
+A local stand-in for the OTX API, so lookups can be exercised offline.
+Indicator detail requests are answered with a small JSON document after an
+optional delay that simulates network latency. Subscribed pulses are served
+from a list given to the server, paged and filtered by modified_since.
+The stub can also behave like a loaded API: it answers 429 Too Many
+Requests past a request rate or a number of concurrent requests, and fails
+a share of requests with 503.
+"""
+
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode
+
+from src.lib.ratelimit import TokenBucket
+
+
+class OTXStubHandler(BaseHTTPRequestHandler):
+    """
+    Answers /api/v1/indicators/<type>/<indicator>/<section> and
+    /api/v1/pulses/subscribed requests.
+    """
+
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately; without this, Nagle's
+    # algorithm adds a delayed-ACK stall to every keep-alive response.
+    disable_nagle_algorithm = True
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Serve an indicator detail section."""
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            server.in_flight += 1
+            in_flight = server.in_flight
+        try:
+            self.answer(server, in_flight)
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+    def answer(self, server, in_flight):
+        """Answer a request, or refuse it at once as a loaded API would."""
+        throttled = (server.max_concurrent and
+                     in_flight > server.max_concurrent) or \
+            (server.bucket is not None and not server.bucket.try_acquire())
+        if throttled or random.random() < server.error_rate:
+            with server.lock:
+                if throttled:
+                    server.throttled += 1
+                else:
+                    server.errors += 1
+            headers = {}
+            if server.retry_after is not None:
+                headers["Retry-After"] = str(server.retry_after)
+            self.send_json(
+                429 if throttled else 503,
+                {"detail": "Request was throttled." if throttled
+                 else "Service unavailable."}, headers)
+            return
+        if server.latency:
+            time.sleep(server.latency)
+        path, _, query = self.path.partition("?")
+        parts = path.strip("/").split("/")
+        if parts == ["api", "v1", "pulses", "subscribed"]:
+            self.send_pulses(server, parse_qs(query))
+            return
+        if parts[:3] != ["api", "v1", "indicators"] or len(parts) < 6:
+            self.send_json(404, {"detail": "Not found."})
+            return
+        indicator_type, indicator, section = parts[3], parts[4], parts[5]
+        self.send_json(200, {
+            "indicator": indicator,
+            "type": indicator_type,
+            "section": section,
+            "pulse_info": {"count": 0, "pulses": []},
+        })
+
+    def send_pulses(self, server, query):
+        """Send a page of the subscribed pulses."""
+        since = query.get("modified_since", [""])[0]
+        limit = int(query.get("limit", ["50"])[0])
+        page = int(query.get("page", ["1"])[0])
+        pulses = [pulse for pulse in server.pulses
+                  if pulse["modified"] >= since]
+        start = (page - 1) * limit
+        next_url = None
+        if start + limit < len(pulses):
+            arguments = {"limit": limit, "page": page + 1}
+            if since:
+                arguments["modified_since"] = since
+            next_url = (f"{server.url}/api/v1/pulses/subscribed?"
+                        f"{urlencode(arguments)}")
+        self.send_json(200, {
+            "count": len(pulses),
+            "results": pulses[start:start + limit],
+            "next": next_url,
+        })
+
+    def send_json(self, status, document, headers=None):
+        """Send a JSON response."""
+        body = json.dumps(document).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        """Keep benchmark output quiet."""
+
+
+class OTXStubServer(ThreadingHTTPServer):
+    """A threaded OTX stub listening on a free localhost port."""
+
+    daemon_threads = True
+
+    def __init__(self, latency=0.0, handler=OTXStubHandler,
+                 max_concurrent=None, rate=None, retry_after=None,
+                 error_rate=0.0, pulses=()):
+        """
+        :param latency: Seconds each request takes
+        :param handler: Request handler class
+        :param max_concurrent: Requests served at once, further ones get 429
+        :param rate: Requests served per second, further ones get 429
+        :param retry_after: Value of the Retry-After header of refusals
+        :param error_rate: Share of requests failed with 503
+        :param pulses: Pulses served as the subscribed pulses
+        """
+        super().__init__(("127.0.0.1", 0), handler)
+        self.latency = latency
+        self.max_concurrent = max_concurrent
+        self.bucket = TokenBucket(rate) if rate else None
+        self.retry_after = retry_after
+        self.error_rate = error_rate
+        self.pulses = list(pulses)
+        self.requests = 0
+        self.in_flight = 0
+        self.throttled = 0
+        self.errors = 0
+        self.lock = threading.Lock()
+        self.thread = None
+
+    @property
+    def url(self):
+        """Base URL to pass to the OTX client as its server."""
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
+        self.server_close()
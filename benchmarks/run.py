@@ -0,0 +1,339 @@
+"""benchmarks/run.py
+Runs the benchmark suite and tracks its results over time.
+Every benchmark module's samples are stored in a local SQLite database
+under a label, so a change can be compared against a baseline:
+
+    python -m benchmarks.run run --label baseline
+    python -m benchmarks.run run --label candidate bench_shell bench_tools
+    python -m benchmarks.run list
+    python -m benchmarks.run compare baseline candidate
+
+A benchmark regressed when its median got slower by more than a threshold
+and a one-sided Mann-Whitney U test finds the slowdown significant. Runs
+sharing a label are pooled, so running the suite more than once under a
+label gives the test more samples to work with. Only compare runs taken on
+the same machine. compare exits with status 1 when any benchmark regressed.
+"""
+
+import argparse
+import glob
+import importlib
+import json
+import math
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+from benchmarks.common import format_duration, report
+from src.lib.sqlite import Database
+
+
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(__file__), "results.db")
+DEFAULT_ALPHA = 0.05
+# Relative change of the median below which no change is reported; runs of
+# the same code on one machine drift by several percent
+DEFAULT_THRESHOLD = 0.10
+# Largest product of the sample sizes the exact test is computed for
+EXACT_LIMIT = 2500
+
+
+def discover():
+    """Return the names of the benchmark modules, in order."""
+    pattern = os.path.join(os.path.dirname(__file__), "bench_*.py")
+    return sorted(os.path.splitext(os.path.basename(path))[0]
+                  for path in glob.glob(pattern))
+
+
+def _database(db_path):
+    """
+    Returns a connected Database with the results tables.
+    The connection is private: benchmark modules close the pooled
+    connections of their own databases between runs.
+    """
+    db = Database(db_path, pooled=False)
+    db.connect()
+    db.execute_query(
+        "CREATE TABLE IF NOT EXISTS runs ("
+        "id INTEGER PRIMARY KEY, label TEXT NOT NULL, "
+        "started_at REAL NOT NULL, revision TEXT, python TEXT, "
+        "machine TEXT)"
+    )
+    db.execute_query(
+        "CREATE INDEX IF NOT EXISTS runs_label ON runs (label, started_at)")
+    db.execute_query(
+        "CREATE TABLE IF NOT EXISTS results ("
+        "run_id INTEGER NOT NULL, module TEXT NOT NULL, "
+        "name TEXT NOT NULL, samples TEXT NOT NULL, median REAL NOT NULL, "
+        "PRIMARY KEY (run_id, module, name))"
+    )
+    db.commit()
+    return db
+
+
+def _revision():
+    """Return the git revision of the tree, or None outside a checkout."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+            text=True, check=True, cwd=os.path.dirname(__file__),
+        ).stdout.strip() or None
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(label, modules=None, db_path=DEFAULT_DB_PATH):
+    """
+    Runs benchmark modules and stores their samples as one run.
+    A module that fails is reported and skipped.
+
+    :param label: Label to store the run under
+    :param modules: Names of the modules to run, all of them if empty
+    :param db_path: Path of the results database
+    :return: Tuple (run id, names of the modules that failed)
+    """
+    db = _database(db_path)
+    try:
+        return _run_modules(db, label, modules)
+    finally:
+        db.close()
+
+
+def _run_modules(db, label, modules):
+    """Run benchmark modules, storing their samples in a new run."""
+    run_id = db.connection.execute(
+        "INSERT INTO runs (label, started_at, revision, python, machine) "
+        "VALUES (?, ?, ?, ?, ?)",
+        (label, time.time(), _revision(), platform.python_version(),
+         f"{platform.machine()} {os.cpu_count()} CPU(s)"),
+    ).lastrowid
+    db.commit()
+    failed = []
+    for module in modules or discover():
+        print(f"== {module}", flush=True)
+        try:
+            results = importlib.import_module(f"benchmarks.{module}").run()
+        except Exception as e:  # pylint: disable=broad-except
+            print(f"{module} failed: {type(e).__name__}: {e}",
+                  file=sys.stderr)
+            failed.append(module)
+            continue
+        report(results)
+        db.execute_many(
+            "INSERT OR REPLACE INTO results "
+            "(run_id, module, name, samples, median) VALUES (?, ?, ?, ?, ?)",
+            [(run_id, module, name, json.dumps(samples),
+              statistics.median(samples)) for name, samples in results],
+        )
+        db.commit()
+    return run_id, failed
+
+
+def list_runs(db_path=DEFAULT_DB_PATH):
+    """Return the stored runs, newest first, as dictionaries."""
+    with _database(db_path) as db:
+        rows = db.execute_query(
+            "SELECT r.id, r.label, r.started_at, r.revision, r.python, "
+            "r.machine, COUNT(s.name) FROM runs r "
+            "LEFT JOIN results s ON s.run_id = r.id "
+            "GROUP BY r.id ORDER BY r.started_at DESC, r.id DESC"
+        )
+    columns = ('id', 'label', 'started_at', 'revision', 'python', 'machine',
+               'benchmarks')
+    return [dict(zip(columns, row)) for row in rows]
+
+
+def load_samples(selector, db_path=DEFAULT_DB_PATH):
+    """
+    Returns the pooled samples of the runs a selector picks.
+
+    :param selector: A run id, or a label picking every run under it
+    :return: Dictionary of (module, name) -> list of samples
+    :raises ValueError: If no run matches
+    """
+    if selector.isdigit():
+        where, value = "r.id = ?", int(selector)
+    else:
+        where, value = "r.label = ?", selector
+    with _database(db_path) as db:
+        rows = db.execute_query(
+            "SELECT s.module, s.name, s.samples FROM results s "
+            f"JOIN runs r ON r.id = s.run_id WHERE {where} "
+            "ORDER BY r.id", (value,))
+    if not rows:
+        raise ValueError(f"No results for run or label '{selector}'.")
+    samples = {}
+    for module, name, values in rows:
+        samples.setdefault((module, name), []).extend(json.loads(values))
+    return samples
+
+
+def _u_distribution(m, n):
+    """
+    Returns the number of orderings of two samples of sizes m and n giving
+    each value of U, the coefficients of the Gaussian binomial (m+n, m).
+    """
+    counts = [1] + [0] * (m * n)
+    for i in range(1, m + 1):
+        # Multiply by (1 - q^(n+i)), then divide by (1 - q^i)
+        for k in range(m * n, n + i - 1, -1):
+            counts[k] -= counts[k - n - i]
+        for k in range(i, m * n + 1):
+            counts[k] += counts[k - i]
+    return counts
+
+
+def mann_whitney(slower, faster):
+    """
+    One-sided Mann-Whitney U test that the first sample tends to be larger.
+    The p-value is exact for small samples without ties, and from the
+    normal approximation with tie and continuity corrections otherwise.
+
+    :param slower: Samples suspected to be larger
+    :param faster: Samples to compare them with
+    :return: p-value
+    """
+    m, n = len(slower), len(faster)
+    u = sum(1.0 if x > y else 0.5 if x == y else 0.0
+            for x in slower for y in faster)
+    values = slower + faster
+    ties = len(values) != len(set(values))
+    if not ties and m * n <= EXACT_LIMIT:
+        counts = _u_distribution(m, n)
+        return sum(counts[math.ceil(u):]) / math.comb(m + n, m)
+    total = m + n
+    tie_sum = sum(count ** 3 - count for count in
+                  (values.count(value) for value in set(values)))
+    variance = m * n / 12 * ((total + 1) - tie_sum / (total * (total - 1)))
+    if variance <= 0:
+        return 1.0
+    z = (u - m * n / 2 - 0.5) / math.sqrt(variance)
+    return 0.5 * math.erfc(z / math.sqrt(2))
+
+
+def compare(baseline, candidate, alpha=DEFAULT_ALPHA,
+            threshold=DEFAULT_THRESHOLD):
+    """
+    Compares the samples of two runs or labels benchmark by benchmark.
+
+    :param baseline: Samples returned by load_samples()
+    :param candidate: Samples returned by load_samples()
+    :param alpha: Significance level of the test
+    :param threshold: Relative change of the median that is ignored
+    :return: List of dictionaries, one per benchmark in both, with a
+        verdict of regression, improvement, unchanged or inconclusive
+    """
+    rows = []
+    for key in sorted(set(baseline) & set(candidate)):
+        before, after = baseline[key], candidate[key]
+        change = statistics.median(after) / statistics.median(before) - 1
+        p_slower = mann_whitney(after, before)
+        p_faster = mann_whitney(before, after)
+        # With few samples even a total separation is not significant
+        smallest_p = 1 / math.comb(len(before) + len(after), len(before))
+        if change > threshold and p_slower < alpha:
+            verdict = "regression"
+        elif change < -threshold and p_faster < alpha:
+            verdict = "improvement"
+        elif abs(change) > threshold and smallest_p >= alpha:
+            verdict = "inconclusive"
+        else:
+            verdict = "unchanged"
+        rows.append({
+            'module': key[0],
+            'name': key[1],
+            'baseline': statistics.median(before),
+            'candidate': statistics.median(after),
+            'change': change,
+            'p_value': p_slower if change > 0 else p_faster,
+            'samples': (len(before), len(after)),
+            'verdict': verdict,
+        })
+    return rows
+
+
+def parse_arguments(argv=None):
+    """Parse the command line arguments of the runner."""
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.run",
+        description="Run the benchmark suite and compare its results.")
+    parser.add_argument(
+        "--db", default=DEFAULT_DB_PATH,
+        help="Results database (default: benchmarks/results.db)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="Run benchmark modules")
+    run_parser.add_argument(
+        "modules", nargs="*", metavar="MODULE",
+        help="Modules to run, e.g. bench_shell (default: all)")
+    run_parser.add_argument(
+        "--label", default="latest", help="Label to store the run under")
+    run_parser.add_argument(
+        "--repeat", type=int, default=1,
+        help="Times to run the modules, each stored as a run")
+    commands.add_parser("list", help="List the stored runs")
+    compare_parser = commands.add_parser(
+        "compare", help="Compare a candidate against a baseline")
+    compare_parser.add_argument(
+        "baseline", help="Run id or label of the baseline")
+    compare_parser.add_argument(
+        "candidate", help="Run id or label of the candidate")
+    compare_parser.add_argument(
+        "--alpha", type=float, default=DEFAULT_ALPHA,
+        help="Significance level (default: 0.05)")
+    compare_parser.add_argument(
+        "--threshold", type=float, default=DEFAULT_THRESHOLD,
+        help="Relative change of the median ignored (default: 0.10)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Run the benchmark runner command line."""
+    arguments = parse_arguments(argv)
+    if arguments.command == "run":
+        unknown = set(arguments.modules) - set(discover())
+        if unknown:
+            print(f"Unknown benchmark module: {', '.join(sorted(unknown))}. "
+                  f"Available modules: {', '.join(discover())}.",
+                  file=sys.stderr)
+            return 2
+        failed = []
+        for _ in range(arguments.repeat):
+            run_id, failed = run_suite(
+                arguments.label, arguments.modules, arguments.db)
+            print(f"Stored run {run_id} as '{arguments.label}'.")
+        return 1 if failed else 0
+    if arguments.command == "list":
+        for run in list_runs(arguments.db):
+            started = time.strftime(
+                "%Y-%m-%d %H:%M:%S", time.localtime(run['started_at']))
+            print(f"{run['id']:>5}  {started}  {run['label']:<20} "
+                  f"{run['revision'] or '-':<10} python {run['python']}  "
+                  f"{run['machine']}  {run['benchmarks']} benchmark(s)")
+        return 0
+    try:
+        rows = compare(load_samples(arguments.baseline, arguments.db),
+                       load_samples(arguments.candidate, arguments.db),
+                       arguments.alpha, arguments.threshold)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+    width = max((len(row['module']) + len(row['name']) + 2
+                 for row in rows), default=0)
+    for row in rows:
+        print(
+            f"{row['module'] + ': ' + row['name']:<{width}}  "
+            f"{format_duration(row['baseline']):>12} -> "
+            f"{format_duration(row['candidate']):>12}  "
+            f"{row['change']:+8.1%}  p={row['p_value']:.3f}  "
+            f"n={row['samples'][0]}/{row['samples'][1]}  {row['verdict']}"
+        )
+    regressions = [row for row in rows if row['verdict'] == "regression"]
+    print(f"{len(rows)} benchmark(s) compared, "
+          f"{len(regressions)} regression(s).")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
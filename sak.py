@@ -1,210 +1,208 @@
 """ Main entry point for the Swiss Army Knife application. """
 
-import importlib
-import inspect
-import os
-import pkgutil
+import argparse
 import sys
 
-from prompt_toolkit import PromptSession
-from prompt_toolkit.history import FileHistory
-from prompt_toolkit.completion import WordCompleter
+# The shell, and everything behind it, is imported by the functions that
+# need it: a client of a daemon (--connect) only loads the client, and
+# prompt_toolkit and asyncio are only loaded for the interactive prompt.
 
+# Names re-exported from the shell, imported on first use
+SHELL_EXPORTS = (
+    "REGISTRY", "Shell", "list_tools", "load_module", "load_tool", "run_tool",
+)
 
-from src.lib.tool import Tool
 
+def __getattr__(name):
+    """Import the names re-exported from the shell on first use."""
+    if name in SHELL_EXPORTS:
+        from src.lib import shell  # pylint: disable=import-outside-toplevel
 
-def load_module(tool_name):
-    """Dynamically load a tool module by name."""
-    try:
-        module = importlib.import_module(f"src.tools.{tool_name}")
-        return module
-    except ImportError as e:
-        print(f"Tool '{tool_name}' could not be loaded: {e}")
-
-
-def load_tool(tool_name):
-    """Load a tool class from a module by name."""
-    module = load_module(tool_name)
-    for _, obj in inspect.getmembers(module):
-        if inspect.isclass(obj) and issubclass(obj, Tool) and obj is not Tool:
-            return obj
-    print(f"No valid tool class found in module '{tool_name}'.")
-
-
-def run_tool(tool_instance):
-    """Run a tool by its name."""
-    if not isinstance(tool_instance, Tool):
-        return "Please provide the name of a valid, loaded tool."
-    return tool_instance.run()
-
-
-def input_handler(session, loaded_tools=None):
-    """Return the command prompt for the Swiss Army Knife application."""
-    if not loaded_tools:
-        loaded_tools = {}
-    auto_completions = list(list_tools())
-    auto_completions.extend([
-        'load', 'run', 'exit', 'info', 'set', 'get', 'help'
-    ])
-    for tool in loaded_tools.keys():
-        auto_completions.extend(loaded_tools[tool].required_inputs)
-        auto_completions.extend(loaded_tools[tool].optional_inputs)
-    command = session.prompt(
-        ("swiisarmyknife> "),
-        completer=WordCompleter(auto_completions),
-        complete_while_typing=False
-    ).split(" ")
-    if command[0] == "list":
-        if len(command) == 1 or command[1] == "tools":
-            tools = list_tools()
-            print("Available tools:", ", ".join(tools))
-        elif command[1] == "loaded":
-            if loaded_tools:
-                print("Loaded tools:", ", ".join(loaded_tools.keys()))
-            else:
-                print("No tools are currently loaded.")
-    elif command[0] == "load" and len(command) > 1:
-        if command[1] in loaded_tools.keys():
-            print(f"Tool '{command[1]}' is already loaded.")
-        try:
-            tool_class = load_tool(command[1])
-            tool_instance = tool_class()
-            loaded_tools[command[1]] = tool_instance
-            print(f"Tool '{command[1]}' loaded successfully.")
-        except (ImportError, AttributeError, TypeError) as e:
-            print(f"Error loading tool '{command[1]}': {e}")
-        try:
-            tool_instance.load_configuration()
-            if tool_instance.configurations:
-                print(f"Configuration for '{command[1]}' loaded successfully.")
-        except (IOError, OSError) as e:
-            print(f"Error loading configuration for '{command[1]}': {e}")
-    elif command[0] == "run" and len(command) > 1:
-        if command[1] not in loaded_tools:
-            print(
-                f"Tool '{command[1]}' is not loaded. "
-                f"Use 'load {command[1]}' first."
-            )
-        else:
-            result = run_tool(loaded_tools[command[1]])
-            print(f"Result from '{command[1]}': {result}")
-    elif command[0] == "exit":
-        print("Exiting Swiss Army Knife application.")
-        sys.exit(0)
-    elif command[0] in loaded_tools.keys() and len(command) > 1:
-        tool_instance = loaded_tools[command[0]]
-        if command[1] == "get" and len(command) > 2:
-            if command[2] == "inputs":
-                print("Required inputs:", tool_instance.required_inputs)
-                print("Optional inputs:", tool_instance.optional_inputs)
-                print("Values:", tool_instance.input_values)
-            elif command[2].startswith("config"):
-                print(
-                    f"Configuration for '{tool_instance.name}': "
-                    f"{tool_instance.configurations}"
+        return getattr(shell, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+async def input_loop(session, shell):
+    """Read and execute commands until 'exit' or end of input.
+    The prompt is asynchronous and output from background jobs is printed
+    above it, so the prompt stays usable while jobs run.
+    """
+    # pylint: disable=import-outside-toplevel
+    from prompt_toolkit.patch_stdout import patch_stdout
+
+    from src.lib.completer import ShellCompleter
+
+    # The completer reads the shell's index, which follows loads and sets
+    completer = ShellCompleter(shell.completion)
+    with patch_stdout():
+        while shell.running:
+            try:
+                line = await session.prompt_async(
+                    ("swiisarmyknife> "),
+                    completer=completer,
+                    complete_while_typing=False
                 )
-            elif command[2] == "outputs":
-                print("Outputs:", tool_instance.output_values)
-            else:
-                print(f"Unknown input type: {command[2]}. "
-                      f"Available inputs: inputs, configs.")
-        elif command[1] == "info":
-            print(f"Tool Name: {tool_instance.name}")
-            print(f"Description: {tool_instance.description}")
-            print(f"Version: {tool_instance.version}")
-            print(f"Author: {tool_instance.author}")
-            print("Required Inputs:", tool_instance.required_inputs)
-            print("Optional Inputs:", tool_instance.optional_inputs)
-            print("Configuration Parameters:",
-                  tool_instance.configuration_parameters)
-            print("Credentials Required:", tool_instance.credentials_required)
-            print("API Key Required:", tool_instance.api_key_required)
-        elif command[1] == "run":
-            result = run_tool(tool_instance)
-            print(f"Result from '{tool_instance.name}': {result}")
-        elif command[1] == "save" and len(command) > 2:
-            if command[2].startswith("config"):
-                tool_instance.save_configuration()
-                print(f"Configuration for '{tool_instance.name}' saved.")
-            elif command[2] == "credentials":
-                tool_instance.save_credentials()
-                print(f"Credentials for '{tool_instance.name}' saved.")
-            else:
-                print(f"Unknown save type: {command[2]}. "
-                      f"Available types: configs.")
-        elif command[1] == "load" and len(command) > 2:
-            if command[2].startswith("config"):
-                tool_instance.load_configuration()
-                print(f"Configuration for '{tool_instance.name}' loaded.")
-            elif command[2] == "credentials":
-                tool_instance.load_credentials()
-                print(f"Credentials for '{tool_instance.name}' loaded.")
-            else:
-                print(f"Unknown load type: {command[2]}. "
-                      f"Available types: configs.")
-        elif command[1] == "set" and len(command) > 3:
-            input_name = command[2]
-            value = " ".join(command[3:])
-            if input_name == "api_key":
-                try:
-                    tool_instance.set_api_key(value)
-                    print(f"API key set to '{value}'.")
-                except ValueError as e:
-                    print(e)
-            elif input_name == "credentials":
-                credentials = {
-                    'username': command[3],
-                    'password': command[4]
-                }
-                try:
-                    tool_instance.add_credentials(**credentials)
-                    print(
-                        f"Credentials added for '{credentials['username']}'."
-                    )
-                except ValueError as e:
-                    print(e)
-            elif input_name == "help":
-                print("Available commands:")
-                print("  - api_key: Set the API key for the tool.")
-                print("  - credentials: Set the credentials for the tool:"
-                      f"  {tool_instance} set <username> <password>")
-                print("  - <input_name>: Set the value for a specific input.")
-            else:
-                try:
-                    tool_instance.set_input_value(input_name, value)
-                    print(f"Input '{input_name}' set to '{value}'.")
-                except ValueError as e:
-                    print(e)
-        else:
-            print(f"Unknown command for tool '{command[0]}': {command[1]}. "
-                  f"Available commands: get, info, run, set.")
-    else:
-        print(f"Unknown command: {command[0]}. "
-              f"Type 'help' for available commands.")
-
-    input_handler(session, loaded_tools)
-
-
-def list_tools():
-    """List all available tools in the src.tools package."""
-    tools = []
-    subfolders = [f.path for f in os.scandir("src/tools") if f.is_dir()]
-    for folder in subfolders:
-        folder_name = os.path.basename(folder)
-        package = importlib.import_module(f"src.tools.{folder_name}")
-        for _, module_name, _ in pkgutil.iter_modules(package.__path__):
-            tools.append(f"{os.path.basename(folder)}.{module_name}")
-    # Also include tools in the main src.tools package
-    if "src.tools" in sys.modules:
-        package = importlib.import_module("src.tools")
-        for _, module_name, _ in pkgutil.iter_modules(package.__path__):
-            tools.append(module_name)
-    return tools
-
-
-def main():
+            except KeyboardInterrupt:
+                continue
+            except EOFError:
+                shell.execute("exit")
+                break
+            try:
+                shell.execute(line)
+            except Exception as e:  # pylint: disable=broad-except
+                # A failing command must not end a long-running session
+                shell.error(f"Error: {e}")
+
+
+def input_handler(session, shell=None):
+    """Run the command prompt for the Swiss Army Knife application.
+    Commands are read and executed in a loop until 'exit' or end of input.
+    """
+    # pylint: disable=import-outside-toplevel
+    import asyncio
+
+    from src.lib.shell import Shell
+
+    if shell is None:
+        shell = Shell()
+        shell.notify_jobs = True
+    asyncio.run(input_loop(session, shell))
+
+
+def parse_arguments(argv=None):
+    """Parse the command line arguments."""
+    parser = argparse.ArgumentParser(
+        description="CLI for interfacing with modularized Python programs."
+    )
+    parser.add_argument(
+        "script", nargs="?",
+        help="Run the commands in this file, or from stdin if '-', and "
+             "write one JSON result per command, preceded by one JSON line "
+             "per streamed record, to stdout. With --daemon, the commands "
+             "are run before serving, e.g. to load tools."
+    )
+    parser.add_argument(
+        "--script", dest="script_option", metavar="FILE",
+        help="Same as the positional script argument."
+    )
+    parser.add_argument(
+        "--workers", type=int, metavar="N",
+        help="Number of worker processes for CPU-bound tools "
+             "(default: number of CPUs)."
+    )
+    parser.add_argument(
+        "--credential-ttl", type=float, metavar="SECONDS",
+        help="Seconds credentials read from the keyring are cached, 0 to "
+             "disable caching (default: 300)."
+    )
+    parser.add_argument(
+        "--no-history", action="store_true",
+        help="Do not record tool runs in the run history."
+    )
+    parser.add_argument(
+        "--daemon", metavar="SOCKET",
+        help="Keep tools loaded and serve clients on this Unix socket."
+    )
+    parser.add_argument(
+        "--daemon-workers", type=int, metavar="N",
+        help="Number of clients the daemon serves concurrently "
+             "(default: 8)."
+    )
+    parser.add_argument(
+        "--connect", metavar="SOCKET",
+        help="Send the commands of the script, or stdin, to the daemon "
+             "listening on this Unix socket."
+    )
+    return parser.parse_args(argv)
+
+
+def open_script(path):
+    """Return the lines of a script file, or stdin if path is '-'."""
+    if path == "-":
+        return sys.stdin
+    return open(path, encoding="utf-8")  # pylint: disable=consider-using-with
+
+
+def run_batch(path, shell=None):
+    """Run the commands in a script file, or stdin if path is '-'.
+    :return: Process exit status, non-zero if any command failed
+    """
+    # pylint: disable=import-outside-toplevel
+    from src.lib.batch import run_script
+    from src.lib.shell import Shell
+
+    shell = shell or Shell()
+    script = open_script(path)
+    try:
+        failures = run_script(shell, script, sys.stdout)
+    finally:
+        if script is not sys.stdin:
+            script.close()
+    return 1 if failures else 0
+
+
+def run_client(socket_path, path):
+    """Run the commands in a script file, or stdin, on a daemon.
+    :return: Process exit status, non-zero if any command failed
+    """
+    # pylint: disable=import-outside-toplevel
+    from src.lib.client import request
+
+    script = open_script(path)
+    try:
+        failures = request(socket_path, script, sys.stdout)
+    except OSError as e:
+        print(f"Could not reach the daemon on '{socket_path}': {e}",
+              file=sys.stderr)
+        return 2
+    finally:
+        if script is not sys.stdin:
+            script.close()
+    return 1 if failures else 0
+
+
+def run_daemon(socket_path, path=None, workers=None):
+    """Serve clients on a Unix socket, after running an optional script.
+    :return: Process exit status
+    """
+    # pylint: disable=import-outside-toplevel
+    from src.lib.daemon import DEFAULT_WORKERS, Daemon
+
+    daemon = Daemon(socket_path, workers or DEFAULT_WORKERS)
+    if path and run_batch(path, daemon.shell):
+        return 1
+    print(f"Serving on '{socket_path}'.", file=sys.stderr)
+    try:
+        daemon.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    except OSError as e:
+        print(e, file=sys.stderr)
+        return 1
+    return 0
+
+
+def main(argv=None):
     """Main function to run the Swiss Army Knife application."""
+    arguments = parse_arguments(argv)
+    script = arguments.script_option or arguments.script
+    if arguments.connect:
+        sys.exit(run_client(arguments.connect, script or "-"))
+    # pylint: disable=import-outside-toplevel
+    from src.lib import credentials, executors, history
+
+    executors.configure(workers=arguments.workers)
+    credentials.configure(ttl=arguments.credential_ttl)
+    if arguments.no_history:
+        history.configure(enabled=False)
+    if arguments.daemon:
+        sys.exit(run_daemon(arguments.daemon, script,
+                            arguments.daemon_workers))
+    if script:
+        sys.exit(run_batch(script))
+    from prompt_toolkit import PromptSession
+    from prompt_toolkit.history import FileHistory
+
     print("Welcome to the Swiss Army Knife application!")
     session = PromptSession(history=FileHistory(".history"))
     input_handler(session)
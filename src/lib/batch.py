@@ -0,0 +1,90 @@
+"""src/lib/batch.py
+Non-interactive execution of shell commands.
+Commands are read from a file or stream one line at a time and executed by a
+single Shell, so tools stay loaded across lines. Every command produces one
+JSON object on its own line (JSON Lines) describing its outcome. Records a
+tool streams are written as JSON Lines of their own as they are produced,
+before the outcome of their command, so they are never held in memory.
+"""
+
+import io
+import time
+
+from src.lib.serializers import dumps
+
+
+def execute_line(shell, line, out=None, line_number=None):
+    """
+    Executes one command line and describes the outcome.
+
+    :param shell: Shell to execute the command with
+    :param line: Command line
+    :param out: Optional text stream that records streamed by the command
+        are written to as they are produced, one JSON object per line with
+        the command, its line number and the record; without it they are
+        part of the output
+    :param line_number: Line number of the command in its script
+    :return: Dictionary with the command, status, output, result, number
+        of records written to out and timing
+    """
+    buffer = io.StringIO()
+    previous_out = shell.out
+    previous_sink = shell.record_sink
+    shell.out = buffer
+    records = 0
+    if out is not None:
+        def write_record(record):
+            nonlocal records
+            out.write(dumps({'command': line, 'line': line_number,
+                             'record': record}))
+            out.write("\n")
+            records += 1
+        shell.record_sink = write_record
+    result = None
+    start = time.perf_counter()
+    try:
+        result = shell.execute(line)
+        error = shell.last_error
+    except Exception as e:  # pylint: disable=broad-except
+        error = f"{type(e).__name__}: {e}"
+    finally:
+        elapsed = time.perf_counter() - start
+        shell.out = previous_out
+        shell.record_sink = previous_sink
+    return {
+        'command': line,
+        'status': 'error' if error else 'ok',
+        'error': error,
+        'output': buffer.getvalue(),
+        'result': result,
+        'records': records,
+        'elapsed_ms': round(elapsed * 1000, 3),
+    }
+
+
+def run_script(shell, lines, out):
+    """
+    Executes commands streamed from an iterable of lines.
+    Blank lines and lines starting with '#' are skipped. Execution stops
+    after an 'exit' command.
+
+    :param shell: Shell to execute the commands with
+    :param lines: Iterable of command lines, e.g. an open file or sys.stdin
+    :param out: Text stream that JSON Lines records are written to
+    :return: Number of commands that failed
+    """
+    failures = 0
+    for line_number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        record = execute_line(shell, line, out, line_number)
+        record['line'] = line_number
+        if record['status'] == 'error':
+            failures += 1
+        out.write(dumps(record))
+        out.write("\n")
+        out.flush()
+        if not shell.running:
+            break
+    return failures
@@ -0,0 +1,74 @@
+"""src/lib/bloom.py
+A Bloom filter: a compact set that answers "maybe present" or "certainly
+absent". It holds no items, only bits, so it stays small for millions of
+them; a share of absent items, set by the error rate, test as present.
+Bit positions are derived from Python's hash(), which is salted per process:
+a filter is built and queried in memory, and never saved.
+"""
+
+import math
+
+
+class BloomFilter:
+    """A Bloom filter of strings with a fixed capacity and error rate."""
+
+    def __init__(self, capacity, error_rate=0.001):
+        """
+        :param capacity: Number of items the filter is sized for
+        :param error_rate: Share of absent items testing as present once
+            the filter holds capacity items
+        """
+        capacity = max(int(capacity), 1)
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.bits = max(int(math.ceil(
+            -capacity * math.log(error_rate) / math.log(2) ** 2)), 8)
+        self.hashes = max(int(round(self.bits / capacity * math.log(2))), 1)
+        self.count = 0
+        self._array = bytearray((self.bits + 7) // 8)
+
+    def add(self, item):
+        """Add an item."""
+        # Double hashing: the halves of one 64-bit hash give every probe
+        value = hash(item) & 0xFFFFFFFFFFFFFFFF
+        position = value & 0xFFFFFFFF
+        step = (value >> 32) | 1
+        bits = self.bits
+        array = self._array
+        for _ in range(self.hashes):
+            position %= bits
+            array[position >> 3] |= 1 << (position & 7)
+            position += step
+        self.count += 1
+
+    def update(self, items):
+        """Add every item of an iterable."""
+        for item in items:
+            self.add(item)
+
+    def __contains__(self, item):
+        value = hash(item) & 0xFFFFFFFFFFFFFFFF
+        position = value & 0xFFFFFFFF
+        step = (value >> 32) | 1
+        bits = self.bits
+        array = self._array
+        # Absent items usually stop at one of the first probes
+        for _ in range(self.hashes):
+            position %= bits
+            if not array[position >> 3] & (1 << (position & 7)):
+                return False
+            position += step
+        return True
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def size(self):
+        """Number of bytes the filter's bits take."""
+        return len(self._array)
+
+    def expected_error_rate(self):
+        """Return the share of absent items expected to test as present."""
+        return (1 - math.exp(-self.hashes * self.count / self.bits)) \
+            ** self.hashes
@@ -0,0 +1,219 @@
+"""src/lib/cache.py
+A local cache for responses of remote APIs, stored in SQLite.
+Entries are keyed by (kind, key, section), expire after a per-section TTL,
+can be served stale for a grace period while they are refreshed, and are
+evicted least recently used first once the cache grows past its size limit.
+"""
+
+import json
+import threading
+import time
+
+from src.lib.migrations import ensure_schema
+from src.lib.sqlite import Database
+
+
+DEFAULT_DB_PATH = "dbs/tools.db"
+
+# Named caches of this process, see get_cache() and register_cache().
+CACHES = {}
+_CACHES_LOCK = threading.Lock()
+
+# Buffered access times are written back after this many hits.
+_TOUCH_FLUSH_INTERVAL = 100
+
+FRESH = "fresh"
+STALE = "stale"
+
+
+class ResponseCache:
+    """A size-bounded, TTL-aware response cache backed by SQLite."""
+
+    def __init__(self, name, db_path=DEFAULT_DB_PATH, max_entries=100000,
+                 default_ttl=3600, ttls=None, stale_ttl=86400):
+        """
+        :param name: Name of the cache, entries of caches sharing a database
+            are kept apart by it
+        :param db_path: Path of the SQLite database
+        :param max_entries: Number of entries kept before evicting
+        :param default_ttl: Seconds an entry stays fresh
+        :param ttls: Dictionary of section -> seconds overriding default_ttl
+        :param stale_ttl: Seconds past expiry an entry may still be served
+            while it is revalidated
+        """
+        self.name = name
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.ttls = dict(ttls or {})
+        self.stale_ttl = stale_ttl
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = None
+        self._touched = {}
+        self._lock = threading.Lock()
+
+    def _database(self):
+        """Return a connected Database with the response_cache table."""
+        db = Database(self.db_path)
+        db.connect()
+        ensure_schema(db)
+        return db
+
+    def ttl(self, section):
+        """Return the number of seconds entries of a section stay fresh."""
+        return self.ttls.get(section, self.default_ttl)
+
+    def get(self, kind, key, section):
+        """
+        Looks up an entry.
+
+        :return: Tuple (value, state) where state is FRESH, STALE, or None
+            when the entry is missing or expired past its grace period
+        """
+        rows = self._database().execute_query(
+            "SELECT value, stored_at FROM response_cache "
+            "WHERE cache = ? AND kind = ? AND key = ? AND section = ?",
+            (self.name, kind, key, section)
+        )
+        now = time.time()
+        age = now - rows[0][1] if rows else None
+        ttl = self.ttl(section)
+        with self._lock:
+            if age is None or age >= ttl + self.stale_ttl:
+                self.misses += 1
+                return None, None
+            self._touched[(kind, key, section)] = now
+            flush = len(self._touched) >= _TOUCH_FLUSH_INTERVAL
+            if age < ttl:
+                self.hits += 1
+                state = FRESH
+            else:
+                self.stale_hits += 1
+                state = STALE
+        if flush:
+            self._flush_touched()
+        return json.loads(rows[0][0]), state
+
+    def put(self, kind, key, section, value):
+        """Stores an entry, evicting the least recently used if full."""
+        db = self._database()
+        now = time.time()
+        params = (json.dumps(value, separators=(',', ':')), now, now,
+                  self.name, kind, key, section)
+        changed = db.execute_update(
+            "UPDATE response_cache SET value = ?, stored_at = ?, "
+            "accessed_at = ? WHERE cache = ? AND kind = ? AND key = ? "
+            "AND section = ?", params
+        )
+        if not changed:
+            db.execute_query(
+                "INSERT INTO response_cache (value, stored_at, accessed_at, "
+                "cache, kind, key, section) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                params
+            )
+        db.commit()
+        if not changed:
+            with self._lock:
+                if self._entries is not None:
+                    self._entries += 1
+            self._evict()
+
+    def _flush_touched(self):
+        """Write buffered access times back to the database."""
+        with self._lock:
+            touched, self._touched = self._touched, {}
+        if not touched:
+            return
+        db = self._database()
+        for (kind, key, section), accessed_at in touched.items():
+            db.execute_query(
+                "UPDATE response_cache SET accessed_at = ? WHERE cache = ? "
+                "AND kind = ? AND key = ? AND section = ?",
+                (accessed_at, self.name, kind, key, section)
+            )
+        db.commit()
+
+    def _evict(self):
+        """Delete the least recently used entries above max_entries."""
+        db = self._database()
+        with self._lock:
+            if self._entries is None:
+                self._entries = db.execute_query(
+                    "SELECT COUNT(*) FROM response_cache WHERE cache = ?",
+                    (self.name,)
+                )[0][0]
+            excess = self._entries - self.max_entries
+        if excess <= 0:
+            return
+        self._flush_touched()
+        removed = db.execute_update(
+            "DELETE FROM response_cache WHERE rowid IN ("
+            "SELECT rowid FROM response_cache WHERE cache = ? "
+            "ORDER BY accessed_at LIMIT ?)",
+            (self.name, excess)
+        )
+        db.commit()
+        with self._lock:
+            self._entries -= removed
+            self.evictions += removed
+
+    def clear(self):
+        """Delete every entry of this cache."""
+        db = self._database()
+        with self._lock:
+            self._touched = {}
+        db.execute_query(
+            "DELETE FROM response_cache WHERE cache = ?", (self.name,))
+        db.commit()
+        with self._lock:
+            self._entries = 0
+
+    def stats(self):
+        """Return the cache counters as a dictionary."""
+        db = self._database()
+        entries = db.execute_query(
+            "SELECT COUNT(*) FROM response_cache WHERE cache = ?",
+            (self.name,)
+        )[0][0]
+        with self._lock:
+            self._entries = entries
+            return {
+                'entries': entries,
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'stale_hits': self.stale_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+def get_cache(name, **kwargs):
+    """
+    Returns the named cache, creating it on first use.
+
+    :param name: Name of the cache
+    :param kwargs: Arguments for ResponseCache, used on creation only
+    """
+    with _CACHES_LOCK:
+        cache = CACHES.get(name)
+        if cache is None:
+            cache = ResponseCache(name, **kwargs)
+            CACHES[name] = cache
+        return cache
+
+
+def register_cache(name, cache):
+    """
+    Registers a cache under a name, so the shell's 'cache' command can
+    report and clear it.
+
+    :param name: Name of the cache
+    :param cache: Object with stats() and clear() methods
+    :return: The cache
+    """
+    with _CACHES_LOCK:
+        CACHES[name] = cache
+    return cache
@@ -0,0 +1,63 @@
+"""src/lib/client.py
+A thin client of the sak daemon.
+Command lines are sent to the daemon's Unix domain socket and the JSON
+Lines records it answers with, one per command and one per streamed record,
+are copied to the output as they arrive. Only the standard library is imported, so a client starts
+without loading the shell, the tools or their dependencies.
+"""
+
+import json
+import socket
+import threading
+
+
+def connect(path, timeout=None):
+    """
+    Connects to a daemon.
+
+    :param path: Path of the daemon's socket
+    :param timeout: Seconds to wait for the daemon, forever if None
+    :return: Connected socket
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(path)
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+def request(path, lines, out, timeout=None):
+    """
+    Sends command lines to a daemon and writes its records to out.
+    Lines are sent from a background thread while records are read, so a
+    long script cannot fill the socket buffers in both directions.
+
+    :param path: Path of the daemon's socket
+    :param lines: Iterable of command lines, e.g. an open file or sys.stdin
+    :param out: Text stream the JSON Lines records are written to
+    :param timeout: Seconds to wait on the daemon, forever if None
+    :return: Number of commands that failed
+    """
+    with connect(path, timeout) as sock:
+        def send():
+            try:
+                for line in lines:
+                    sock.sendall(
+                        (line.rstrip("\n") + "\n").encode("utf-8"))
+                sock.shutdown(socket.SHUT_WR)
+            except OSError:
+                pass
+
+        sender = threading.Thread(target=send, daemon=True)
+        sender.start()
+        failures = 0
+        with sock.makefile("r", encoding="utf-8") as records:
+            for record in records:
+                if json.loads(record).get('status') == 'error':
+                    failures += 1
+                out.write(record)
+                out.flush()
+    return failures
@@ -0,0 +1,21 @@
+"""src/lib/completer.py
+The prompt_toolkit completer of the interactive prompt. It is only imported
+by the prompt, so prompt_toolkit stays out of scripts and daemons.
+"""
+
+from prompt_toolkit.completion import Completer, Completion
+
+
+class ShellCompleter(Completer):
+    """Completes the word at the cursor from a shell's completion index."""
+
+    def __init__(self, index):
+        """
+        :param index: CompletionIndex of the shell
+        """
+        self.index = index
+
+    def get_completions(self, document, complete_event):
+        current, words = self.index.complete(document.text_before_cursor)
+        for word in words:
+            yield Completion(word, start_position=-len(current))
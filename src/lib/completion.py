@@ -0,0 +1,390 @@
+"""src/lib/completion.py
+Completion of the words typed at the shell prompt.
+Candidates live in prefix tries that are kept up to date as tools are
+loaded and inputs are set, instead of being collected again before every
+prompt. The words before the cursor pick the trie to complete from: tool
+names after 'load', the commands of a tool after its name, the inputs of
+that tool after '<tool> set', and so on. A lookup walks as many trie nodes
+as the typed prefix has characters and stops after a bounded number of
+candidates, so its cost does not grow with the size of the tool catalog.
+"""
+
+import bisect
+
+
+# Candidates returned by a lookup
+DEFAULT_LIMIT = 50
+# Typed characters per edit a close match may differ by, and the most
+# edits it may differ by
+CHARACTERS_PER_EDIT = 4
+MAX_EDITS = 2
+# Marks the words after a command that are tool names of the catalog
+CATALOG = "catalog"
+# Marks the words after a command that are names of loaded tools
+LOADED = "loaded"
+# Words after '<tool> set' besides the tool's inputs
+SET_WORDS = ('api_key', 'credentials', 'help')
+# Values remembered per input of a tool for completing '<tool> set' again
+MAX_VALUES = 20
+
+# Tool names are also found by the parts after these characters
+SEPARATORS = "._-"
+
+
+def segments(word):
+    """Return a word and its suffixes starting after a separator."""
+    keys = [word]
+    keys.extend(word[index + 1:] for index, character in enumerate(word[:-1])
+                if character in SEPARATORS)
+    return keys
+
+
+class _Node:
+    """A node of a prefix trie."""
+
+    __slots__ = ('children', 'words')
+
+    def __init__(self):
+        # Character -> child node, in character order
+        self.children = {}
+        # Sorted list of the words whose key ends here, or None
+        self.words = None
+
+    def child(self, character):
+        """Return the child node of a character, adding it if missing."""
+        node = self.children.get(character)
+        if node is None:
+            last = next(reversed(self.children), None)
+            node = self.children[character] = _Node()
+            if last is not None and character < last:
+                # Keep the children in order, so walks need not sort them
+                ordered = sorted(self.children.items())
+                self.children.clear()
+                self.children.update(ordered)
+        return node
+
+
+class PrefixTrie:
+    """
+    A trie of keys, each leading to one or more words.
+    A word is usually its own key, but can also be reached by other keys,
+    such as the segments of a dotted tool name.
+    """
+
+    def __init__(self, words=(), keys=None):
+        """
+        :param words: Words to add
+        :param keys: Optional callable returning the keys of a word
+        """
+        self.root = _Node()
+        self.keys = keys
+        self.words = set()
+        for word in words:
+            self.add(word)
+
+    def __contains__(self, word):
+        return word in self.words
+
+    def __len__(self):
+        return len(self.words)
+
+    def __iter__(self):
+        return iter(sorted(self.words))
+
+    def _keys(self, word):
+        return self.keys(word) if self.keys is not None else (word,)
+
+    def add(self, word):
+        """Add a word under its keys."""
+        if word in self.words:
+            return
+        self.words.add(word)
+        for key in self._keys(word):
+            node = self.root
+            for character in key:
+                node = node.child(character)
+            if node.words is None:
+                node.words = [word]
+            else:
+                bisect.insort(node.words, word)
+
+    def discard(self, word):
+        """Remove a word, if present, pruning the nodes left empty."""
+        if word not in self.words:
+            return
+        self.words.discard(word)
+        for key in self._keys(word):
+            path = [self.root]
+            for character in key:
+                path.append(path[-1].children[character])
+            node = path[-1]
+            node.words.remove(word)
+            if not node.words:
+                node.words = None
+            for character, parent in zip(reversed(key), reversed(path[:-1])):
+                child = parent.children[character]
+                if child.children or child.words:
+                    break
+                del parent.children[character]
+
+    def update(self, words):
+        """
+        Makes the trie hold exactly the given words, adding and removing
+        only the words that changed.
+        """
+        words = set(words)
+        for word in self.words - words:
+            self.discard(word)
+        for word in sorted(words - self.words):
+            self.add(word)
+
+    @staticmethod
+    def _collect(node, found, limit):
+        """Add the words under a node to found, in key order, up to limit."""
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            if node.words is not None:
+                for word in node.words:
+                    found.setdefault(word, None)
+                if len(found) >= limit:
+                    return
+            stack.extend(reversed(node.children.values()))
+
+    def complete(self, prefix, limit=DEFAULT_LIMIT):
+        """
+        Returns the words with a key starting with a prefix.
+
+        :param prefix: Typed prefix
+        :param limit: Maximum number of words returned
+        :return: List of words, in the order of their keys
+        """
+        node = self.root
+        for character in prefix:
+            node = node.children.get(character)
+            if node is None:
+                return []
+        found = {}
+        self._collect(node, found, limit)
+        return list(found)[:limit]
+
+    def fuzzy(self, query, max_edits=None, limit=DEFAULT_LIMIT):
+        """
+        Returns the words with a key starting with a close match of a query:
+        a prefix within max_edits insertions, deletions or substitutions of
+        it that starts with the same character. Keys sharing a prefix share
+        the rows of the edit distance table, and branches that cannot come
+        within max_edits are not visited.
+
+        :param query: Typed text
+        :param max_edits: Edits allowed, by default one per
+            CHARACTERS_PER_EDIT characters of the query, up to MAX_EDITS
+        :param limit: Maximum number of words returned
+        :return: List of words, the closest matches first
+        """
+        if max_edits is None:
+            max_edits = min(len(query) // CHARACTERS_PER_EDIT, MAX_EDITS)
+        start = self.root.children.get(query[:1])
+        if start is None:
+            return []
+        # Typos are rarely in the first character, and keeping it skips the
+        # branches of every other one
+        query = query[1:]
+        first_row = list(range(len(query) + 1))
+        # (edits, order found, node) of the nodes the whole query matches
+        matches = []
+        if first_row[-1] <= max_edits:
+            matches.append((first_row[-1], 0, start))
+        stack = [(start, first_row)]
+        while stack:
+            node, row = stack.pop()
+            for character, child in node.children.items():
+                # One row of the edit distance table per trie level
+                next_row = [row[0] + 1]
+                for column, expected in enumerate(query, 1):
+                    next_row.append(min(
+                        next_row[column - 1] + 1,
+                        row[column] + 1,
+                        row[column - 1] + (expected != character),
+                    ))
+                if next_row[-1] <= max_edits:
+                    matches.append((next_row[-1], len(matches), child))
+                if min(next_row) <= max_edits \
+                        and next_row[-1] > min(next_row):
+                    # A deeper prefix may still match with fewer edits
+                    stack.append((child, next_row))
+        found = {}
+        for _, _, node in sorted(matches, key=lambda match: match[:2]):
+            self._collect(node, found, limit)
+            if len(found) >= limit:
+                break
+        return list(found)[:limit]
+
+
+class CompletionIndex:
+    """
+    The words a shell can complete, by position in the command line.
+    The index is built from the shell on first use; until then updates are
+    ignored, so shells that never prompt, such as those of a daemon, pay
+    nothing for it.
+    """
+
+    def __init__(self, shell, arguments=None, options=None,
+                 option_values=None):
+        """
+        :param shell: Shell whose commands and tools are completed
+        :param arguments: Dictionary of command -> CATALOG, LOADED or the
+            words completed after it
+        :param options: Dictionary of command -> names of its '--' options
+        :param option_values: Dictionary of option name -> its values
+        """
+        self.shell = shell
+        self.arguments = arguments or {}
+        self.options = options or {}
+        self.option_values = option_values or {}
+        self.built = False
+        self.first = None
+        self.catalog = None
+        self.loaded = None
+        self.tool_commands = None
+        # Loaded tool -> trie of the words after '<tool> set'
+        self.inputs = {}
+        # (loaded tool, input) -> trie of the values set before
+        self.values = {}
+        self._words = {}
+
+    def build(self):
+        """Build the tries from the current state of the shell."""
+        shell = self.shell
+        shell.registry.refresh()
+        self.catalog = PrefixTrie(shell.registry.tool_names(), keys=segments)
+        self.loaded = PrefixTrie(shell.loaded_tools, keys=segments)
+        self.first = PrefixTrie(shell.commands, keys=segments)
+        for tool_name in shell.loaded_tools:
+            self.first.add(tool_name)
+        self.tool_commands = PrefixTrie(shell.tool_commands)
+        self.inputs = {}
+        self.values = {}
+        self._words = {}
+        self.built = True
+        for tool_name, tool_instance in shell.loaded_tools.items():
+            self.tool_loaded(tool_name, tool_instance)
+
+    def catalog_changed(self, tool_names):
+        """Bring the tool names of the catalog up to date."""
+        if self.built:
+            self.catalog.update(tool_names)
+
+    def command_added(self, name):
+        """Add a top-level command."""
+        if self.built:
+            self.first.add(name)
+
+    def tool_command_added(self, name):
+        """Add a command that follows the name of a loaded tool."""
+        if self.built:
+            self.tool_commands.add(name)
+
+    def tool_loaded(self, tool_name, tool_instance):
+        """Add a loaded tool and its inputs."""
+        if not self.built:
+            return
+        self.loaded.add(tool_name)
+        self.first.add(tool_name)
+        inputs = PrefixTrie(SET_WORDS)
+        for input_name in tool_instance.required_inputs:
+            inputs.add(input_name)
+        for input_name in tool_instance.optional_inputs:
+            inputs.add(input_name)
+        self.inputs[tool_name] = inputs
+
+    def value_set(self, tool_name, input_name, value):
+        """Remember a value set for an input of a loaded tool."""
+        if not self.built or input_name in SET_WORDS or " " in value:
+            return
+        values = self.values.get((tool_name, input_name))
+        if values is None:
+            values = self.values[(tool_name, input_name)] = PrefixTrie()
+        if value not in values and len(values) < MAX_VALUES:
+            values.add(value)
+
+    def _fixed(self, words):
+        """Return a trie of a fixed tuple of words, built once."""
+        trie = self._words.get(words)
+        if trie is None:
+            trie = self._words[words] = PrefixTrie(words)
+        return trie
+
+    def tries(self, words):
+        """
+        Returns the tries completing the word after some words.
+
+        :param words: Complete words before the one being typed
+        :return: List of tries
+        """
+        if not words:
+            return [self.first]
+        command = words[0]
+        if command in self.shell.loaded_tools:
+            if len(words) == 1:
+                return [self.tool_commands]
+            if words[1] == "set":
+                if len(words) == 2:
+                    return [self.inputs.get(command, self._fixed(SET_WORDS))]
+                if len(words) == 3:
+                    values = self.values.get((command, words[2]))
+                    return [values] if values is not None else []
+                return []
+            if words[1] == "run":
+                return self._options(command, words)
+        if command not in self.arguments and command not in self.options:
+            return []
+        tries = self._options(command, words)
+        if words[-1].startswith("--"):
+            return tries
+        argument = self.arguments.get(command)
+        if argument == CATALOG:
+            tries.append(self.catalog)
+        elif argument == LOADED:
+            tries.append(self.loaded)
+        elif argument and len(words) == 1:
+            tries.append(self._fixed(tuple(argument)))
+        return tries
+
+    def _options(self, command, words):
+        """Return the tries of a command's options or of an option's value."""
+        if words[-1].startswith("--"):
+            values = self.option_values.get(words[-1][2:])
+            return [self._fixed(tuple(values))] if values else []
+        names = self.options.get("run" if command in self.shell.loaded_tools
+                                 else command)
+        return [self._fixed(tuple(f"--{name}" for name in names))] \
+            if names else []
+
+    def complete(self, text, fuzzy=True, limit=DEFAULT_LIMIT):
+        """
+        Returns the candidates for the word being typed at the end of a line:
+        the words starting with what was typed or, if there are none, close
+        matches of it.
+
+        :param text: Command line up to the cursor
+        :param fuzzy: Whether to fall back to close matches
+        :param limit: Maximum number of candidates
+        :return: Tuple (word being typed, list of candidates)
+        """
+        if not self.built:
+            self.build()
+        words = text.split()
+        current = "" if not words or text[-1].isspace() else words.pop()
+        found = {}
+        tries = self.tries(words)
+        for trie in tries:
+            for word in trie.complete(current, limit - len(found)):
+                found.setdefault(word, None)
+        if fuzzy and not found and len(current) >= CHARACTERS_PER_EDIT:
+            for trie in tries:
+                for word in trie.fuzzy(current, limit=limit - len(found)):
+                    found.setdefault(word, None)
+                if len(found) >= limit:
+                    break
+        return current, list(found)
@@ -0,0 +1,230 @@
+"""src/lib/credentials.py
+An in-process cache of credentials in front of the keyring.
+Keyring backends such as the Secret Service or an encrypted file cost
+milliseconds or more per call. Passwords read or written through the cache
+are kept for a configurable TTL, held in bytearrays that are zeroed when
+they expire or are invalidated. Copies handed out as strings cannot be
+zeroed and live as long as their callers keep them.
+"""
+
+import atexit
+import threading
+import time
+
+from src.lib.cache import register_cache
+
+
+DEFAULT_TTL = 300
+
+
+class KeyringBackend:
+    """Stores credentials with the keyring package."""
+
+    def __init__(self):
+        self._keyring = None
+
+    def _module(self):
+        """Import keyring on first use, it probes its backends on import."""
+        if self._keyring is None:
+            import keyring  # pylint: disable=import-outside-toplevel
+            self._keyring = keyring
+        return self._keyring
+
+    def get_password(self, service, username):
+        """Return the stored password, or None."""
+        return self._module().get_password(service, username)
+
+    def set_password(self, service, username, password):
+        """Store a password."""
+        self._module().set_password(service, username, password)
+
+
+class MemoryBackend:
+    """
+    Stores credentials in a dictionary, for tests and benchmarks.
+    An optional latency simulates the round trip of a real backend.
+    """
+
+    def __init__(self, passwords=None, latency=0.0):
+        """
+        :param passwords: Dictionary of (service, username) -> password
+        :param latency: Seconds each call sleeps
+        """
+        self.passwords = dict(passwords or {})
+        self.latency = latency
+        self.calls = 0
+
+    def get_password(self, service, username):
+        """Return the stored password, or None."""
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return self.passwords.get((service, username))
+
+    def set_password(self, service, username, password):
+        """Store a password."""
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        self.passwords[(service, username)] = password
+
+
+class _Secret:
+    """A password held in a mutable buffer so it can be zeroed."""
+
+    __slots__ = ('value', 'expires')
+
+    def __init__(self, password, expires):
+        self.value = None if password is None \
+            else bytearray(password.encode("utf-8"))
+        self.expires = expires
+
+    def reveal(self):
+        """Return the password as a string, or None."""
+        return None if self.value is None else self.value.decode("utf-8")
+
+    def wipe(self):
+        """Overwrite the password with zeros."""
+        if self.value is not None:
+            for index in range(len(self.value)):
+                self.value[index] = 0
+            self.value = None
+
+
+class CredentialCache:
+    """A TTL cache of passwords keyed by (service, username)."""
+
+    def __init__(self, backend=None, ttl=DEFAULT_TTL):
+        """
+        :param backend: Object with get_password(service, username) and
+            set_password(service, username, password), keyring if None
+        :param ttl: Seconds a password is cached, 0 to disable caching
+        """
+        self.backend = backend or KeyringBackend()
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self._secrets = {}
+        self._lock = threading.Lock()
+
+    def _cached(self, key, now):
+        """Return the live secret of a key, wiping it if it expired."""
+        secret = self._secrets.get(key)
+        if secret is not None and secret.expires <= now:
+            secret.wipe()
+            del self._secrets[key]
+            self.expired += 1
+            secret = None
+        return secret
+
+    def _store(self, key, password, now):
+        """Cache a password, replacing and wiping any previous one."""
+        if self.ttl <= 0:
+            return
+        old = self._secrets.get(key)
+        if old is not None:
+            old.wipe()
+        self._secrets[key] = _Secret(password, now + self.ttl)
+
+    def get(self, service, username):
+        """
+        Returns a password, from the cache while it is fresh.
+        A missing password is cached too, so repeated lookups of it do not
+        reach the backend either.
+
+        :return: The password, or None if the backend has none
+        """
+        key = (service, username)
+        with self._lock:
+            secret = self._cached(key, time.monotonic())
+            if secret is not None:
+                self.hits += 1
+                return secret.reveal()
+            self.misses += 1
+        password = self.backend.get_password(service, username)
+        with self._lock:
+            self._store(key, password, time.monotonic())
+        return password
+
+    def set(self, service, username, password):
+        """Stores a password in the backend and the cache."""
+        self.backend.set_password(service, username, password)
+        with self._lock:
+            self._store((service, username), password, time.monotonic())
+
+    def prefetch(self, keys):
+        """
+        Loads the passwords of several (service, username) pairs in one
+        pass, skipping those already cached.
+
+        :return: Number of passwords fetched from the backend
+        """
+        now = time.monotonic()
+        with self._lock:
+            missing = [key for key in dict.fromkeys(keys)
+                       if self._cached(key, now) is None]
+        for service, username in missing:
+            password = self.backend.get_password(service, username)
+            with self._lock:
+                self._store((service, username), password, time.monotonic())
+        return len(missing)
+
+    def invalidate(self, service=None, username=None):
+        """
+        Drops and wipes cached passwords.
+
+        :param service: Only drop passwords of this service
+        :param username: Only drop passwords of this username
+        """
+        with self._lock:
+            for key in list(self._secrets):
+                if service is not None and key[0] != service:
+                    continue
+                if username is not None and key[1] != username:
+                    continue
+                self._secrets.pop(key).wipe()
+
+    def expire(self):
+        """Wipe every password past its TTL."""
+        now = time.monotonic()
+        with self._lock:
+            for key in list(self._secrets):
+                self._cached(key, now)
+
+    def clear(self):
+        """Drop and wipe every cached password."""
+        self.invalidate()
+
+    def stats(self):
+        """Return the cache counters as a dictionary."""
+        self.expire()
+        with self._lock:
+            return {
+                'entries': len(self._secrets),
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'expired': self.expired,
+            }
+
+
+CREDENTIALS = CredentialCache()
+atexit.register(CREDENTIALS.clear)
+register_cache('credentials', CREDENTIALS)
+
+
+def configure(ttl=None, backend=None):
+    """
+    Configures the process-wide credential cache.
+
+    :param ttl: Seconds passwords are cached, 0 to disable caching
+    :param backend: Credential backend replacing the keyring
+    """
+    if backend is not None:
+        CREDENTIALS.clear()
+        CREDENTIALS.backend = backend
+    if ttl is not None:
+        CREDENTIALS.ttl = ttl
+        if ttl <= 0:
+            CREDENTIALS.clear()
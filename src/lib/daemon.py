@@ -0,0 +1,195 @@
+"""src/lib/daemon.py
+A resident sak server.
+The daemon keeps tools loaded and configured in one process and serves
+clients on a Unix domain socket. A client sends command lines and receives
+one JSON Lines record per command, as in script mode. Each connection is
+served by a thread of a fixed pool with a shell of its own, whose tools are
+clones of the daemon's: inputs set by one client are never seen by another,
+while imports, configuration and cached credentials are shared by all.
+"""
+
+import io
+import os
+import socket
+import socketserver
+import stat
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from src.lib.batch import run_script
+from src.lib.shell import Shell
+
+
+# Connections served concurrently, further ones wait for a free worker
+DEFAULT_WORKERS = 8
+
+
+class RequestShell(Shell):
+    """
+    A shell serving one connection to the daemon.
+    It starts with a clone of every tool the daemon has loaded. Loading a
+    tool clones it from the daemon, loading it into the daemon first if
+    needed, so scripts written for a cold start work unchanged.
+    """
+
+    def __init__(self, daemon):
+        super().__init__(registry=daemon.shell.registry)
+        self.daemon = daemon
+        with daemon.lock:
+            self.loaded_tools = {
+                tool_name: tool_instance.clone()
+                for tool_name, tool_instance
+                in daemon.shell.loaded_tools.items()
+            }
+        self.register_command('shutdown', self.do_shutdown)
+
+    def do_load(self, command):
+        """Give the connection a fresh clone of one or more tools."""
+        if len(command) < 2:
+            self.error("Usage: load <tool> [<tool> ...]")
+            return
+        template = self.daemon.shell
+        with self.daemon.lock:
+            missing = [tool_name for tool_name in command[1:]
+                       if tool_name not in template.loaded_tools]
+            if missing:
+                previous_out = template.out
+                template.out = self.out
+                try:
+                    template.execute("load " + " ".join(missing))
+                finally:
+                    template.out = previous_out
+                if template.last_error:
+                    self.last_error = template.last_error
+            for tool_name in command[1:]:
+                tool_instance = template.loaded_tools.get(tool_name)
+                if tool_instance is None:
+                    continue
+                self.loaded_tools[tool_name] = tool_instance.clone()
+                if tool_name not in missing:
+                    self.write(f"Tool '{tool_name}' loaded successfully.")
+
+    def do_shutdown(self, command):
+        """Stop the daemon once this connection is served."""
+        self.write("Shutting down the daemon.")
+        self.daemon.shutdown()
+        self.running = False
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    """Runs the command lines of one connection."""
+
+    def handle(self):
+        daemon = self.server.daemon
+        shell = RequestShell(daemon)
+        lines = io.TextIOWrapper(self.rfile, encoding="utf-8")
+        out = io.TextIOWrapper(self.wfile, encoding="utf-8",
+                               write_through=True)
+        try:
+            run_script(shell, lines, out)
+        finally:
+            shell.jobs.shutdown()
+            lines.detach()
+            out.detach()
+            daemon.served()
+
+
+class _Server(socketserver.UnixStreamServer):
+    """A Unix socket server handing connections to a pool of threads."""
+
+    def __init__(self, path, daemon, workers):
+        self.daemon = daemon
+        self.pool = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="sak-daemon")
+        super().__init__(path, _Handler)
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self._serve, request, client_address)
+
+    def _serve(self, request, client_address):
+        """Serve one connection on a pool thread."""
+        try:
+            self.finish_request(request, client_address)
+        except Exception:  # pylint: disable=broad-except
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def handle_error(self, request, client_address):
+        error = sys.exc_info()[1]
+        print(f"Error serving a client: {type(error).__name__}: {error}",
+              file=sys.stderr)
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(wait=True, cancel_futures=True)
+
+
+class Daemon:
+    """Serves a warm shell to clients of a Unix domain socket."""
+
+    def __init__(self, path, workers=DEFAULT_WORKERS, shell=None):
+        """
+        :param path: Path of the socket to listen on
+        :param workers: Number of connections served concurrently
+        :param shell: Shell holding the tools every connection starts with
+        """
+        self.path = path
+        self.workers = workers
+        self.shell = shell or Shell()
+        # Guards the daemon's shell, which connections load tools into
+        self.lock = threading.Lock()
+        self.requests = 0
+        self._server = None
+
+    def _remove_stale_socket(self):
+        """
+        Removes a socket left behind by a daemon that did not exit cleanly.
+
+        :raises OSError: If the path is not a socket or a daemon answers on it
+        """
+        try:
+            mode = os.stat(self.path).st_mode
+        except FileNotFoundError:
+            return
+        if not stat.S_ISSOCK(mode):
+            raise OSError(f"'{self.path}' exists and is not a socket.")
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(self.path)
+        except OSError:
+            os.unlink(self.path)
+            return
+        finally:
+            probe.close()
+        raise OSError(f"A daemon is already listening on '{self.path}'.")
+
+    def serve_forever(self):
+        """Listen on the socket until shutdown() is called."""
+        self._remove_stale_socket()
+        # Only the user running the daemon may connect to it
+        previous_umask = os.umask(0o177)
+        try:
+            self._server = _Server(self.path, self, self.workers)
+        finally:
+            os.umask(previous_umask)
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+
+    def served(self):
+        """Count a served connection."""
+        with self.lock:
+            self.requests += 1
+
+    def shutdown(self):
+        """Stop serving, without waiting for the server to stop."""
+        if self._server is not None:
+            threading.Thread(target=self._server.shutdown,
+                             daemon=True).start()
@@ -0,0 +1,245 @@
+"""src/lib/executors.py
+Pluggable execution backends for tools.
+A tool names the backend it runs on with its executor attribute. "thread"
+runs the tool in the calling thread, or in the event loop's default thread
+pool when run asynchronously. "process" runs CPU-bound tools in a pool of
+worker processes so they are not limited by the GIL; their result is sent
+back whole, so tools that stream their result are refused. Both record every
+run in the run history and serve repeat runs from the memo cache, unless the
+caller, such as a pipeline stage, asks for a plain run. Runs served from the
+memo cache are recorded as replays.
+"""
+
+import importlib
+import os
+
+from src.lib.history import finish_run, start_run
+from src.lib.instrumentation import timed, timed_call
+from src.lib.memo import lookup, replay, store
+from src.lib.streaming import is_stream
+
+
+def recorded_run(tool, run):
+    """
+    Runs a tool through the memo cache, recording the run in the history.
+
+    :param tool: Tool to run
+    :param run: Callable performing the run on a memo miss
+    :return: The tool's result
+    """
+    entry = start_run(tool)
+    try:
+        key, memo_entry = lookup(tool)
+        if memo_entry is not None:
+            return finish_run(entry, replay(tool, memo_entry), replayed=True)
+        result = store(tool, key, run())
+    except BaseException as e:
+        finish_run(entry, error=e)
+        raise
+    return finish_run(entry, result)
+
+
+class ThreadBackend:
+    """Runs tools in the current process."""
+
+    def run(self, tool, record=True):
+        """
+        Run a tool and return its result.
+
+        :param record: Whether to record the run in the history and serve
+            it from the memo cache
+        """
+        if not record:
+            return timed_call("run", tool.name, tool.run)
+        return timed_call("run", tool.name,
+                          lambda: recorded_run(tool, tool.run))
+
+    async def run_async(self, tool):
+        """Run a tool in the event loop's default executor."""
+        import asyncio  # pylint: disable=import-outside-toplevel
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.run, tool)
+
+
+# Tools instantiated in a worker process, by (module, class name)
+_worker_tools = {}
+
+
+def _warm_up(modules):
+    """Import tool modules when a worker process starts."""
+    for module in modules:
+        try:
+            importlib.import_module(module)
+        except ImportError:
+            pass
+
+
+def _run_in_worker(module, class_name, input_values, configurations,
+                   credentials):
+    """
+    Run a tool inside a worker process.
+    Only the tool's class and state cross the process boundary; the
+    instance is created once per worker and reused. A streamed result would
+    have to be collected whole to be sent back, defeating the point of
+    streaming it, so it is refused.
+
+    :return: Tuple (result, output_values)
+    :raises ValueError: If the tool streams its result
+    """
+    key = (module, class_name)
+    tool = _worker_tools.get(key)
+    if tool is None:
+        tool_class = getattr(importlib.import_module(module), class_name)
+        tool = tool_class()
+        _worker_tools[key] = tool
+    tool.input_values = input_values
+    tool.configurations = configurations
+    tool.credentials = credentials
+    tool.output_values = {}
+    result = tool.run()
+    if is_stream(result):
+        if hasattr(result, "close"):
+            result.close()
+        raise ValueError(
+            f"Tool '{tool.name}' streams its result and cannot run on the "
+            f"process executor; use the thread executor.")
+    return result, tool.output_values
+
+
+class ProcessBackend:
+    """Runs tools in a pool of warm worker processes."""
+
+    def __init__(self, workers=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.modules = set()
+        self._pool = None
+
+    def configure(self, workers):
+        """Change the number of worker processes."""
+        if workers != self.workers:
+            self.shutdown()
+            self.workers = workers
+
+    def pool(self, modules=()):
+        """
+        Return the process pool, starting it on first use.
+        Worker processes import the given tool modules as they start, so
+        the first run in each worker does not pay for the import.
+        """
+        # multiprocessing is only imported once a CPU-bound tool runs
+        # pylint: disable=import-outside-toplevel
+        from concurrent.futures import ProcessPoolExecutor
+
+        self.modules.update(modules)
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_warm_up,
+                initargs=(tuple(sorted(self.modules)),)
+            )
+        return self._pool
+
+    @staticmethod
+    def _arguments(tool):
+        """Return the picklable arguments describing a tool run."""
+        return (
+            type(tool).__module__, type(tool).__name__,
+            tool.input_values, tool.configurations, tool.credentials,
+        )
+
+    @staticmethod
+    def _apply(tool, outcome):
+        """Copy a worker's outputs back onto the tool and return the result."""
+        result, output_values = outcome
+        tool.output_values.update(output_values)
+        return result
+
+    def run(self, tool, record=True):
+        """
+        Run a tool in a worker process and return its result.
+
+        :param record: Whether to record the run in the history and serve
+            it from the memo cache
+        """
+        def run():
+            pool = self.pool([type(tool).__module__])
+            future = pool.submit(_run_in_worker, *self._arguments(tool))
+            return self._apply(tool, future.result())
+        if not record:
+            return timed_call("run", tool.name, run)
+        return timed_call("run", tool.name,
+                          lambda: recorded_run(tool, run))
+
+    async def run_async(self, tool):
+        """Run a tool in a worker process without blocking the loop."""
+        import asyncio  # pylint: disable=import-outside-toplevel
+
+        with timed("run", tool.name):
+            run = start_run(tool)
+            try:
+                key, entry = lookup(tool)
+                if entry is not None:
+                    return finish_run(run, replay(tool, entry),
+                                      replayed=True)
+                pool = self.pool([type(tool).__module__])
+                loop = asyncio.get_running_loop()
+                outcome = await loop.run_in_executor(
+                    pool, _run_in_worker, *self._arguments(tool))
+                result = store(tool, key, self._apply(tool, outcome))
+            except BaseException as e:
+                finish_run(run, error=e)
+                raise
+            return finish_run(run, result)
+
+    def shutdown(self):
+        """Stop the worker processes."""
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+
+
+EXECUTORS = {
+    'thread': ThreadBackend(),
+    'process': ProcessBackend(),
+}
+
+
+def register_executor(name, backend):
+    """
+    Registers an execution backend.
+
+    :param name: Name tools use in their executor attribute
+    :param backend: Object with run(tool, record=True) and async
+        run_async(tool)
+    """
+    EXECUTORS[name] = backend
+
+
+def get_executor(name):
+    """Return the backend registered under a name."""
+    try:
+        return EXECUTORS[name]
+    except KeyError as e:
+        raise ValueError(
+            f"Unknown executor '{name}'. Available executors: "
+            f"{', '.join(sorted(EXECUTORS))}."
+        ) from e
+
+
+def configure(workers=None):
+    """
+    Configures the execution backends.
+
+    :param workers: Number of worker processes for CPU-bound tools
+    """
+    if workers:
+        EXECUTORS['process'].configure(workers)
+
+
+def warm_up(tools):
+    """Start the worker processes, pre-importing the given tools' modules."""
+    modules = [type(tool).__module__ for tool in tools
+               if tool.executor == 'process']
+    if modules:
+        EXECUTORS['process'].pool(modules)
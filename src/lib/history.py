@@ -0,0 +1,511 @@
+"""src/lib/history.py
+A persistent history of tool runs.
+Every run is recorded in the tools database with the tool's name and
+version, a hash of its inputs, its timings, its status and its output.
+Records are queued and written by a background thread, one transaction per
+batch, so recording does not wait on the disk. Outputs are stored as JSON
+lines, one line per record, zlib-compressed unless they are tiny: small
+outputs inline in the runs table, large ones out of line in chunks that are
+read back one at a time.
+"""
+
+import atexit
+import json
+import queue
+import sqlite3
+import threading
+import time
+import zlib
+
+from src.lib.migrations import ensure_schema
+from src.lib.sqlite import Database
+from src.lib.streaming import is_stream
+
+
+DEFAULT_DB_PATH = "dbs/tools.db"
+# Most runs written in one transaction
+DEFAULT_BATCH_SIZE = 256
+# Seconds the writer waits for more runs before writing a batch
+DEFAULT_LINGER = 0.05
+# Seconds between checks that the writer is alive while flushing
+FLUSH_POLL = 0.1
+# Outputs smaller than this many bytes cost more to compress than they save
+COMPRESS_MIN_SIZE = 512
+# Compressed outputs up to this many bytes are stored in the runs table
+INLINE_OUTPUT_SIZE = 4096
+# Compressed bytes per chunk of an output stored out of line
+CHUNK_SIZE = 64 * 1024
+# Uncompressed bytes of output recorded per run, the rest is dropped
+MAX_OUTPUT_SIZE = 64 * 1024 * 1024
+# Columns returned by queries, in order
+COLUMNS = (
+    'id', 'tool', 'version', 'inputs_hash', 'inputs', 'started_at',
+    'wall_seconds', 'cpu_seconds', 'status', 'error', 'streamed', 'records',
+    'output_size', 'truncated',
+)
+
+# Queued by flush() to have the writer write its batch at once
+_FLUSH = object()
+
+
+def inputs_hash(inputs):
+    """Return the hash of a run's inputs, given as canonical JSON."""
+    import hashlib  # pylint: disable=import-outside-toplevel
+
+    return hashlib.sha256(inputs.encode("utf-8")).hexdigest()
+
+
+def _line(record):
+    """Return a record encoded as one JSON line."""
+    return (json.dumps(record, default=str, separators=(',', ':'))
+            + "\n").encode("utf-8")
+
+
+class _Output:
+    """Compresses the records of a streamed run as they pass."""
+
+    def __init__(self, max_size=MAX_OUTPUT_SIZE):
+        self.max_size = max_size
+        self.records = 0
+        self.size = 0
+        self.truncated = False
+        self._compressor = zlib.compressobj()
+        self._parts = []
+
+    def add(self, record):
+        """Compress a record, unless the output is already too large."""
+        if self.truncated:
+            return
+        line = _line(record)
+        if self.size + len(line) > self.max_size:
+            self.truncated = True
+            return
+        self.records += 1
+        self.size += len(line)
+        data = self._compressor.compress(line)
+        if data:
+            self._parts.append(data)
+
+    def finish(self):
+        """Return the compressed output."""
+        self._parts.append(self._compressor.flush())
+        return b"".join(self._parts)
+
+
+class _Run:
+    """A run being recorded."""
+
+    __slots__ = ('tool', 'version', 'inputs', 'started_at', 'start',
+                 'cpu_start')
+
+    def __init__(self, tool):
+        self.tool = tool.name or type(tool).__name__
+        self.version = tool.version
+        self.inputs = json.dumps(tool.input_values, sort_keys=True,
+                                 default=str, separators=(',', ':'))
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.cpu_start = time.thread_time()
+
+    def entry(self, status, error=None, cpu=None, streamed=False):
+        """Return the record of the run as a dictionary."""
+        return {
+            'tool': self.tool,
+            'version': self.version,
+            'inputs': self.inputs,
+            'started_at': self.started_at,
+            'wall_seconds': time.perf_counter() - self.start,
+            'cpu_seconds': time.thread_time() - self.cpu_start
+            if cpu is None else cpu,
+            'status': status,
+            'error': None if error is None
+            else f"{type(error).__name__}: {error}",
+            'streamed': streamed,
+            'records': 0,
+            'output_size': 0,
+            'truncated': False,
+            'raw': None,
+            'output': None,
+        }
+
+
+class RunHistory:
+    """Records tool runs in SQLite through a background writer."""
+
+    def __init__(self, db_path=DEFAULT_DB_PATH,
+                 batch_size=DEFAULT_BATCH_SIZE, linger=DEFAULT_LINGER,
+                 enabled=True):
+        """
+        :param db_path: Path of the SQLite database
+        :param batch_size: Most runs written in one transaction
+        :param linger: Seconds the writer waits for more runs before
+            writing a batch that is not full
+        :param enabled: Whether runs are recorded
+        """
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.linger = linger
+        self.enabled = enabled
+        self.recorded = 0
+        self.written = 0
+        self.batches = 0
+        self.errors = 0
+        self.last_error = None
+        self._queue = queue.Queue()
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._writer = None
+
+    def _database(self):
+        """Return a connected Database with the history tables."""
+        db = Database(self.db_path)
+        db.connect()
+        ensure_schema(db)
+        return db
+
+    def start(self, tool):
+        """
+        Starts recording a run of a tool.
+
+        :return: The run, or None if the history is disabled
+        """
+        if not self.enabled:
+            return None
+        return _Run(tool)
+
+    def finish(self, run, result=None, error=None, replayed=False):
+        """
+        Records the end of a run.
+        A streamed result is recorded once it has been consumed; the stream
+        returned in its place records its records as they pass.
+
+        :param run: Run returned by start(), or None
+        :param result: Result of the run
+        :param error: Exception the run failed with
+        :param replayed: Whether the result was served from the memo cache,
+            such runs are recorded with the status "replay"
+        :return: The result to hand to the caller
+        """
+        if run is None:
+            return result
+        if error is not None:
+            status = "error" if isinstance(error, Exception) \
+                else "incomplete"
+            self._submit(run.entry(status, error))
+            return result
+        if is_stream(result):
+            return self._record_stream(run, result)
+        entry = run.entry("replay" if replayed else "ok")
+        try:
+            entry['raw'] = _line(result)
+        except (TypeError, ValueError):
+            entry['raw'] = _line(repr(result))
+        entry['records'] = 1
+        entry['output_size'] = len(entry['raw'])
+        self._submit(entry)
+        return result
+
+    def _record_stream(self, run, records):
+        """Yield the records of a streamed run, recording them."""
+        output = _Output()
+        status, error, cpu = "incomplete", None, 0.0
+        iterator = iter(records)
+        try:
+            while True:
+                # The stream may be consumed on another thread than the one
+                # that started the run, so only its own work is counted
+                cpu_start = time.thread_time()
+                try:
+                    record = next(iterator)
+                except StopIteration:
+                    break
+                finally:
+                    cpu += time.thread_time() - cpu_start
+                output.add(record)
+                yield record
+            status = "ok"
+        except Exception as e:
+            status, error = "error", e
+            raise
+        finally:
+            entry = run.entry(status, error, cpu, streamed=True)
+            entry['records'] = output.records
+            entry['output_size'] = output.size
+            entry['truncated'] = output.truncated
+            entry['output'] = output.finish()
+            self._submit(entry)
+
+    def _submit(self, entry):
+        """Queue a run for the writer, starting it on first use."""
+        with self._lock:
+            self.recorded += 1
+            self._pending += 1
+            # Also replaces a writer that died, so recording carries on
+            if self._writer is None or not self._writer.is_alive():
+                self._writer = threading.Thread(
+                    target=self._write_loop, name="history-writer",
+                    daemon=True)
+                self._writer.start()
+        self._queue.put(entry)
+
+    def _write_loop(self):
+        """
+        Write queued runs in batches, forever.
+        A batch is written once it is full, once the writer has lingered
+        for more runs long enough, or as soon as a flush is requested.
+        """
+        while True:
+            entries = []
+            entry = self._queue.get()
+            deadline = time.monotonic() + self.linger
+            while entry is not _FLUSH:
+                entries.append(entry)
+                timeout = deadline - time.monotonic()
+                if len(entries) >= self.batch_size or timeout <= 0:
+                    break
+                try:
+                    entry = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+            if not entries:
+                continue
+            try:
+                self._write(entries)
+            except Exception as e:  # pylint: disable=broad-except
+                # A batch that cannot be written is dropped, but the writer
+                # keeps going so later runs are recorded and flushes return
+                import logging  # pylint: disable=import-outside-toplevel
+
+                logging.getLogger(__name__).error(
+                    "Could not record %d run(s) in the history: %s",
+                    len(entries), e)
+                with self._lock:
+                    self.errors += len(entries)
+                    self.last_error = str(e)
+            finally:
+                with self._lock:
+                    self._pending -= len(entries)
+                    self._idle.notify_all()
+
+    def _write(self, entries):
+        """Write runs in one transaction."""
+        rows, large = [], []
+        for entry in entries:
+            output, compressed = entry['output'], True
+            if output is None and entry['raw'] is not None:
+                output = entry['raw']
+                if len(output) < COMPRESS_MIN_SIZE:
+                    compressed = False
+                else:
+                    output = zlib.compress(output)
+            row = (
+                entry['tool'], entry['version'],
+                inputs_hash(entry['inputs']), entry['inputs'],
+                entry['started_at'], entry['wall_seconds'],
+                entry['cpu_seconds'], entry['status'], entry['error'],
+                entry['streamed'], entry['records'], entry['output_size'],
+                entry['truncated'], compressed,
+            )
+            if output is not None and len(output) > INLINE_OUTPUT_SIZE:
+                large.append((row, output))
+            else:
+                rows.append(row + (output, 0))
+        insert = (
+            "INSERT INTO runs (tool, version, inputs_hash, inputs, "
+            "started_at, wall_seconds, cpu_seconds, status, error, streamed, "
+            "records, output_size, truncated, compressed, output, "
+            "output_chunks) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+        )
+        db = self._database()
+        try:
+            if rows:
+                db.execute_many(insert, rows)
+            # Outputs stored out of line need the id of their run
+            for row, output in large:
+                count = -(-len(output) // CHUNK_SIZE)
+                run_id = db.execute_query(
+                    insert + " RETURNING id", row + (None, count))[0][0]
+                db.execute_many(
+                    "INSERT INTO run_outputs (run_id, chunk, data) "
+                    "VALUES (?, ?, ?)",
+                    ((run_id, index,
+                      output[index * CHUNK_SIZE:(index + 1) * CHUNK_SIZE])
+                     for index in range(count))
+                )
+            db.commit()
+        except Exception:
+            try:
+                db.connection.rollback()
+            except sqlite3.Error:
+                pass
+            raise
+        with self._lock:
+            self.written += len(entries)
+            self.batches += 1
+
+    def flush(self, timeout=None):
+        """
+        Waits until every recorded run has been written.
+
+        Gives up if the writer thread is no longer running.
+
+        :param timeout: Seconds to wait at most, forever if None
+        :return: True if nothing is left to write
+        """
+        with self._lock:
+            if self._pending == 0:
+                return True
+            writer = self._writer
+        self._queue.put(_FLUSH)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            while self._pending:
+                if writer is None or not writer.is_alive():
+                    return False
+                wait = FLUSH_POLL
+                if deadline is not None:
+                    wait = min(wait, deadline - time.monotonic())
+                    if wait <= 0:
+                        return False
+                self._idle.wait(wait)
+            return True
+
+    def query(self, tool=None, status=None, inputs=None, since=None,
+              after=None, limit=20):
+        """
+        Returns a page of runs, most recent first.
+        Pages are read with keyset pagination: pass the id of the last run
+        of a page as after to get the next one, so every page costs the
+        same however deep it is.
+
+        :param tool: Only runs of this tool
+        :param status: Only runs with this status
+        :param inputs: Only runs with this inputs hash
+        :param since: Only runs started at or after this epoch time
+        :param after: Id of the last run of the previous page
+        :param limit: Number of runs per page
+        :return: List of dictionaries with the keys in COLUMNS
+        """
+        self.flush()
+        where, params = [], []
+        for column, value in (('tool', tool), ('status', status),
+                              ('inputs_hash', inputs)):
+            if value is not None:
+                where.append(f"{column} = ?")
+                params.append(value)
+        if since is not None:
+            where.append("started_at >= ?")
+            params.append(since)
+        if after is not None:
+            where.append("(started_at, id) < "
+                         "(SELECT started_at, id FROM runs WHERE id = ?)")
+            params.append(after)
+        sql = f"SELECT {', '.join(COLUMNS)} FROM runs"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY started_at DESC, id DESC LIMIT ?"
+        params.append(limit)
+        return [dict(zip(COLUMNS, row))
+                for row in self._database().execute_query(sql, params)]
+
+    def get(self, run_id):
+        """
+        Returns a run.
+
+        :return: Dictionary with the keys in COLUMNS, or None
+        """
+        self.flush()
+        rows = self._database().execute_query(
+            f"SELECT {', '.join(COLUMNS)} FROM runs WHERE id = ?", (run_id,))
+        return dict(zip(COLUMNS, rows[0])) if rows else None
+
+    def iter_output(self, run_id):
+        """
+        Yields the output records of a run.
+        Outputs stored out of line are read and decompressed one chunk at a
+        time, so memory use does not grow with the size of the output.
+
+        :raises KeyError: If there is no such run
+        """
+        self.flush()
+        db = self._database()
+        rows = db.execute_query(
+            "SELECT output, output_chunks, compressed FROM runs WHERE id = ?",
+            (run_id,))
+        if not rows:
+            raise KeyError(run_id)
+        inline, count, compressed = rows[0]
+        decompressor = zlib.decompressobj() if compressed else None
+        pending = b""
+        for data in self._chunks(db, run_id, count) if count \
+                else [inline or b""]:
+            pending += decompressor.decompress(data) if compressed else data
+            lines = pending.split(b"\n")
+            pending = lines.pop()
+            for line in lines:
+                yield json.loads(line)
+        if compressed:
+            pending += decompressor.flush()
+        if pending.strip():
+            yield json.loads(pending)
+
+    @staticmethod
+    def _chunks(db, run_id, count):
+        """Yield the chunks of an output stored out of line."""
+        for index in range(count):
+            yield db.execute_query(
+                "SELECT data FROM run_outputs WHERE run_id = ? AND chunk = ?",
+                (run_id, index)
+            )[0][0]
+
+    def clear(self):
+        """Delete every recorded run."""
+        self.flush()
+        db = self._database()
+        db.execute_query("DELETE FROM run_outputs")
+        db.execute_query("DELETE FROM runs")
+        db.commit()
+
+    def stats(self):
+        """Return the history counters as a dictionary."""
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'recorded': self.recorded,
+                'written': self.written,
+                'pending': self._pending,
+                'batches': self.batches,
+                'errors': self.errors,
+                'last_error': self.last_error,
+            }
+
+
+HISTORY = RunHistory()
+# Runs still queued when the process exits are written out
+atexit.register(HISTORY.flush, 5)
+
+
+def configure(enabled=None, db_path=None):
+    """
+    Configures the process-wide run history.
+
+    :param enabled: Whether runs are recorded
+    :param db_path: Path of the database runs are recorded in
+    """
+    if db_path is not None:
+        HISTORY.flush()
+        HISTORY.db_path = db_path
+    if enabled is not None:
+        HISTORY.enabled = enabled
+
+
+def start_run(tool):
+    """Start recording a run of a tool, see RunHistory.start()."""
+    return HISTORY.start(tool)
+
+
+def finish_run(run, result=None, error=None, replayed=False):
+    """Record the end of a run, see RunHistory.finish()."""
+    return HISTORY.finish(run, result, error, replayed)
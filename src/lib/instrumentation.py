@@ -0,0 +1,344 @@
+"""src/lib/instrumentation.py
+Timing and allocation metrics for the tool lifecycle.
+Each phase of a tool's life (load, configure, credentials, run, render) is
+measured with timed() and aggregated per (phase, tool). Wall time and the
+CPU time of the calling thread are always recorded; allocations are recorded
+while tracemalloc is tracing, see trace_allocations(). A run that streams
+its result is measured with timed_call() until the stream is exhausted,
+counting the time spent producing records on whichever thread consumes
+them. The aggregates can be exported as JSON or in the Prometheus text
+format.
+"""
+
+import contextlib
+import io
+import json
+import threading
+import time
+import tracemalloc
+
+from src.lib.streaming import is_stream
+
+
+# Lifecycle phases, in the order they are reported
+PHASES = ("load", "configure", "credentials", "run", "render")
+
+
+class PhaseStats:
+    """Aggregated measurements of one phase of one tool."""
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.wall_seconds = 0.0
+        self.wall_max_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.alloc_bytes = 0
+        self.alloc_peak_bytes = 0
+
+    def add(self, wall, cpu, allocated, peak, failed):
+        """Add one measurement."""
+        self.calls += 1
+        self.errors += failed
+        self.wall_seconds += wall
+        self.wall_max_seconds = max(self.wall_max_seconds, wall)
+        self.cpu_seconds += cpu
+        self.alloc_bytes += allocated
+        self.alloc_peak_bytes = max(self.alloc_peak_bytes, peak)
+
+    def as_dict(self):
+        """Return the measurements as a dictionary."""
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'wall_seconds': round(self.wall_seconds, 6),
+            'wall_max_seconds': round(self.wall_max_seconds, 6),
+            'cpu_seconds': round(self.cpu_seconds, 6),
+            'alloc_bytes': self.alloc_bytes,
+            'alloc_peak_bytes': self.alloc_peak_bytes,
+        }
+
+
+class Instrumentation:
+    """Collects PhaseStats keyed by (phase, tool)."""
+
+    def __init__(self):
+        self.enabled = True
+        self.stats = {}
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def timed(self, phase, tool_name):
+        """
+        Measures the block of a with statement as a phase of a tool.
+
+        :param phase: One of PHASES
+        :param tool_name: Name of the tool the phase belongs to
+        """
+        if not self.enabled:
+            yield
+            return
+        measurement = _Measurement()
+        failed = False
+        try:
+            yield
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            self.record(phase, tool_name, *measurement.stop(), failed)
+
+    def timed_call(self, phase, tool_name, func):
+        """
+        Calls a function and measures the call as a phase of a tool.
+        If it returns a stream, the stream returned in its place adds the
+        time spent producing each record, and the phase is recorded once
+        the stream ends. Allocations are only measured for the call itself.
+
+        :param phase: One of PHASES
+        :param tool_name: Name of the tool the phase belongs to
+        :param func: Callable to call
+        :return: The function's result
+        """
+        if not self.enabled:
+            return func()
+        measurement = _Measurement()
+        try:
+            result = func()
+        except BaseException:
+            self.record(phase, tool_name, *measurement.stop(), True)
+            raise
+        wall, cpu, allocated, peak = measurement.stop()
+        if not is_stream(result):
+            self.record(phase, tool_name, wall, cpu, allocated, peak)
+            return result
+        return self._timed_stream(
+            phase, tool_name, result, wall, cpu, allocated, peak)
+
+    def _timed_stream(self, phase, tool_name, records, wall, cpu,
+                      allocated, peak):
+        """Yield the records of a stream, adding the time producing them."""
+        failed = False
+        iterator = iter(records)
+        try:
+            while True:
+                cpu_start = time.thread_time()
+                start = time.perf_counter()
+                try:
+                    record = next(iterator)
+                except StopIteration:
+                    break
+                finally:
+                    wall += time.perf_counter() - start
+                    cpu += time.thread_time() - cpu_start
+                yield record
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self.record(phase, tool_name, wall, cpu, allocated, peak, failed)
+
+    @contextlib.contextmanager
+    def timed_each(self, phase, tool_names):
+        """
+        Measures the block of a with statement as a phase shared by several
+        tools, such as one query loading all their configurations. Each tool
+        is recorded under its own name with an equal share of the block.
+
+        :param phase: One of PHASES
+        :param tool_names: Names of the tools the phase belongs to
+        """
+        tool_names = list(tool_names)
+        if not self.enabled or not tool_names:
+            yield
+            return
+        failed = False
+        cpu_start = time.thread_time()
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            share = len(tool_names)
+            wall = (time.perf_counter() - start) / share
+            cpu = (time.thread_time() - cpu_start) / share
+            for tool_name in tool_names:
+                self.record(phase, tool_name, wall, cpu, failed=failed)
+
+    def record(self, phase, tool_name, wall, cpu, allocated=0, peak=0,
+               failed=False):
+        """Add a measurement taken elsewhere."""
+        with self._lock:
+            stats = self.stats.get((phase, tool_name))
+            if stats is None:
+                stats = self.stats[(phase, tool_name)] = PhaseStats()
+            stats.add(wall, cpu, allocated, peak, failed)
+
+    def reset(self):
+        """Drop every measurement."""
+        with self._lock:
+            self.stats = {}
+
+    def snapshot(self):
+        """
+        Return the measurements as a list of dictionaries, ordered by phase
+        and tool.
+        """
+        with self._lock:
+            items = list(self.stats.items())
+        order = {phase: index for index, phase in enumerate(PHASES)}
+        items.sort(key=lambda item: (
+            order.get(item[0][0], len(PHASES)), item[0][0], item[0][1]))
+        return [
+            dict({'phase': phase, 'tool': tool_name}, **stats.as_dict())
+            for (phase, tool_name), stats in items
+        ]
+
+    def to_json(self):
+        """Return the measurements as a JSON document."""
+        return json.dumps(self.snapshot(), separators=(',', ':'))
+
+    def to_prometheus(self):
+        """Return the measurements in the Prometheus text format."""
+        metrics = (
+            ('calls', 'counter', "Number of times the phase ran."),
+            ('errors', 'counter', "Number of times the phase failed."),
+            ('wall_seconds', 'counter', "Wall time spent in the phase."),
+            ('wall_max_seconds', 'gauge', "Longest wall time of the phase."),
+            ('cpu_seconds', 'counter', "CPU time spent in the phase."),
+            ('alloc_bytes', 'counter',
+             "Bytes allocated and still held after the phase."),
+            ('alloc_peak_bytes', 'gauge',
+             "Most traced memory grew by during the phase."),
+        )
+        rows = self.snapshot()
+        out = io.StringIO()
+        for field, kind, help_text in metrics:
+            name = f"sak_phase_{field}"
+            if kind == 'counter':
+                name += "_total"
+            out.write(f"# HELP {name} {help_text}\n")
+            out.write(f"# TYPE {name} {kind}\n")
+            for row in rows:
+                out.write(
+                    f'{name}{{phase="{_label(row["phase"])}",'
+                    f'tool="{_label(row["tool"])}"}} {row[field]}\n')
+        return out.getvalue()
+
+
+def _label(value):
+    """Escape a Prometheus label value."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"') \
+        .replace("\n", "\\n")
+
+
+class _Measurement:
+    """The wall time, CPU time and traced allocations of a phase so far."""
+
+    __slots__ = ('tracing', 'allocated_before', 'cpu_start', 'start')
+
+    def __init__(self):
+        self.tracing = tracemalloc.is_tracing()
+        self.allocated_before = 0
+        if self.tracing:
+            # The peak is process-wide: start it over so it is that of
+            # this phase
+            tracemalloc.reset_peak()
+            self.allocated_before = tracemalloc.get_traced_memory()[0]
+        self.cpu_start = time.thread_time()
+        self.start = time.perf_counter()
+
+    def stop(self):
+        """
+        Return the measurements since the phase started.
+
+        :return: Tuple (wall, cpu, allocated, peak); allocated is the growth
+            of traced memory and peak the most it grew by at any point
+        """
+        wall = time.perf_counter() - self.start
+        cpu = time.thread_time() - self.cpu_start
+        allocated = peak = 0
+        if self.tracing and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            allocated = max(current - self.allocated_before, 0)
+            peak = max(peak - self.allocated_before, 0)
+        return wall, cpu, allocated, peak
+
+
+INSTRUMENTATION = Instrumentation()
+
+
+def timed(phase, tool_name):
+    """Measure a phase of a tool with the process-wide Instrumentation."""
+    return INSTRUMENTATION.timed(phase, tool_name)
+
+
+def timed_call(phase, tool_name, func):
+    """Call a function, measuring it, and any stream it returns, as a phase
+    of a tool with the process-wide Instrumentation."""
+    return INSTRUMENTATION.timed_call(phase, tool_name, func)
+
+
+def timed_each(phase, tool_names):
+    """Measure a phase shared by several tools, a share to each of them."""
+    return INSTRUMENTATION.timed_each(phase, tool_names)
+
+
+def trace_allocations(enabled=True, frames=1):
+    """
+    Starts or stops tracing allocations with tracemalloc.
+    Tracing slows down every allocation, so it is off by default.
+
+    :param enabled: Whether to trace
+    :param frames: Number of frames stored per traced allocation
+    """
+    if enabled and not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+    elif not enabled and tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def profile_sort_keys():
+    """Return the sort keys accepted by profile()."""
+    import pstats  # pylint: disable=import-outside-toplevel
+
+    return sorted(pstats.Stats.sort_arg_dict_default)
+
+
+def profile(func, sort="cumulative", limit=20):
+    """
+    Calls a function under cProfile, tracing its allocations.
+
+    :param func: Callable to profile
+    :param sort: pstats sort key
+    :param limit: Number of functions and allocation sites to report
+    :return: Tuple (result, report text, profiler)
+    """
+    # pylint: disable=import-outside-toplevel
+    import cProfile
+    import pstats
+
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    before = tracemalloc.take_snapshot()
+    profiler = cProfile.Profile()
+    start = time.perf_counter()
+    try:
+        result = profiler.runcall(func)
+    finally:
+        wall = time.perf_counter() - start
+        after = tracemalloc.take_snapshot()
+        peak = tracemalloc.get_traced_memory()[1]
+        if not tracing:
+            tracemalloc.stop()
+    out = io.StringIO()
+    out.write(f"Wall time: {wall:.6f}s, peak traced memory: {peak} bytes\n")
+    pstats.Stats(profiler, stream=out).sort_stats(sort).print_stats(limit)
+    out.write("Top allocation sites:\n")
+    for stat in after.compare_to(before, 'lineno')[:limit]:
+        out.write(f"  {stat}\n")
+    return result, out.getvalue(), profiler
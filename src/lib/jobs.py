@@ -0,0 +1,211 @@
+"""src/lib/jobs.py
+Background execution of tools.
+Jobs run on a single asyncio event loop owned by a background thread, so
+they can be started from synchronous code such as the shell, a script or the
+interactive prompt, and several tools can run concurrently on the loop.
+A streamed result is consumed by the job itself, in a worker thread, so the
+tool does its work while the job runs rather than when its result is
+collected. The job keeps only the summary of the stream and its last
+records, and is running until the stream is exhausted.
+"""
+
+import itertools
+import threading
+import time
+
+from src.lib.streaming import drain, is_stream
+
+
+class _Stopped(Exception):
+    """Raised into a stream being drained by a cancelled job."""
+
+
+class Job:
+    """A tool run in the background."""
+
+    def __init__(self, job_id, tool_name):
+        self.id = job_id
+        self.tool_name = tool_name
+        self.future = None
+        # Whether the tool streamed its result, the job's result is then
+        # the summary returned by drain()
+        self.streamed = False
+        self.started = time.perf_counter()
+        self.finished = None
+
+    def start(self, future):
+        """Attach the future of the job's run."""
+        self.future = future
+        future.add_done_callback(self._on_done)
+
+    def _on_done(self, _):
+        self.finished = time.perf_counter()
+
+    @property
+    def status(self):
+        """Return "running", "done", "failed" or "cancelled"."""
+        if not self.future.done():
+            return "running"
+        if self.future.cancelled():
+            return "cancelled"
+        if self.future.exception() is not None:
+            return "failed"
+        return "done"
+
+    @property
+    def elapsed(self):
+        """Return the seconds the job has been, or was, running."""
+        return (self.finished or time.perf_counter()) - self.started
+
+    def result(self, timeout=None):
+        """Wait for the job and return the tool's result."""
+        return self.future.result(timeout)
+
+
+class JobManager:
+    """Runs tools as jobs on a background event loop."""
+
+    def __init__(self):
+        self.jobs = {}
+        self.loop = None
+        self._thread = None
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def _ensure_loop(self):
+        """Start the event loop thread on first use."""
+        # asyncio is imported with the loop, batch runs of single tools
+        # never need it
+        import asyncio  # pylint: disable=import-outside-toplevel
+
+        with self._lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(
+                    target=self.loop.run_forever,
+                    name="sak-jobs",
+                    daemon=True,
+                )
+                self._thread.start()
+        return self.loop
+
+    @staticmethod
+    async def _run(job, tool_instance, on_record=None, spool=None):
+        """
+        Runs a tool and, if it streams its result, drains the stream in a
+        worker thread.
+
+        :return: The tool's result, or the summary of a streamed result
+        """
+        import asyncio  # pylint: disable=import-outside-toplevel
+
+        result = await tool_instance.run_async()
+        if not is_stream(result):
+            return result
+        job.streamed = True
+        stop = threading.Event()
+
+        def consume(record):
+            if stop.is_set():
+                raise _Stopped()
+            if on_record is not None:
+                on_record(record)
+
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(None, lambda: drain(
+                tool_instance, result, on_record=consume, spool=spool,
+                tail_size=tool_instance.output_tail_size))
+        except asyncio.CancelledError:
+            # Stops the worker thread at the next record
+            stop.set()
+            raise
+
+    def _start(self, tool_name, tool_instance, on_record=None, spool=None):
+        """Start a tool on the event loop and return its Job."""
+        import asyncio  # pylint: disable=import-outside-toplevel
+
+        loop = self._ensure_loop()
+        job = Job(next(self._ids), tool_name)
+        job.start(asyncio.run_coroutine_threadsafe(
+            self._run(job, tool_instance, on_record, spool), loop))
+        return job
+
+    def submit(self, tool_name, tool_instance, on_done=None, spool=None):
+        """
+        Starts a tool in the background.
+
+        :param tool_name: Name the tool was loaded as
+        :param tool_instance: Tool to run
+        :param on_done: Optional callable receiving the finished Job
+        :param spool: Optional file to append streamed records to
+        :return: The new Job
+        """
+        job = self._start(tool_name, tool_instance, spool=spool)
+        self.jobs[job.id] = job
+        if on_done is not None:
+            job.future.add_done_callback(lambda _: on_done(job))
+        return job
+
+    def run_concurrently(self, tools, on_record=None):
+        """
+        Runs several tools concurrently and waits for all of them.
+        Streamed results are drained concurrently as well, each in its own
+        worker thread.
+
+        :param tools: Dictionary of tool name -> Tool instance
+        :param on_record: Optional callable receiving each streamed record,
+            called from the worker threads
+        :return: Dictionary of tool name -> finished Job
+        """
+        import concurrent.futures  # pylint: disable=import-outside-toplevel
+
+        jobs = {
+            tool_name: self._start(tool_name, tool_instance, on_record)
+            for tool_name, tool_instance in tools.items()
+        }
+        concurrent.futures.wait([job.future for job in jobs.values()])
+        return jobs
+
+    def running(self, tool_name=None):
+        """Return the jobs still running, optionally for one tool only."""
+        return [
+            job for job in self.jobs.values()
+            if job.status == "running"
+            and (tool_name is None or job.tool_name == tool_name)
+        ]
+
+    def wait(self, job_ids=None, timeout=None):
+        """
+        Waits for jobs to finish.
+
+        :param job_ids: Jobs to wait for, all jobs if None
+        :param timeout: Seconds to wait at most
+        :return: List of the jobs waited for
+        """
+        import concurrent.futures  # pylint: disable=import-outside-toplevel
+
+        if job_ids is None:
+            jobs = list(self.jobs.values())
+        else:
+            jobs = [self.jobs[job_id] for job_id in job_ids]
+        concurrent.futures.wait(
+            [job.future for job in jobs], timeout=timeout)
+        return jobs
+
+    def forget(self, job_ids):
+        """Drop finished jobs from the job table."""
+        for job_id in job_ids:
+            job = self.jobs.get(job_id)
+            if job is not None and job.status != "running":
+                del self.jobs[job_id]
+
+    def shutdown(self):
+        """Cancel running jobs and stop the event loop."""
+        for job in self.running():
+            job.future.cancel()
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join(timeout=5)
+            self.loop = None
+            self._thread = None
@@ -0,0 +1,210 @@
+"""src/lib/memo.py
+Memoization of tool results.
+A tool opts in by setting deterministic, or by overriding cache_key to
+return a key for its current inputs. Results are kept in an in-memory LRU
+tier in front of a persistent tier in the tools database. Keys include the
+tool's version, so upgrading a tool invalidates its old results.
+"""
+
+import collections
+import json
+import threading
+import time
+
+from src.lib.cache import register_cache
+from src.lib.migrations import ensure_schema
+from src.lib.sqlite import Database
+from src.lib.streaming import is_stream
+
+
+DEFAULT_DB_PATH = "dbs/tools.db"
+
+
+def tool_id(tool):
+    """Return the name results of a tool are stored under."""
+    return f"{type(tool).__module__}.{type(tool).__qualname__}"
+
+
+def memo_key(tool):
+    """
+    Return the memo key of a tool's next run.
+
+    :return: Tuple (tool id, digest), or None if the run is not memoized
+    """
+    key = tool.cache_key()
+    if key is None:
+        return None
+    import hashlib  # pylint: disable=import-outside-toplevel
+
+    digest = hashlib.sha256(
+        json.dumps([tool.version, key], sort_keys=True, default=str)
+        .encode("utf-8")
+    ).hexdigest()
+    return tool_id(tool), digest
+
+
+class MemoCache:
+    """A two-tier store of tool results: an LRU in memory over SQLite."""
+
+    def __init__(self, db_path=DEFAULT_DB_PATH, memory_entries=1024,
+                 max_entries=10000):
+        """
+        :param db_path: Path of the SQLite database
+        :param memory_entries: Number of results kept in memory
+        :param max_entries: Number of results kept in the database before
+            the least recently used are evicted
+        """
+        self.db_path = db_path
+        self.memory_entries = memory_entries
+        self.max_entries = max_entries
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._memory = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def _database(self):
+        """Return a connected Database with the memo table."""
+        db = Database(self.db_path)
+        db.connect()
+        ensure_schema(db)
+        return db
+
+    def _remember(self, key, entry):
+        """Put an entry in the memory tier, dropping the oldest if full."""
+        with self._lock:
+            self._memory[key] = entry
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def get(self, key):
+        """
+        Looks up a result.
+
+        :param key: Key returned by memo_key()
+        :return: Tuple (result, output_values), or None if not stored
+        """
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return entry
+        db = self._database()
+        rows = db.execute_query(
+            "SELECT value FROM memo WHERE tool = ? AND key = ?", key)
+        if not rows:
+            with self._lock:
+                self.misses += 1
+            return None
+        db.execute_query(
+            "UPDATE memo SET accessed_at = ? WHERE tool = ? AND key = ?",
+            (time.time(),) + key
+        )
+        db.commit()
+        value = json.loads(rows[0][0])
+        entry = (value['result'], value['output_values'])
+        self._remember(key, entry)
+        with self._lock:
+            self.disk_hits += 1
+        return entry
+
+    def put(self, key, version, result, output_values):
+        """
+        Stores a result in both tiers.
+        Results that cannot be stored as JSON are only kept in memory.
+        """
+        entry = (result, dict(output_values))
+        self._remember(key, entry)
+        try:
+            value = json.dumps(
+                {'result': result, 'output_values': entry[1]},
+                separators=(',', ':'))
+        except (TypeError, ValueError):
+            return
+        now = time.time()
+        db = self._database()
+        db.execute_query(
+            "INSERT OR REPLACE INTO memo "
+            "(tool, key, version, value, stored_at, accessed_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            key + (version, value, now, now)
+        )
+        db.commit()
+        self._evict(db)
+
+    def _evict(self, db):
+        """Delete the least recently used results above max_entries."""
+        excess = db.execute_query("SELECT COUNT(*) FROM memo")[0][0] \
+            - self.max_entries
+        if excess <= 0:
+            return
+        removed = db.execute_update(
+            "DELETE FROM memo WHERE rowid IN ("
+            "SELECT rowid FROM memo ORDER BY accessed_at LIMIT ?)",
+            (excess,)
+        )
+        db.commit()
+        with self._lock:
+            self.evictions += removed
+
+    def clear(self):
+        """Delete every stored result."""
+        with self._lock:
+            self._memory.clear()
+        db = self._database()
+        db.execute_query("DELETE FROM memo")
+        db.commit()
+
+    def stats(self):
+        """Return the cache counters as a dictionary."""
+        entries = self._database().execute_query(
+            "SELECT COUNT(*) FROM memo")[0][0]
+        with self._lock:
+            return {
+                'entries': entries,
+                'memory_entries': len(self._memory),
+                'max_entries': self.max_entries,
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+MEMO = MemoCache()
+register_cache('memo', MEMO)
+
+
+def lookup(tool):
+    """
+    Looks up the memoized result of a tool's next run.
+
+    :return: Tuple (key, entry); key is None if the tool is not memoized
+        and entry is None on a miss
+    """
+    key = memo_key(tool)
+    if key is None:
+        return None, None
+    return key, MEMO.get(key)
+
+
+def replay(tool, entry):
+    """Restore a memoized run onto a tool and return its result."""
+    result, output_values = entry
+    tool.output_values = dict(output_values)
+    return result
+
+
+def store(tool, key, result):
+    """
+    Memoizes a tool's run under a key returned by lookup().
+    Streamed results are consumed by their caller and are not memoized.
+
+    :return: The result
+    """
+    if key is not None and not is_stream(result):
+        MEMO.put(key, tool.version, result, tool.output_values)
+    return result
@@ -0,0 +1,185 @@
+"""src/lib/migrations.py
+Schema migrations for the tools database.
+Each migration runs once per database file; the number of the last applied
+migration is kept in SQLite's user_version pragma.
+"""
+
+import os
+import threading
+
+
+_migrated = set()
+_migrated_lock = threading.Lock()
+
+
+def _columns(db, table_name):
+    """Return the column names of a table, empty if it does not exist."""
+    return [row[1] for row in
+            db.execute_query(f"PRAGMA table_info('{table_name}')")]
+
+
+def create_configurations(db):
+    """
+    Create the configurations table with a composite primary key.
+    Rows of the original table, whose "tool-name" column cannot be used
+    unquoted in SQL, are carried over.
+    """
+    legacy = 'tool-name' in _columns(db, 'configurations')
+    if legacy:
+        db.execute_query(
+            "ALTER TABLE configurations RENAME TO configurations_legacy")
+    # The table is clustered on its primary key, which doubles as the
+    # index for loading every parameter of one or more tools.
+    db.execute_query(
+        "CREATE TABLE IF NOT EXISTS configurations ("
+        "tool_name TEXT NOT NULL, parameter TEXT NOT NULL, value TEXT, "
+        "PRIMARY KEY (tool_name, parameter)) WITHOUT ROWID"
+    )
+    if legacy:
+        db.execute_query(
+            "INSERT OR REPLACE INTO configurations "
+            "(tool_name, parameter, value) "
+            "SELECT \"tool-name\", parameter, value "
+            "FROM configurations_legacy "
+            "WHERE \"tool-name\" IS NOT NULL AND parameter IS NOT NULL"
+        )
+        db.execute_query("DROP TABLE configurations_legacy")
+
+
+def create_memo(db):
+    """Create the table holding memoized tool results."""
+    db.execute_query(
+        "CREATE TABLE IF NOT EXISTS memo ("
+        "tool TEXT NOT NULL, key TEXT NOT NULL, version TEXT, "
+        "value TEXT NOT NULL, stored_at REAL NOT NULL, "
+        "accessed_at REAL NOT NULL, PRIMARY KEY (tool, key))"
+    )
+    db.execute_query(
+        "CREATE INDEX IF NOT EXISTS memo_lru ON memo (accessed_at)")
+
+
+def create_history(db):
+    """
+    Create the tables holding the run history.
+    Outputs too large to keep in the runs table are split into chunks in
+    run_outputs, so scanning runs does not read them.
+    """
+    db.execute_query(
+        "CREATE TABLE IF NOT EXISTS runs ("
+        "id INTEGER PRIMARY KEY, tool TEXT NOT NULL, version TEXT, "
+        "inputs_hash TEXT NOT NULL, inputs TEXT NOT NULL, "
+        "started_at REAL NOT NULL, wall_seconds REAL NOT NULL, "
+        "cpu_seconds REAL, status TEXT NOT NULL, error TEXT, "
+        "streamed INTEGER NOT NULL, records INTEGER NOT NULL, "
+        "output_size INTEGER NOT NULL, truncated INTEGER NOT NULL, "
+        "output BLOB, output_chunks INTEGER NOT NULL, "
+        "compressed INTEGER NOT NULL)"
+    )
+    # Every index ends in started_at, and implicitly id, so filtered pages
+    # are read in order straight from the index
+    db.execute_query(
+        "CREATE INDEX IF NOT EXISTS runs_time ON runs (started_at)")
+    db.execute_query(
+        "CREATE INDEX IF NOT EXISTS runs_tool_time ON runs (tool, started_at)")
+    db.execute_query(
+        "CREATE INDEX IF NOT EXISTS runs_inputs_time "
+        "ON runs (inputs_hash, started_at)")
+    db.execute_query(
+        "CREATE TABLE IF NOT EXISTS run_outputs ("
+        "run_id INTEGER NOT NULL, chunk INTEGER NOT NULL, "
+        "data BLOB NOT NULL, PRIMARY KEY (run_id, chunk))"
+    )
+
+
+def create_pulse_index(db):
+    """
+    Create the tables of the offline index of threat intelligence pulses.
+    Indicators are clustered on (indicator, pulse_id), so matching an
+    indicator reads only its own rows.
+    """
+    db.execute_query(
+        "CREATE TABLE IF NOT EXISTS pulses ("
+        "id TEXT PRIMARY KEY, name TEXT, author TEXT, modified TEXT, "
+        "tlp TEXT, tags TEXT, indicators INTEGER NOT NULL)"
+    )
+    db.execute_query(
+        "CREATE TABLE IF NOT EXISTS pulse_indicators ("
+        "indicator TEXT NOT NULL, type TEXT, pulse_id TEXT NOT NULL, "
+        "PRIMARY KEY (indicator, pulse_id)) WITHOUT ROWID"
+    )
+    # Replacing a modified pulse deletes its indicators by pulse
+    db.execute_query(
+        "CREATE INDEX IF NOT EXISTS pulse_indicators_pulse "
+        "ON pulse_indicators (pulse_id)")
+    db.execute_query(
+        "CREATE TABLE IF NOT EXISTS pulse_sync ("
+        "source TEXT PRIMARY KEY, cursor TEXT, synced_at REAL NOT NULL)"
+    )
+
+
+def create_response_cache(db):
+    """
+    Create the table of the cache of remote API responses.
+    Entries are evicted least recently used first, per cache.
+    """
+    db.execute_query(
+        "CREATE TABLE IF NOT EXISTS response_cache ("
+        "cache TEXT NOT NULL, kind TEXT NOT NULL, "
+        "key TEXT NOT NULL, section TEXT NOT NULL, "
+        "value TEXT NOT NULL, stored_at REAL NOT NULL, "
+        "accessed_at REAL NOT NULL, "
+        "PRIMARY KEY (cache, kind, key, section))"
+    )
+    db.execute_query(
+        "CREATE INDEX IF NOT EXISTS response_cache_lru "
+        "ON response_cache (cache, accessed_at)"
+    )
+
+
+# (number, migration) in the order they are applied
+MIGRATIONS = [
+    (1, create_configurations),
+    (2, create_memo),
+    (3, create_history),
+    (4, create_pulse_index),
+    (5, create_response_cache),
+]
+
+
+def migrate(db):
+    """
+    Apply the migrations a database has not seen yet.
+
+    :param db: Connected Database
+    :return: Schema version of the database after migrating
+    """
+    version = db.execute_query("PRAGMA user_version")[0][0]
+    for number, migration in MIGRATIONS:
+        if number <= version:
+            continue
+        try:
+            if not db.connection.in_transaction:
+                db.execute_query("BEGIN")
+            migration(db)
+            db.execute_query(f"PRAGMA user_version = {number}")
+            db.commit()
+        except Exception:
+            db.connection.rollback()
+            raise
+        version = number
+    return version
+
+
+def ensure_schema(db):
+    """
+    Migrate a database the first time it is used in this process.
+
+    :param db: Connected Database
+    """
+    key = os.path.abspath(db.db_path)
+    if key in _migrated:
+        return
+    with _migrated_lock:
+        if key not in _migrated:
+            migrate(db)
+            _migrated.add(key)
@@ -0,0 +1,301 @@
+"""src/lib/pipeline.py
+Chaining of tools into streaming pipelines.
+A pipeline is a linear chain: the outputs of each stage are wired to the
+inputs of the next one by name, or by an explicit mapping. A stage has one
+upstream and one downstream stage, so outputs cannot fan out to several
+stages or several stages fan in to one. Every stage runs in its own thread
+and passes its outputs downstream through a bounded queue as Python
+objects, so values are handed on by reference without being re-serialized.
+Stages run copies of their tools, so running a pipeline leaves the inputs
+and outputs of the tools it was built from as they were. The runs of a
+stage, one per upstream item, are neither recorded in the run history nor
+looked up in the memo cache.
+"""
+
+import queue
+import threading
+import time
+
+from src.lib.executors import get_executor
+from src.lib.streaming import is_stream
+
+
+# Number of items a stage may run ahead of the next one
+DEFAULT_QUEUE_SIZE = 100
+
+_END = object()
+
+
+class PipelineError(Exception):
+    """Raised when a pipeline cannot be wired or a stage fails."""
+
+
+class _Failure:
+    """An exception raised by a stage, reported by the pipeline."""
+
+    def __init__(self, stage, error):
+        self.stage = stage
+        self.error = error
+
+
+class Stage:
+    """A tool in a pipeline together with its input wiring and metrics."""
+
+    def __init__(self, name, tool, mapping=None):
+        """
+        :param name: Name of the stage, usually the tool's loaded name
+        :param tool: Tool instance the stage runs a copy of
+        :param mapping: Dictionary of input name -> upstream output name,
+            added to the inputs wired by matching names
+        """
+        self.name = name
+        self.source = tool
+        # Fed and run by the stage in place of the given tool
+        self.tool = tool.clone()
+        # Inputs set before the pipeline ran, kept for items that do not
+        # carry a mapped output
+        self.defaults = dict(self.tool.input_values)
+        self.mapping = dict(mapping or {})
+        self.reset()
+
+    def reset(self):
+        """Reset the stage's metrics."""
+        self.items_in = 0
+        self.items_out = 0
+        self.runs = 0
+        self.busy = 0.0
+        self.max_queue_depth = 0
+
+    def wire(self, upstream):
+        """
+        Completes the mapping from upstream outputs to this stage's inputs.
+
+        :param upstream: Stage feeding this one
+        :raises PipelineError: If a mapping is invalid or nothing connects
+        """
+        inputs = self.tool.spec.inputs
+        outputs = upstream.tool.spec.output_names
+        for input_name, output_name in self.mapping.items():
+            if input_name not in inputs:
+                raise PipelineError(
+                    f"Stage '{self.name}' has no input '{input_name}'.")
+            if output_name not in outputs:
+                raise PipelineError(
+                    f"Stage '{upstream.name}' has no output "
+                    f"'{output_name}'.")
+        for name in inputs & outputs:
+            self.mapping.setdefault(name, name)
+        if not self.mapping:
+            raise PipelineError(
+                f"No outputs of '{upstream.name}' match inputs of "
+                f"'{self.name}'. Map them with <input>=<output>."
+            )
+
+    def feed(self, item):
+        """
+        Set this stage's inputs from an upstream item.
+        A mapped input whose output the item lacks goes back to the value
+        it had before the pipeline ran, or is unset, rather than keeping
+        the value of the previous item.
+        """
+        for input_name, output_name in self.mapping.items():
+            if output_name in item:
+                self.tool.set_input_value(input_name, item[output_name])
+            elif input_name in self.defaults:
+                self.tool.input_values[input_name] = \
+                    self.defaults[input_name]
+            else:
+                self.tool.input_values.pop(input_name, None)
+
+    def process(self):
+        """
+        Runs the stage's tool once.
+
+        :return: Iterable of items, each a dictionary of output values
+        """
+        start = time.perf_counter()
+        result = get_executor(self.tool.executor).run(
+            self.tool, record=False)
+        self.runs += 1
+        if not is_stream(result):
+            self.busy += time.perf_counter() - start
+            # A shallow copy: the next run replaces the values in
+            # output_values, the values themselves are passed on as is.
+            return [dict(self.tool.output_values)]
+        return self._timed(result, start)
+
+    def _timed(self, records, start):
+        """Yield streamed records, counting production time as busy."""
+        iterator = iter(records)
+        while True:
+            try:
+                record = next(iterator)
+            except StopIteration:
+                self.busy += time.perf_counter() - start
+                return
+            self.busy += time.perf_counter() - start
+            if not isinstance(record, dict):
+                record = {self.tool.outputs[0]: record} \
+                    if self.tool.outputs else {'record': record}
+            yield record
+            start = time.perf_counter()
+
+    def metrics(self):
+        """Return the stage's counters as a dictionary."""
+        return {
+            'stage': self.name,
+            'items_in': self.items_in,
+            'items_out': self.items_out,
+            'runs': self.runs,
+            'busy_seconds': round(self.busy, 6),
+            'max_queue_depth': self.max_queue_depth,
+        }
+
+
+class Pipeline:
+    """A linear chain of stages run concurrently as a stream."""
+
+    def __init__(self, stages, queue_size=DEFAULT_QUEUE_SIZE):
+        """
+        :param stages: List of Stage objects, in order
+        :param queue_size: Bound of the queue between consecutive stages
+        :raises PipelineError: If the stages cannot be wired together
+        """
+        if not stages:
+            raise PipelineError("A pipeline needs at least one stage.")
+        tools = set()
+        for stage in stages:
+            if id(stage.source) in tools:
+                raise PipelineError(
+                    f"Tool '{stage.name}' appears in more than one stage.")
+            tools.add(id(stage.source))
+        for upstream, stage in zip(stages, stages[1:]):
+            stage.wire(upstream)
+        self.stages = stages
+        self.queue_size = queue_size
+        self.elapsed = 0.0
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._failure = None
+
+    def _put(self, target, stage, item):
+        """
+        Put an item on a stage's input queue, tracking its depth.
+
+        :raises PipelineError: If the pipeline was stopped while waiting
+        """
+        while True:
+            if self._stop.is_set():
+                raise PipelineError("Pipeline stopped.")
+            try:
+                target.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        depth = target.qsize()
+        if item is not _END and depth > stage.max_queue_depth:
+            stage.max_queue_depth = depth
+
+    def _get(self, source):
+        """
+        Take the next item from a queue.
+
+        :return: The item, or _END once the pipeline was stopped
+        """
+        while not self._stop.is_set():
+            try:
+                return source.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _END
+
+    def _fail(self, stage, error):
+        """Record the first stage failure and stop every stage."""
+        with self._lock:
+            if self._failure is None:
+                self._failure = _Failure(stage.name, error)
+        self._stop.set()
+
+    def _run_source(self, stage, out_queue, next_stage):
+        """Run the first stage once and send its items downstream."""
+        try:
+            for item in stage.process():
+                stage.items_out += 1
+                self._put(out_queue, next_stage, item)
+            self._put(out_queue, next_stage, _END)
+        except Exception as e:  # pylint: disable=broad-except
+            self._fail(stage, e)
+
+    def _run_stage(self, stage, in_queue, out_queue, next_stage):
+        """Run a stage once for every item arriving from upstream."""
+        try:
+            while True:
+                item = self._get(in_queue)
+                if item is _END:
+                    self._put(out_queue, next_stage, _END)
+                    return
+                stage.items_in += 1
+                stage.feed(item)
+                for result in stage.process():
+                    stage.items_out += 1
+                    self._put(out_queue, next_stage, result)
+        except Exception as e:  # pylint: disable=broad-except
+            self._fail(stage, e)
+
+    def run(self):
+        """
+        Runs the pipeline.
+
+        :return: Generator of the items produced by the last stage
+        :raises PipelineError: If a stage fails
+        """
+        start = time.perf_counter()
+        self._stop.clear()
+        self._failure = None
+        for stage in self.stages:
+            stage.reset()
+        sink = _Sink()
+        queues = [queue.Queue(maxsize=self.queue_size)
+                  for _ in self.stages]
+        consumers = self.stages[1:] + [sink]
+        threads = [threading.Thread(
+            target=self._run_source,
+            args=(self.stages[0], queues[0], consumers[0]),
+            daemon=True,
+        )]
+        for index, stage in enumerate(self.stages[1:], start=1):
+            threads.append(threading.Thread(
+                target=self._run_stage,
+                args=(stage, queues[index - 1], queues[index],
+                      consumers[index]),
+                daemon=True,
+            ))
+        for thread in threads:
+            thread.start()
+        try:
+            while True:
+                item = self._get(queues[-1])
+                if item is _END:
+                    break
+                yield item
+            failure = self._failure
+            if failure is not None:
+                raise PipelineError(
+                    f"Stage '{failure.stage}' failed: {failure.error}"
+                ) from failure.error
+        finally:
+            # Stops the stages if the consumer gave up early
+            self._stop.set()
+            for thread in threads:
+                thread.join()
+            self.elapsed = time.perf_counter() - start
+
+    def metrics(self):
+        """Return the metrics of every stage, in order."""
+        return [stage.metrics() for stage in self.stages]
+
+
+class _Sink:
+    """Stands in for the stage after the last one when tracking depth."""
+
+    max_queue_depth = 0
@@ -0,0 +1,247 @@
+"""src/lib/pulses.py
+An offline index of threat intelligence pulses.
+Pulses, and the indicators they list, are synced into the tools database
+incrementally: each sync asks only for pulses modified since the cursor left
+by the previous one. Indicators are matched locally against a Bloom filter
+held in memory, so the indicators in no pulse, usually nearly all of them,
+are ruled out without touching the database or the network; the few that
+pass are confirmed with one indexed query per batch.
+"""
+
+import json
+import threading
+import time
+
+from src.lib.bloom import BloomFilter
+from src.lib.cache import register_cache
+from src.lib.migrations import ensure_schema
+from src.lib.sqlite import Database
+
+
+DEFAULT_DB_PATH = "dbs/tools.db"
+DEFAULT_ERROR_RATE = 0.001
+# Pulses stored per transaction while syncing
+SYNC_BATCH_SIZE = 50
+# Indicators confirmed against the database per query
+MATCH_BATCH_SIZE = 500
+
+
+def normalize(indicator):
+    """Return the key an indicator is indexed and matched under."""
+    return indicator.strip().lower()
+
+
+class PulseIndex:
+    """Pulses synced into SQLite, matched through an in-memory Bloom filter."""
+
+    def __init__(self, source="otx", db_path=DEFAULT_DB_PATH,
+                 error_rate=DEFAULT_ERROR_RATE):
+        """
+        :param source: Name the sync cursor is kept under
+        :param db_path: Path of the SQLite database
+        :param error_rate: Share of indicators in no pulse that the Bloom
+            filter lets through to the database
+        """
+        self.source = source
+        self.db_path = db_path
+        self.error_rate = error_rate
+        self.checked = 0
+        self.candidates = 0
+        self.hits = 0
+        self.synced_pulses = 0
+        self._filter = None
+        self._lock = threading.Lock()
+
+    def _database(self):
+        """Return a connected Database with the pulse tables."""
+        db = Database(self.db_path)
+        db.connect()
+        ensure_schema(db)
+        return db
+
+    def cursor(self):
+        """Return the modification time the next sync starts from, or None."""
+        rows = self._database().execute_query(
+            "SELECT cursor FROM pulse_sync WHERE source = ?", (self.source,))
+        return rows[0][0] if rows else None
+
+    def sync(self, pulses):
+        """
+        Stores pulses, replacing earlier versions of the same pulses.
+        The cursor moves to the latest modification time seen only once every
+        pulse is stored, so an interrupted sync is resumed from the start.
+
+        :param pulses: Iterable of pulse dictionaries as returned by OTX, with
+            id, name, author_name, modified, TLP, tags and indicators
+        :return: Dictionary summarizing the sync
+        """
+        db = self._database()
+        cursor = self.cursor()
+        added = []
+        stored = indicators = 0
+        batch = []
+        for pulse in pulses:
+            batch.append(pulse)
+            if len(batch) >= SYNC_BATCH_SIZE:
+                indicators += self._store(db, batch, added)
+                stored += len(batch)
+                cursor = max([cursor or ""] + [
+                    pulse.get("modified") or "" for pulse in batch]) or None
+                batch = []
+        if batch:
+            indicators += self._store(db, batch, added)
+            stored += len(batch)
+            cursor = max([cursor or ""] + [
+                pulse.get("modified") or "" for pulse in batch]) or None
+        db.execute_update(
+            "INSERT OR REPLACE INTO pulse_sync (source, cursor, synced_at) "
+            "VALUES (?, ?, ?)", (self.source, cursor, time.time()))
+        db.commit()
+        with self._lock:
+            self.synced_pulses += stored
+            if self._filter is not None:
+                if len(self._filter) + len(added) > self._filter.capacity:
+                    # Rebuilt, larger, on the next match
+                    self._filter = None
+                else:
+                    self._filter.update(added)
+        return {"pulses": stored, "indicators": indicators, "cursor": cursor}
+
+    @staticmethod
+    def _store(db, pulses, added):
+        """
+        Stores a batch of pulses in one transaction.
+
+        :param added: List the keys of the stored indicators are appended to
+        :return: Number of indicators stored
+        """
+        count = 0
+        for pulse in pulses:
+            rows = {
+                normalize(entry["indicator"]): entry.get("type")
+                for entry in pulse.get("indicators") or ()
+                if entry.get("indicator") and entry.get("is_active", 1)
+            }
+            db.execute_update(
+                "DELETE FROM pulse_indicators WHERE pulse_id = ?",
+                (pulse["id"],))
+            db.execute_update(
+                "INSERT OR REPLACE INTO pulses (id, name, author, modified, "
+                "tlp, tags, indicators) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (pulse["id"], pulse.get("name"), pulse.get("author_name"),
+                 pulse.get("modified"), pulse.get("TLP") or pulse.get("tlp"),
+                 json.dumps(pulse.get("tags") or []), len(rows)))
+            db.execute_many(
+                "INSERT OR IGNORE INTO pulse_indicators "
+                "(indicator, type, pulse_id) VALUES (?, ?, ?)",
+                [(key, kind, pulse["id"]) for key, kind in rows.items()])
+            added.extend(rows)
+            count += len(rows)
+        db.commit()
+        return count
+
+    def _bloom(self):
+        """Return the Bloom filter, building it from the database if needed."""
+        with self._lock:
+            if self._filter is not None:
+                return self._filter
+        db = self._database()
+        count = db.execute_query(
+            "SELECT COUNT(*) FROM pulse_indicators")[0][0]
+        # Headroom for the indicators of the next syncs
+        bloom = BloomFilter(max(count * 2, 1024), self.error_rate)
+        bloom.update(row[0] for row in db.connection.execute(
+            "SELECT DISTINCT indicator FROM pulse_indicators"))
+        with self._lock:
+            if self._filter is None:
+                self._filter = bloom
+            return self._filter
+
+    def _confirm(self, keys):
+        """Return a dictionary of key -> pulses for the keys in a pulse."""
+        placeholders = ", ".join("?" * len(keys))
+        rows = self._database().execute_query(
+            "SELECT i.indicator, p.id, p.name FROM pulse_indicators i "
+            "JOIN pulses p ON p.id = i.pulse_id "
+            f"WHERE i.indicator IN ({placeholders})", list(keys))
+        found = {}
+        for key, pulse_id, name in rows:
+            found.setdefault(key, []).append({"id": pulse_id, "name": name})
+        return found
+
+    def match(self, indicators, batch_size=MATCH_BATCH_SIZE):
+        """
+        Matches indicators against the index without any network calls.
+        Indicators are consumed lazily and matches are yielded in batches,
+        in input order.
+
+        :param indicators: Iterable of indicators
+        :return: Generator of (indicator, pulses) tuples for the indicators
+            in at least one pulse; pulses is a list of {"id", "name"}
+        """
+        bloom = self._bloom()
+        checked = 0
+        pending = []
+        for indicator in indicators:
+            checked += 1
+            key = indicator.strip().lower()  # normalize(), inlined
+            if key in bloom:
+                pending.append((indicator, key))
+                if len(pending) >= batch_size:
+                    yield from self._matches(pending, checked)
+                    checked = 0
+                    pending = []
+        yield from self._matches(pending, checked)
+
+    def _matches(self, pending, checked):
+        """Confirm a batch of candidates and count them."""
+        found = self._confirm({key for _, key in pending}) if pending else {}
+        matches = [(indicator, found[key]) for indicator, key in pending
+                   if key in found]
+        with self._lock:
+            self.checked += checked
+            self.candidates += len(pending)
+            self.hits += len(matches)
+        return matches
+
+    def lookup(self, indicator):
+        """Return the pulses listing an indicator, empty if none does."""
+        for _, pulses in self.match([indicator]):
+            return pulses
+        return []
+
+    def clear(self):
+        """Delete every pulse and the sync cursor, so the next sync is full."""
+        db = self._database()
+        db.execute_update("DELETE FROM pulse_indicators")
+        db.execute_update("DELETE FROM pulses")
+        db.execute_update(
+            "DELETE FROM pulse_sync WHERE source = ?", (self.source,))
+        db.commit()
+        with self._lock:
+            self._filter = None
+
+    def stats(self):
+        """Return the index counters as a dictionary."""
+        db = self._database()
+        pulses = db.execute_query("SELECT COUNT(*) FROM pulses")[0][0]
+        indicators = db.execute_query(
+            "SELECT COUNT(*) FROM pulse_indicators")[0][0]
+        cursor = self.cursor()
+        with self._lock:
+            bloom = self._filter
+            return {
+                'pulses': pulses,
+                'indicators': indicators,
+                'cursor': cursor,
+                'synced_pulses': self.synced_pulses,
+                'checked': self.checked,
+                'candidates': self.candidates,
+                'hits': self.hits,
+                'false_positives': self.candidates - self.hits,
+                'filter_bytes': bloom.size if bloom else 0,
+            }
+
+
+PULSES = PulseIndex()
+register_cache('pulses', PULSES)
@@ -0,0 +1,464 @@
+"""src/lib/ratelimit.py
+Rate limiting and retries for tools that call remote APIs.
+A Limiter guards the calls made to one host with one API key. A token bucket
+caps the request rate. An AIMD limit on concurrent requests grows by one per
+round of successful requests and halves when the API throttles, so it
+settles at the concurrency the API sustains. Throttled and failed calls are
+retried with exponential backoff and full jitter, waiting at least as long
+as the API asks with Retry-After. A circuit breaker fails calls fast once a
+host keeps failing. Tools opt in by running their requests through
+get_limiter(host, api_key).call(...).
+"""
+
+import random
+import threading
+import time
+
+
+DEFAULT_MAX_CONCURRENCY = 8
+DEFAULT_MAX_RETRIES = 5
+# Seconds of the first backoff, doubled on every retry up to the cap
+DEFAULT_BACKOFF_BASE = 0.5
+DEFAULT_BACKOFF_CAP = 30.0
+# Consecutive failures that open a circuit, and seconds it stays open
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_RESET_TIMEOUT = 30.0
+# HTTP statuses worth retrying: throttling and transient server errors
+THROTTLE_STATUSES = (429,)
+RETRY_STATUSES = (500, 502, 503, 504)
+
+# Limiters created in this process, keyed by (host, API key fingerprint)
+LIMITERS = {}
+_LIMITERS_LOCK = threading.Lock()
+
+
+class RetryableError(Exception):
+    """A call failed in a way that may succeed if retried."""
+
+    def __init__(self, message, retry_after=None):
+        """
+        :param message: Description of the failure
+        :param retry_after: Seconds the server asked to wait, or None
+        """
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class Throttled(RetryableError):
+    """The server refused a call because too many were made."""
+
+
+class CircuitOpen(Exception):
+    """A call was refused without trying because its host keeps failing."""
+
+
+def parse_retry_after(value, now=None):
+    """
+    Parses a Retry-After header.
+
+    :param value: Header value, a number of seconds or an HTTP date
+    :param now: Epoch time the date is relative to, the current time if None
+    :return: Seconds to wait, or None if the value is missing or malformed
+    """
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    # pylint: disable=import-outside-toplevel
+    from email.utils import parsedate_to_datetime
+
+    try:
+        date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(date.timestamp() - (time.time() if now is None else now), 0.0)
+
+
+def check_status(status, headers=None):
+    """
+    Raises for HTTP statuses that a Limiter retries.
+
+    :param status: HTTP status code of a response
+    :param headers: Mapping of the response headers
+    :raises Throttled: For 429
+    :raises RetryableError: For transient server errors
+    """
+    if status not in THROTTLE_STATUSES and status not in RETRY_STATUSES:
+        return
+    retry_after = parse_retry_after((headers or {}).get("Retry-After"))
+    if status in THROTTLE_STATUSES:
+        raise Throttled(f"HTTP {status}: too many requests", retry_after)
+    raise RetryableError(f"HTTP {status}: server error", retry_after)
+
+
+def backoff_delay(attempt, base=DEFAULT_BACKOFF_BASE,
+                  cap=DEFAULT_BACKOFF_CAP, retry_after=None):
+    """
+    Returns the seconds to wait before retrying.
+    The delay is drawn uniformly up to an exponentially growing ceiling
+    ("full jitter"), so clients throttled together do not retry together.
+    A Retry-After from the server is a lower bound.
+
+    :param attempt: Number of the retry, starting at 0
+    :param retry_after: Seconds the server asked to wait, or None
+    """
+    delay = random.uniform(0, min(cap, base * 2 ** attempt))
+    if retry_after is not None:
+        delay = max(delay, retry_after + random.uniform(0, base))
+    return delay
+
+
+class TokenBucket:
+    """Allows rate requests per second, in bursts of at most burst."""
+
+    def __init__(self, rate, burst=None):
+        """
+        :param rate: Tokens added per second
+        :param burst: Most tokens held, rate if None
+        """
+        self.rate = rate
+        self.burst = burst or max(rate, 1)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        """Add the tokens accrued since the last update."""
+        self.tokens = min(self.burst,
+                          self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self):
+        """Take a token if one is available, without waiting."""
+        with self._lock:
+            self._refill(time.monotonic())
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+    def acquire(self):
+        """
+        Takes a token, waiting for one if needed.
+        Tokens are reserved in arrival order, so waiting callers are served
+        first come, first served.
+
+        :return: Seconds waited
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+class AdaptiveConcurrency:
+    """
+    A limit on concurrent calls adjusted by additive increase and
+    multiplicative decrease.
+    """
+
+    def __init__(self, maximum=DEFAULT_MAX_CONCURRENCY, minimum=1,
+                 initial=None, decrease=0.5):
+        """
+        :param maximum: Highest the limit grows to
+        :param minimum: Lowest the limit shrinks to
+        :param initial: Limit to start with, maximum if None
+        :param decrease: Factor the limit is multiplied by when throttled
+        """
+        self.maximum = maximum
+        self.minimum = minimum
+        self.limit = float(initial or maximum)
+        self.decrease = decrease
+        self.in_flight = 0
+        self.increases = 0
+        self.decreases = 0
+        # Bumped by every decrease; throttling of calls started before the
+        # last decrease does not decrease the limit again.
+        self._epoch = 0
+        self._condition = threading.Condition()
+
+    def set_maximum(self, maximum):
+        """Change the highest the limit grows to."""
+        with self._condition:
+            if maximum != self.maximum:
+                self.maximum = maximum
+                self.limit = min(self.limit, maximum)
+                self._condition.notify_all()
+
+    def acquire(self):
+        """
+        Waits for a free slot and takes it.
+
+        :return: Token to pass to release()
+        """
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+            return self._epoch
+
+    def release(self, token, throttled=False):
+        """
+        Frees a slot and adjusts the limit.
+
+        :param token: Value returned by acquire()
+        :param throttled: Whether the call was throttled
+        """
+        with self._condition:
+            self.in_flight -= 1
+            if throttled:
+                if token == self._epoch:
+                    self.limit = max(self.minimum,
+                                     self.limit * self.decrease)
+                    self._epoch += 1
+                    self.decreases += 1
+            elif self.limit < self.maximum:
+                # One more slot per limit's worth of successful calls
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+                self.increases += 1
+            self._condition.notify_all()
+
+
+class CircuitBreaker:
+    """Fails calls fast while a host keeps failing."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, failure_threshold=DEFAULT_FAILURE_THRESHOLD,
+                 reset_timeout=DEFAULT_RESET_TIMEOUT):
+        """
+        :param failure_threshold: Consecutive failures that open the circuit
+        :param reset_timeout: Seconds the circuit stays open before a single
+            trial call is let through
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened = 0
+        self._opened_at = 0.0
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def before(self):
+        """
+        Admits a call.
+
+        :raises CircuitOpen: If the circuit is open
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            if self.state == self.OPEN:
+                remaining = self._opened_at + self.reset_timeout \
+                    - time.monotonic()
+                if remaining > 0:
+                    raise CircuitOpen(
+                        f"Circuit open after {self.failures} consecutive "
+                        f"failures, retrying in {remaining:.1f}s.")
+                self.state = self.HALF_OPEN
+                self._trial = False
+            if self._trial:
+                raise CircuitOpen("Circuit half-open, a trial call is "
+                                  "in progress.")
+            self._trial = True
+
+    def success(self):
+        """Record a successful call, closing the circuit."""
+        with self._lock:
+            self.failures = 0
+            self.state = self.CLOSED
+            self._trial = False
+
+    def failure(self):
+        """Record a failed call, opening the circuit past the threshold."""
+        with self._lock:
+            self.failures += 1
+            self._trial = False
+            if self.state == self.HALF_OPEN \
+                    or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.opened += 1
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+
+class Limiter:
+    """Rate limiting, adaptive concurrency, retries and circuit breaking."""
+
+    def __init__(self, name, rate=None, burst=None,
+                 max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                 max_retries=DEFAULT_MAX_RETRIES,
+                 backoff_base=DEFAULT_BACKOFF_BASE,
+                 backoff_cap=DEFAULT_BACKOFF_CAP,
+                 failure_threshold=DEFAULT_FAILURE_THRESHOLD,
+                 reset_timeout=DEFAULT_RESET_TIMEOUT,
+                 retryable=(RetryableError, OSError)):
+        """
+        :param name: Name the limiter's counters are shown under
+        :param rate: Requests per second, unlimited if None
+        :param burst: Requests allowed in a burst, rate if None
+        :param max_concurrency: Most concurrent calls
+        :param max_retries: Retries of a call before its error is raised
+        :param backoff_base: Seconds of the first backoff
+        :param backoff_cap: Most seconds of one backoff
+        :param failure_threshold: Consecutive failures opening the circuit
+        :param reset_timeout: Seconds the circuit stays open
+        :param retryable: Exception types that are retried; Throttled is
+            always retried
+        """
+        self.name = name
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.concurrency = AdaptiveConcurrency(max_concurrency)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.retryable = retryable
+        self.calls = 0
+        self.successes = 0
+        self.throttled = 0
+        self.retries = 0
+        self.failures = 0
+        self.rejected = 0
+        self.rate_wait_seconds = 0.0
+        self.backoff_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def configure(self, rate=None, burst=None, max_concurrency=None,
+                  max_retries=None):
+        """
+        Changes the settings of the limiter; None keeps a setting.
+        A rate of 0 turns rate limiting off.
+        """
+        if rate is not None:
+            wanted = (rate, burst or max(rate, 1)) if rate > 0 else None
+            current = (self.bucket.rate, self.bucket.burst) \
+                if self.bucket else None
+            if wanted != current:
+                self.bucket = TokenBucket(rate, burst) if wanted else None
+        if max_concurrency is not None:
+            self.concurrency.set_maximum(max_concurrency)
+        if max_retries is not None:
+            self.max_retries = max_retries
+
+    def _count(self, counter, amount=1):
+        """Add to one of the counters."""
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + amount)
+
+    def call(self, func, *args, **kwargs):
+        """
+        Calls a function that makes one request, retrying it as needed.
+
+        :return: The function's result
+        :raises CircuitOpen: If the host's circuit is open
+        :raises Exception: The last error once retries are exhausted, or
+            any error that is not retryable
+        """
+        self._count('calls')
+        attempt = 0
+        while True:
+            try:
+                self.breaker.before()
+            except CircuitOpen:
+                self._count('rejected')
+                raise
+            if self.bucket is not None:
+                waited = self.bucket.acquire()
+                if waited:
+                    self._count('rate_wait_seconds', waited)
+            token = self.concurrency.acquire()
+            throttled = False
+            try:
+                result = func(*args, **kwargs)
+            except Throttled as e:
+                throttled = True
+                self._count('throttled')
+                # The server is up, only busy: not a failure of the host
+                self.breaker.success()
+                error = e
+            except self.retryable as e:
+                self.breaker.failure()
+                error = e
+            except Exception:
+                # The server answered, e.g. not found: the host is healthy
+                self.breaker.success()
+                raise
+            else:
+                self.breaker.success()
+                self._count('successes')
+                return result
+            finally:
+                self.concurrency.release(token, throttled)
+            if attempt >= self.max_retries:
+                self._count('failures')
+                raise error
+            delay = backoff_delay(
+                attempt, self.backoff_base, self.backoff_cap,
+                getattr(error, 'retry_after', None))
+            self._count('retries')
+            self._count('backoff_seconds', delay)
+            time.sleep(delay)
+            attempt += 1
+
+    def stats(self):
+        """Return the limiter's counters as a dictionary."""
+        with self._lock:
+            return {
+                'calls': self.calls,
+                'successes': self.successes,
+                'throttled': self.throttled,
+                'retries': self.retries,
+                'failures': self.failures,
+                'rejected': self.rejected,
+                'rate': self.bucket.rate if self.bucket else None,
+                'rate_wait_seconds': round(self.rate_wait_seconds, 6),
+                'backoff_seconds': round(self.backoff_seconds, 6),
+                'concurrency_limit': round(self.concurrency.limit, 2),
+                'in_flight': self.concurrency.in_flight,
+                'circuit': self.breaker.state,
+                'circuit_opened': self.breaker.opened,
+            }
+
+
+def _fingerprint(api_key):
+    """Return a short digest identifying an API key without revealing it."""
+    if not api_key:
+        return "anonymous"
+    import hashlib  # pylint: disable=import-outside-toplevel
+
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:8]
+
+
+def get_limiter(host, api_key=None, **settings):
+    """
+    Returns the limiter of a host and API key, creating it on first use.
+    Every tool calling the same host with the same key shares it, so their
+    requests count against the same limits.
+
+    :param host: Host the requests go to
+    :param api_key: API key the requests are made with
+    :param settings: Settings of Limiter.configure(), applied on every call
+        so configuration changes take effect; arguments of Limiter on
+        creation
+    """
+    key = (host, _fingerprint(api_key))
+    with _LIMITERS_LOCK:
+        limiter = LIMITERS.get(key)
+        if limiter is None:
+            limiter = Limiter(f"{host} ({key[1]})", **settings)
+            LIMITERS[key] = limiter
+            return limiter
+    limiter.configure(**{name: value for name, value in settings.items()
+                         if name in ('rate', 'burst', 'max_concurrency',
+                                     'max_retries')})
+    return limiter
@@ -0,0 +1,260 @@
+"""src/lib/registry.py
+A persistent index of the tools available under src/tools.
+Tool metadata is read from the source files without importing them, cached
+on disk keyed by file modification times, and re-parsed only for the files
+that changed since the index was last written.
+"""
+
+import ast
+import json
+import os
+
+
+TOOLS_ROOT = "src/tools"
+INDEX_PATH = "dbs/registry.json"
+INDEX_FORMAT = 2
+
+# Tool methods whose string argument declares a piece of metadata.
+_METADATA_CALLS = {
+    'add_required_input': 'required_inputs',
+    'add_optional_input': 'optional_inputs',
+    'add_output': 'outputs',
+    'add_configuration_parameter': 'configuration_parameters',
+}
+_METADATA_FLAGS = ('credentials_required', 'api_key_required')
+_METADATA_FIELDS = ('name', 'description', 'version', 'author')
+
+
+def _literal(node):
+    """Return the literal value of an AST node, or None if it is not one."""
+    try:
+        return ast.literal_eval(node)
+    except (ValueError, TypeError, SyntaxError):
+        return None
+
+
+def _plain_name(node):
+    """Return the plain name of a Name or Attribute node, or None."""
+    if isinstance(node, ast.Name):
+        return node.id
+    if isinstance(node, ast.Attribute):
+        return node.attr
+    return None
+
+
+def _base_names(class_node):
+    """Return the plain names of the base classes of a class definition."""
+    names = []
+    for base in class_node.bases:
+        name = _plain_name(base)
+        if name is not None:
+            names.append(name)
+    return names
+
+
+def _is_spec_assignment(node):
+    """Return True for a class-level 'tool_spec = ToolSpec(...)'."""
+    return (isinstance(node, ast.Assign)
+            and any(isinstance(target, ast.Name)
+                    and target.id == 'tool_spec' for target in node.targets)
+            and isinstance(node.value, ast.Call)
+            and _plain_name(node.value.func) == 'ToolSpec')
+
+
+def _parse_tool_spec(call, metadata):
+    """Extract the metadata declared by a ToolSpec(...) call.
+    :param call: ast.Call of the ToolSpec constructor
+    :param metadata: Dictionary of tool metadata to update
+    """
+    for field, node in zip(_METADATA_FIELDS, call.args):
+        metadata[field] = _literal(node)
+    for keyword in call.keywords:
+        value = _literal(keyword.value)
+        if keyword.arg in _METADATA_FIELDS:
+            metadata[keyword.arg] = value
+        elif keyword.arg in _METADATA_CALLS.values():
+            metadata[keyword.arg] = list(value or ())
+        elif keyword.arg in _METADATA_FLAGS:
+            metadata[keyword.arg] = bool(value)
+
+
+def _parse_tool_class(class_node):
+    """Extract the metadata declared by a tool class.
+    Metadata is read from the class's tool_spec and from the calls and
+    assignments in its __init__ method.
+    :param class_node: ast.ClassDef of the tool class
+    :return: Dictionary of tool metadata
+    """
+    metadata = {'class': class_node.name}
+    for field in _METADATA_FIELDS:
+        metadata[field] = None
+    for key in _METADATA_CALLS.values():
+        metadata[key] = []
+    for flag in _METADATA_FLAGS:
+        metadata[flag] = False
+    metadata['description'] = ast.get_docstring(class_node)
+
+    for node in class_node.body:
+        if _is_spec_assignment(node):
+            _parse_tool_spec(node.value, metadata)
+        if not (isinstance(node, ast.FunctionDef)
+                and node.name == '__init__'):
+            continue
+        for child in ast.walk(node):
+            if isinstance(child, ast.Call) and isinstance(
+                    child.func, ast.Attribute):
+                attr = child.func.attr
+                if attr == '__init__':
+                    for keyword in child.keywords:
+                        if keyword.arg in _METADATA_FIELDS:
+                            metadata[keyword.arg] = _literal(keyword.value)
+                elif attr in _METADATA_CALLS and child.args:
+                    value = _literal(child.args[0])
+                    if value is not None:
+                        metadata[_METADATA_CALLS[attr]].append(value)
+            elif isinstance(child, ast.Assign):
+                for target in child.targets:
+                    if (isinstance(target, ast.Attribute)
+                            and target.attr in _METADATA_FLAGS):
+                        metadata[target.attr] = bool(_literal(child.value))
+    return metadata
+
+
+def parse_tool_file(path):
+    """Read the metadata of the tool defined in a source file.
+    The file is parsed, never imported.
+    :param path: Path to the tool module
+    :return: Dictionary of tool metadata, or None if no tool class is found
+    """
+    try:
+        with open(path, encoding="utf-8") as source:
+            tree = ast.parse(source.read(), filename=path)
+    except (OSError, SyntaxError, ValueError):
+        return None
+    tool_classes = {'Tool'}
+    found = None
+    for node in tree.body:
+        if not isinstance(node, ast.ClassDef):
+            continue
+        if tool_classes.intersection(_base_names(node)):
+            tool_classes.add(node.name)
+            # The last subclass defined wins, in line with the most
+            # derived class being the one that is meant to be run.
+            found = node
+    if found is None:
+        return None
+    return _parse_tool_class(found)
+
+
+class ToolRegistry:
+    """An index of tool metadata, persisted on disk between sessions."""
+
+    def __init__(self, root=TOOLS_ROOT, index_path=INDEX_PATH):
+        self.root = root
+        self.index_path = index_path
+        self.loaded = False
+        # Tool key -> {"path", "signature", "metadata"}
+        self._files = {}
+
+    def _scan(self):
+        """Yield (tool key, path, stat) for every module under the root.
+        Modules directly under the root are keyed by their module name,
+        modules in subpackages by "<package>.<module>".
+        """
+        try:
+            entries = list(os.scandir(self.root))
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            if entry.name.startswith(('_', '.')):
+                continue
+            if entry.is_dir():
+                for child in os.scandir(entry.path):
+                    if child.is_file() and child.name.endswith('.py') and \
+                            child.name != '__init__.py':
+                        yield (f"{entry.name}.{child.name[:-3]}",
+                               child.path, child.stat())
+            elif entry.is_file() and entry.name.endswith('.py'):
+                yield entry.name[:-3], entry.path, entry.stat()
+
+    def _load_index(self):
+        """Read the on-disk index, ignoring it if it is missing or stale."""
+        self.loaded = True
+        try:
+            with open(self.index_path, encoding="utf-8") as index_file:
+                index = json.load(index_file)
+        except (OSError, ValueError):
+            return
+        if index.get('format') == INDEX_FORMAT and \
+                index.get('root') == self.root:
+            self._files = index.get('tools', {})
+
+    def _save_index(self):
+        """Write the index to disk, replacing any previous copy atomically."""
+        directory = os.path.dirname(self.index_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = f"{self.index_path}.tmp"
+        try:
+            with open(temp_path, "w", encoding="utf-8") as index_file:
+                json.dump({
+                    'format': INDEX_FORMAT,
+                    'root': self.root,
+                    'tools': self._files,
+                }, index_file)
+            os.replace(temp_path, self.index_path)
+        except OSError:
+            # The index is only a cache; a read-only tree still works.
+            pass
+
+    def refresh(self):
+        """Bring the index up to date with the files on disk.
+        Only files whose modification time or size changed are re-parsed.
+        :return: True if the index changed
+        """
+        if not self.loaded:
+            self._load_index()
+        changed = False
+        current = {}
+        for key, path, stat in self._scan():
+            signature = [stat.st_mtime_ns, stat.st_size]
+            entry = self._files.get(key)
+            if entry is None or entry['signature'] != signature \
+                    or entry['path'] != path:
+                entry = {
+                    'path': path,
+                    'signature': signature,
+                    'metadata': parse_tool_file(path),
+                }
+                changed = True
+            current[key] = entry
+        if current.keys() != self._files.keys():
+            changed = True
+        self._files = current
+        if changed:
+            self._save_index()
+        return changed
+
+    def tool_names(self):
+        """Return the keys of all indexed tools, sorted.
+        Modules without a tool class stay indexed, so they are not parsed
+        again, but are not listed.
+        """
+        return sorted(key for key, entry in self._files.items()
+                      if entry['metadata'] is not None)
+
+    def get(self, tool_name):
+        """Return the metadata of a tool without importing it.
+        :param tool_name: Tool key, e.g. "examples.hello_world"
+        :return: Dictionary of tool metadata, or None if unknown
+        """
+        entry = self._files.get(tool_name)
+        if entry is None:
+            return None
+        return entry['metadata']
+
+    def __contains__(self, tool_name):
+        return self.get(tool_name) is not None
+
+    def __len__(self):
+        return len(self.tool_names())
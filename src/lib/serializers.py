@@ -0,0 +1,321 @@
+"""src/lib/serializers.py
+Output formats for tool results.
+A serializer writes a result, or a stream of records, straight to a file
+handle or buffer one record at a time, so a large output is never built up
+as a single string. Formats are registered by name and selected per run:
+compact JSON, NDJSON, MessagePack and CSV with flattened fields ship here,
+and further ones are added with register_serializer().
+"""
+
+import csv
+import json
+import struct
+
+
+def _jsonable(value):
+    """Fallback for values that json cannot serialize natively."""
+    return str(value)
+
+
+# Compact separators; the C encoder is used as no indent is set
+_ENCODER = json.JSONEncoder(separators=(",", ":"), default=_jsonable)
+
+
+def dumps(value):
+    """Return a value as compact JSON."""
+    return _ENCODER.encode(value)
+
+
+class Serializer:
+    """
+    Writes records to a stream in one format.
+    Subclasses set name and binary and implement write(); records are
+    written as they are passed and close() finishes the output.
+    """
+
+    name = None
+    # Whether the format needs a binary stream
+    binary = False
+    # Extension of files written in the format
+    extension = None
+
+    def __init__(self, stream, owned=False):
+        """
+        :param stream: Text or binary stream, as the format needs
+        :param owned: Whether close() closes the stream
+        """
+        self.stream = stream
+        self.owned = owned
+        self.records = 0
+
+    @classmethod
+    def open(cls, path, append=False):
+        """
+        Returns a serializer writing to a file, which it closes.
+
+        :param path: Path of the file
+        :param append: Append to the file rather than replace it
+        """
+        mode = ("a" if append else "w") + ("b" if cls.binary else "")
+        if cls.binary:
+            stream = open(path, mode)  # pylint: disable=consider-using-with
+        else:
+            # pylint: disable=consider-using-with
+            stream = open(path, mode, encoding="utf-8", newline="")
+        return cls(stream, owned=True)
+
+    def write(self, record):
+        """Write one record of a stream."""
+        raise NotImplementedError
+
+    def dump(self, value):
+        """Write a whole, non-streamed result."""
+        self.write(value)
+
+    def close(self):
+        """Finish the output, closing the stream if the serializer owns it."""
+        if self.owned:
+            self.stream.close()
+        else:
+            self.stream.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class JSONSerializer(Serializer):
+    """Compact JSON; a stream of records is written as one array."""
+
+    name = "json"
+    extension = ".json"
+
+    def __init__(self, stream, owned=False):
+        super().__init__(stream, owned)
+        self._dumped = False
+
+    def write(self, record):
+        self.stream.write("," if self.records else "[")
+        self.stream.write(dumps(record))
+        self.records += 1
+
+    def dump(self, value):
+        self.stream.write(dumps(value))
+        self.stream.write("\n")
+        self.records += 1
+        self._dumped = True
+
+    def close(self):
+        # Finish the array of a stream, even an empty one
+        if not self._dumped:
+            self.stream.write("]\n" if self.records else "[]\n")
+        super().close()
+
+
+class NDJSONSerializer(Serializer):
+    """Newline-delimited JSON: one compact JSON document per line."""
+
+    name = "ndjson"
+    extension = ".ndjson"
+
+    def write(self, record):
+        self.stream.write(dumps(record))
+        self.stream.write("\n")
+        self.records += 1
+
+
+def _pack(value, out):
+    """
+    Appends the MessagePack encoding of a value to a bytearray.
+    Used when the msgpack package is not installed; types MessagePack has
+    no encoding for are written as their string form.
+    """
+    # pylint: disable=too-many-branches,too-many-return-statements
+    if value is None:
+        out.append(0xc0)
+    elif value is True:
+        out.append(0xc3)
+    elif value is False:
+        out.append(0xc2)
+    elif isinstance(value, int):
+        if 0 <= value < 0x80:
+            out.append(value)
+        elif -0x20 <= value < 0:
+            out.append(value & 0xff)
+        elif 0 <= value < 1 << 64:
+            for marker, fmt, bound in ((0xcc, ">B", 1 << 8),
+                                       (0xcd, ">H", 1 << 16),
+                                       (0xce, ">I", 1 << 32),
+                                       (0xcf, ">Q", 1 << 64)):
+                if value < bound:
+                    out.append(marker)
+                    out += struct.pack(fmt, value)
+                    return
+        elif -(1 << 63) <= value < 0:
+            for marker, fmt, bound in ((0xd0, ">b", 1 << 7),
+                                       (0xd1, ">h", 1 << 15),
+                                       (0xd2, ">i", 1 << 31),
+                                       (0xd3, ">q", 1 << 63)):
+                if value >= -bound:
+                    out.append(marker)
+                    out += struct.pack(fmt, value)
+                    return
+        else:
+            _pack(str(value), out)
+    elif isinstance(value, float):
+        out.append(0xcb)
+        out += struct.pack(">d", value)
+    elif isinstance(value, str):
+        data = value.encode("utf-8", "surrogatepass")
+        _pack_header(len(data), out, 0xa0, 32, (0xd9, 0xda, 0xdb))
+        out += data
+    elif isinstance(value, (bytes, bytearray)):
+        _pack_header(len(value), out, None, 0, (0xc4, 0xc5, 0xc6))
+        out += value
+    elif isinstance(value, dict):
+        _pack_header(len(value), out, 0x80, 16, (None, 0xde, 0xdf))
+        for key, item in value.items():
+            _pack(key, out)
+            _pack(item, out)
+    elif isinstance(value, (list, tuple)):
+        _pack_header(len(value), out, 0x90, 16, (None, 0xdc, 0xdd))
+        for item in value:
+            _pack(item, out)
+    else:
+        _pack(str(value), out)
+
+
+def _pack_header(length, out, fix, fix_bound, markers):
+    """
+    Appends the header of a string, binary, map or array of a length.
+
+    :param fix: Marker of the compact form holding the length, or None
+    :param fix_bound: Lengths below this use the compact form
+    :param markers: Markers of 8, 16 and 32 bit lengths, None if unused
+    """
+    if fix is not None and length < fix_bound:
+        out.append(fix | length)
+        return
+    for marker, fmt, bound in zip(markers, (">B", ">H", ">I"),
+                                  (1 << 8, 1 << 16, 1 << 32)):
+        if marker is not None and length < bound:
+            out.append(marker)
+            out += struct.pack(fmt, length)
+            return
+    raise ValueError("Value too large for MessagePack.")
+
+
+class MessagePackSerializer(Serializer):
+    """
+    MessagePack, a compact binary form of JSON; a stream of records is
+    written as consecutive objects. The msgpack package is used when it is
+    installed and a pure Python encoder otherwise.
+    """
+
+    name = "msgpack"
+    binary = True
+    extension = ".msgpack"
+
+    def __init__(self, stream, owned=False):
+        super().__init__(stream, owned)
+        try:
+            import msgpack  # pylint: disable=import-outside-toplevel
+        except ImportError:
+            self._packer = None
+        else:
+            self._packer = msgpack.Packer(default=_jsonable)
+
+    def write(self, record):
+        if self._packer is not None:
+            self.stream.write(self._packer.pack(record))
+        else:
+            out = bytearray()
+            _pack(record, out)
+            self.stream.write(out)
+        self.records += 1
+
+
+def flatten(record, prefix=""):
+    """
+    Flattens nested dictionaries into one level of dotted keys.
+    Lists are kept whole, as compact JSON, so every record of a stream has
+    the same columns however long its lists are.
+    """
+    if not isinstance(record, dict):
+        return {prefix or "value": record}
+    fields = {}
+    for key, value in record.items():
+        name = f"{prefix}.{key}" if prefix else str(key)
+        if isinstance(value, dict) and value:
+            fields.update(flatten(value, name))
+        elif isinstance(value, (list, tuple, dict)):
+            fields[name] = dumps(value)
+        else:
+            fields[name] = value
+    return fields
+
+
+class CSVSerializer(Serializer):
+    """
+    CSV with nested fields flattened to dotted columns. The columns are
+    those of the first record; fields later records add are left out.
+    """
+
+    name = "csv"
+    extension = ".csv"
+
+    def __init__(self, stream, owned=False):
+        super().__init__(stream, owned)
+        self._writer = None
+
+    def write(self, record):
+        fields = flatten(record)
+        if self._writer is None:
+            self._writer = csv.DictWriter(
+                self.stream, fieldnames=list(fields),
+                extrasaction="ignore", lineterminator="\n")
+            self._writer.writeheader()
+        self._writer.writerow(fields)
+        self.records += 1
+
+    def dump(self, value):
+        if isinstance(value, list):
+            for record in value:
+                self.write(record)
+        else:
+            self.write(value)
+
+
+# Serializers by format name, see register_serializer()
+SERIALIZERS = {}
+
+
+def register_serializer(serializer_class):
+    """
+    Makes a format available by its serializer's name.
+
+    :param serializer_class: Subclass of Serializer
+    """
+    SERIALIZERS[serializer_class.name] = serializer_class
+    return serializer_class
+
+
+def get_serializer(name):
+    """
+    Returns the serializer class of a format.
+
+    :raises ValueError: If the format is unknown
+    """
+    serializer_class = SERIALIZERS.get(name)
+    if serializer_class is None:
+        raise ValueError(
+            f"Unknown format '{name}'. Available formats: "
+            f"{', '.join(sorted(SERIALIZERS))}.")
+    return serializer_class
+
+
+for _serializer_class in (JSONSerializer, NDJSONSerializer,
+                          MessagePackSerializer, CSVSerializer):
+    register_serializer(_serializer_class)
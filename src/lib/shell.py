@@ -0,0 +1,1076 @@
+"""src/lib/shell.py
+The command interpreter behind the Swiss Army Knife prompt.
+Commands are dispatched through a table of handlers, so the interpreter can
+be driven one line at a time from an interactive prompt, a script or a
+benchmark without growing the call stack.
+"""
+
+import datetime
+import importlib
+import sqlite3
+import sys
+import threading
+
+from src.lib import history
+from src.lib.cache import CACHES
+from src.lib.completion import CATALOG, LOADED, CompletionIndex
+from src.lib.credentials import CREDENTIALS
+from src.lib.executors import get_executor, warm_up
+from src.lib.instrumentation import (
+    INSTRUMENTATION,
+    profile,
+    profile_sort_keys,
+    timed,
+    trace_allocations,
+)
+from src.lib.jobs import JobManager
+from src.lib.pipeline import Pipeline, PipelineError, Stage
+from src.lib.ratelimit import LIMITERS
+from src.lib.registry import ToolRegistry
+from src.lib.serializers import (
+    SERIALIZERS,
+    NDJSONSerializer,
+    dumps,
+    get_serializer,
+)
+from src.lib.streaming import drain, is_stream, prefetch
+from src.lib.tool import Tool, load_all_configurations
+
+
+REGISTRY = ToolRegistry()
+# Options accepted by the run commands
+RUN_OPTIONS = ('spool', 'format', 'out')
+# Options accepted by the profile command
+PROFILE_OPTIONS = ('sort', 'limit', 'out')
+# Options accepted by the history command
+HISTORY_OPTIONS = ('tool', 'status', 'inputs', 'since', 'after', 'limit')
+# Words completed after a command: tool names of the catalog, names of the
+# loaded tools, or the fixed words of its first argument
+COMMAND_ARGUMENTS = {
+    'load': CATALOG,
+    'info': CATALOG,
+    'run': LOADED,
+    'pipe': LOADED,
+    'profile': LOADED,
+    'list': ('tools', 'loaded'),
+    'cache': ('stats', 'clear'),
+    'history': ('query', 'show', 'stats', 'clear'),
+    'stats': ('json', 'prometheus', 'reset', 'memory'),
+}
+# Options completed after a command
+COMMAND_OPTIONS = {
+    'run': RUN_OPTIONS,
+    'pipe': RUN_OPTIONS,
+    'profile': PROFILE_OPTIONS,
+    'history': HISTORY_OPTIONS,
+}
+
+
+def load_module(tool_name):
+    """
+    Dynamically load a tool module by name.
+
+    :raises ImportError: If the module cannot be imported
+    """
+    return importlib.import_module(f"src.tools.{tool_name}")
+
+
+def load_tool(tool_name, registry=REGISTRY):
+    """
+    Load a tool class from a module by name.
+
+    :raises ImportError: If the module cannot be imported
+    :raises LookupError: If the module defines no tool class
+    """
+    module = load_module(tool_name)
+    metadata = registry.get(tool_name)
+    if metadata and hasattr(module, metadata['class']):
+        return getattr(module, metadata['class'])
+    import inspect  # pylint: disable=import-outside-toplevel
+
+    for _, obj in inspect.getmembers(module):
+        if inspect.isclass(obj) and issubclass(obj, Tool) and obj is not Tool:
+            return obj
+    raise LookupError(f"No valid tool class found in module '{tool_name}'.")
+
+
+def run_tool(tool_instance):
+    """Run a tool by its name."""
+    if not isinstance(tool_instance, Tool):
+        return "Please provide the name of a valid, loaded tool."
+    return get_executor(tool_instance.executor).run(tool_instance)
+
+
+def list_tools(registry=REGISTRY):
+    """List all available tools in the src.tools package.
+    Tools are read from the registry, which only re-parses tool files that
+    changed since the last call and never imports them.
+    """
+    registry.refresh()
+    return registry.tool_names()
+
+
+def split_options(command, names):
+    """
+    Separates '--name value' options from the other words of a command.
+
+    :param command: List of command words
+    :param names: Option names that are recognised
+    :return: Tuple (remaining words, dictionary of option values)
+    :raises ValueError: If an option is missing its value
+    """
+    words = []
+    options = {}
+    iterator = iter(command)
+    for word in iterator:
+        if word.startswith("--") and word[2:] in names:
+            value = next(iterator, None)
+            if value is None:
+                raise ValueError(f"Option '{word}' requires a value.")
+            options[word[2:]] = value
+        else:
+            words.append(word)
+    return words, options
+
+
+def check_export_options(options):
+    """
+    Checks the '--format' option of a run before the tool runs.
+
+    :raises ValueError: If the format is unknown, or binary and the output
+        is not written to a file with '--out'
+    """
+    name = options.get('format')
+    if name is not None and get_serializer(name).binary \
+            and 'out' not in options:
+        raise ValueError(f"Format '{name}' is binary, "
+                         f"use '--out <file>' to write it to a file.")
+
+
+class Shell:
+    """
+    A line-oriented command interpreter for the Swiss Army Knife application.
+    """
+
+    def __init__(self, registry=None, out=None):
+        self.registry = registry or REGISTRY
+        # Stream that command output is written to, sys.stdout if None
+        self.out = out
+        self.loaded_tools = {}
+        self.running = True
+        # Message of the last error reported by the current command
+        self.last_error = None
+        self.jobs = JobManager()
+        # Announce background jobs as they finish
+        self.notify_jobs = False
+        # Callable receiving output records in place of the output stream,
+        # as script mode does to write them out as they are produced
+        self.record_sink = None
+        # Commands that are given as the first word of a line
+        self.commands = {
+            'list': self.do_list,
+            'info': self.do_info,
+            'load': self.do_load,
+            'run': self.do_run,
+            'exit': self.do_exit,
+            'help': self.do_help,
+            'cache': self.do_cache,
+            'jobs': self.do_jobs,
+            'wait': self.do_wait,
+            'pipe': self.do_pipe,
+            'stats': self.do_stats,
+            'profile': self.do_profile,
+            'history': self.do_history,
+            'limits': self.do_limits,
+        }
+        # Commands that follow the name of a loaded tool
+        self.tool_commands = {
+            'get': self.do_tool_get,
+            'info': self.do_tool_info,
+            'run': self.do_tool_run,
+            'save': self.do_tool_save,
+            'load': self.do_tool_load,
+            'set': self.do_tool_set,
+        }
+        # Words offered for completion at the prompt, built on first use
+        self.completion = CompletionIndex(
+            self, COMMAND_ARGUMENTS, COMMAND_OPTIONS,
+            {'format': SERIALIZERS})
+
+    def register_command(self, name, handler):
+        """
+        Registers a top-level command.
+
+        :param name: Command word
+        :param handler: Callable taking the list of command words
+        """
+        self.commands[name] = handler
+        self.completion.command_added(name)
+
+    def register_tool_command(self, name, handler):
+        """
+        Registers a command that follows the name of a loaded tool.
+
+        :param name: Command word
+        :param handler: Callable taking the tool instance and command words
+        """
+        self.tool_commands[name] = handler
+        self.completion.tool_command_added(name)
+
+    def write(self, *values):
+        """Write a line of output."""
+        print(*values, file=self.out or sys.stdout)
+
+    def write_record(self, record):
+        """
+        Write an output record, as compact JSON unless it is text, or pass
+        it to the record sink if one is set.
+        """
+        if self.record_sink is not None:
+            self.record_sink(record)
+        else:
+            self.write(record if isinstance(record, str) else dumps(record))
+
+    def error(self, message):
+        """Write an error message and record it as the command's error."""
+        self.last_error = str(message)
+        self.write(message)
+
+    def execute(self, line):
+        """
+        Executes a single command line.
+
+        :param line: Command line as typed at the prompt
+        :return: The value returned by the command handler, if any
+        """
+        self.last_error = None
+        command = line.split()
+        if not command:
+            return None
+        handler = self.commands.get(command[0])
+        if handler is not None:
+            return handler(command)
+        if command[0] in self.loaded_tools and len(command) > 1:
+            tool_instance = self.loaded_tools[command[0]]
+            handler = self.tool_commands.get(command[1])
+            if handler is not None:
+                return handler(tool_instance, command)
+            self.error(
+                f"Unknown command for tool '{command[0]}': {command[1]}. "
+                f"Available commands: "
+                f"{', '.join(sorted(self.tool_commands))}."
+            )
+            return None
+        self.error(f"Unknown command: {command[0]}. "
+                   f"Type 'help' for available commands.")
+        return None
+
+    def refresh_registry(self):
+        """Refresh the registry, passing new tool names on to completion."""
+        if self.registry.refresh():
+            self.completion.catalog_changed(self.registry.tool_names())
+
+    def do_list(self, command):
+        """List available or loaded tools."""
+        if len(command) == 1 or command[1] == "tools":
+            self.refresh_registry()
+            tools = self.registry.tool_names()
+            self.write("Available tools:", ", ".join(tools))
+        elif command[1] == "loaded":
+            if self.loaded_tools:
+                self.write("Loaded tools:", ", ".join(self.loaded_tools))
+            else:
+                self.write("No tools are currently loaded.")
+
+    def do_info(self, command):
+        """Show the metadata of a tool without importing it."""
+        if len(command) < 2:
+            self.error("Usage: info <tool>")
+            return
+        self.refresh_registry()
+        metadata = self.registry.get(command[1])
+        if metadata is None:
+            self.error(f"No tool metadata found for '{command[1]}'.")
+            return
+        self.write(f"Tool Name: {metadata['name']}")
+        self.write(f"Description: {metadata['description']}")
+        self.write(f"Version: {metadata['version']}")
+        self.write(f"Author: {metadata['author']}")
+        self.write("Required Inputs:", metadata['required_inputs'])
+        self.write("Optional Inputs:", metadata['optional_inputs'])
+        self.write("Outputs:", metadata['outputs'])
+        self.write("Configuration Parameters:",
+                   metadata['configuration_parameters'])
+        self.write("Credentials Required:", metadata['credentials_required'])
+        self.write("API Key Required:", metadata['api_key_required'])
+
+    def do_load(self, command):
+        """Load one or more tools and their saved configuration."""
+        if len(command) < 2:
+            self.error("Usage: load <tool> [<tool> ...]")
+            return
+        loaded = {}
+        # Picks up tools added since the last refresh, so their metadata
+        # names the load measurements and locates their classes
+        self.refresh_registry()
+        for tool_name in command[1:]:
+            if tool_name in self.loaded_tools or tool_name in loaded:
+                self.error(f"Tool '{tool_name}' is already loaded.")
+                continue
+            metadata = self.registry.get(tool_name)
+            try:
+                with timed("load", metadata['name'] if metadata
+                           else tool_name):
+                    tool_class = load_tool(tool_name, self.registry)
+                    loaded[tool_name] = tool_class()
+            except (ImportError, LookupError, AttributeError,
+                    TypeError) as e:
+                self.error(f"Error loading tool '{tool_name}': {e}")
+                continue
+            self.loaded_tools[tool_name] = loaded[tool_name]
+            self.completion.tool_loaded(tool_name, loaded[tool_name])
+            self.write(f"Tool '{tool_name}' loaded successfully.")
+        try:
+            # One query fetches the configuration of every tool just loaded
+            load_all_configurations(loaded.values())
+        except (IOError, OSError, sqlite3.Error) as e:
+            self.error(
+                f"Error loading configuration for "
+                f"'{', '.join(loaded)}': {e}")
+            return
+        for tool_name, tool_instance in loaded.items():
+            if tool_instance.configurations:
+                self.write(
+                    f"Configuration for '{tool_name}' loaded successfully.")
+        # Fetch the credentials of every tool just loaded in one pass
+        keys = [key for key in (tool_instance.credential_key()
+                                for tool_instance in loaded.values()) if key]
+        if keys:
+            try:
+                CREDENTIALS.prefetch(keys)
+            except Exception as e:  # pylint: disable=broad-except
+                self.error(f"Credentials could not be prefetched: {e}")
+        # Start worker processes for CPU-bound tools ahead of their first run
+        warm_up(loaded.values())
+
+    def do_run(self, command):
+        """
+        Run one or more loaded tools.
+        Several tools run concurrently; a trailing '&' runs them as
+        background jobs instead of waiting for them. '--spool <file>'
+        appends streamed output records to a file instead of printing them.
+        '--format <format>' renders the result as json, ndjson, csv or
+        msgpack, and '--out <file>' writes it to a file.
+        """
+        try:
+            command, options = split_options(command, RUN_OPTIONS)
+            check_export_options(options)
+        except ValueError as e:
+            self.error(e)
+            return None
+        background = command[-1] == "&"
+        tool_names = command[1:-1] if background else command[1:]
+        if not tool_names:
+            self.error("Usage: run <tool> [<tool> ...] [&] [--spool <file>] "
+                       "[--format <format>] [--out <file>]")
+            return None
+        if 'out' in options and len(tool_names) > 1:
+            self.error("Option '--out' takes the result of a single tool.")
+            return None
+        for tool_name in tool_names:
+            if tool_name not in self.loaded_tools:
+                self.error(
+                    f"Tool '{tool_name}' is not loaded. "
+                    f"Use 'load {tool_name}' first."
+                )
+                return None
+        if background:
+            return [self.start_job(tool_name, options.get('spool'))
+                    for tool_name in tool_names]
+        if len(tool_names) == 1:
+            return self.run_one(
+                tool_names[0], self.loaded_tools[tool_names[0]], options)
+        return self.run_concurrently(tool_names, options)
+
+    def run_concurrently(self, tool_names, options):
+        """
+        Run several loaded tools concurrently and render their results.
+        Streamed records are written as each tool produces them, one whole
+        record at a time, to the shell's output, the '--spool' file or the
+        '--format' serializer they share.
+
+        :return: Dictionary of tool name -> rendered result, or None if the
+            tool failed
+        """
+        spool = options.get('spool')
+        if spool is not None:
+            # pylint: disable-next=consider-using-with
+            spool_file = open(spool, "a", encoding="utf-8")
+            serializer = NDJSONSerializer(spool_file, owned=True)
+        elif 'format' in options:
+            serializer = get_serializer(options['format'])(
+                self.out or sys.stdout)
+        else:
+            serializer = None
+        lock = threading.Lock()
+
+        def write(record):
+            with lock:
+                if serializer is not None:
+                    serializer.write(record)
+                else:
+                    self.write_record(record)
+
+        try:
+            jobs = self.jobs.run_concurrently(
+                {tool_name: self.loaded_tools[tool_name]
+                 for tool_name in tool_names},
+                on_record=write)
+        finally:
+            if serializer is not None:
+                serializer.close()
+        results = {}
+        for tool_name, job in jobs.items():
+            results[tool_name] = None
+            if job.status == "failed":
+                self.error(f"Error from '{tool_name}': "
+                           f"{job.future.exception()}")
+            elif job.streamed:
+                results[tool_name] = self.show_summary(
+                    tool_name, job.result(), spool)
+            else:
+                results[tool_name] = self.show_result(
+                    tool_name, self.loaded_tools[tool_name], job.result(),
+                    **options)
+        return results
+
+    def run_one(self, label, tool_instance, options):
+        """
+        Run a tool in the foreground and render its result. An error from
+        the tool is reported, like the errors of concurrent runs, instead
+        of ending the session.
+
+        :return: The rendered result, or None if the tool failed
+        """
+        try:
+            return self.show_result(
+                label, tool_instance, run_tool(tool_instance), **options)
+        except Exception as e:  # pylint: disable=broad-except
+            self.error(f"Error from '{label}': {e}")
+            return None
+
+    # pylint: disable-next=redefined-builtin
+    def show_result(self, label, tool_instance, result, spool=None,
+                    out=None, format=None):
+        """
+        Render the result of a tool run.
+        Streamed results are rendered record by record as they are produced
+        and only a summary is kept and returned.
+
+        :param label: Name to show the result under
+        :param tool_instance: Tool that produced the result
+        :param result: Result returned by the tool's run method
+        :param spool: Optional file to append streamed records to instead
+            of printing them
+        :param out: Optional file to write the result to, in format
+        :param format: Optional name of the format to render the result in
+        :return: The result, or the summary of a streamed result
+        """
+        if out is not None or format is not None:
+            return self.export_result(
+                label, tool_instance, result, spool, out, format)
+        with timed("render", tool_instance.name):
+            if not is_stream(result):
+                if not isinstance(result, str):
+                    result_text = dumps(result)
+                else:
+                    result_text = result
+                self.write(f"Result from '{label}': {result_text}")
+                return result
+            summary = drain(
+                tool_instance, prefetch(result),
+                on_record=None if spool else self.write_record,
+                spool=spool,
+                tail_size=tool_instance.output_tail_size
+            )
+        return self.show_summary(label, summary, spool)
+
+    def show_summary(self, label, summary, spool=None):
+        """
+        Write the summary of a streamed result.
+
+        :param summary: Summary returned by drain()
+        :param spool: File the records were appended to, if any
+        :return: The summary
+        """
+        where = f" spooled to '{spool}'" if spool else ""
+        self.write(
+            f"Result from '{label}': {summary['records']} record(s){where}.")
+        return summary
+
+    # pylint: disable-next=redefined-builtin
+    def export_result(self, label, tool_instance, result, spool, out,
+                      format):
+        """
+        Write the result of a tool run with a serializer, to a file or the
+        shell's output. Streamed results default to ndjson, others to json.
+
+        :return: The result, or the summary of a streamed result
+        """
+        streamed = is_stream(result)
+        format = format or ("ndjson" if streamed else "json")
+        serializer_class = get_serializer(format)
+        if out is not None:
+            serializer = serializer_class.open(out)
+        else:
+            serializer = serializer_class(self.out or sys.stdout)
+        try:
+            with timed("render", tool_instance.name):
+                if streamed:
+                    summary = drain(
+                        tool_instance, prefetch(result),
+                        on_record=serializer.write, spool=spool,
+                        tail_size=tool_instance.output_tail_size
+                    )
+                else:
+                    serializer.dump(result)
+        finally:
+            serializer.close()
+        if out is not None:
+            self.write(f"Result from '{label}': {serializer.records} "
+                       f"record(s) written to '{out}' as {format}.")
+        return summary if streamed else result
+
+    def start_job(self, tool_name, spool=None):
+        """
+        Start a loaded tool as a background job.
+        A streamed result is consumed by the job as it is produced: its
+        records are appended to the spool file if one is given, and the
+        last of them are kept for 'wait'.
+
+        :param spool: Optional file to append streamed records to
+        :return: Id of the job, or None if the tool is already running
+        """
+        running = self.jobs.running(tool_name)
+        if running:
+            self.error(f"Tool '{tool_name}' is already running as job "
+                       f"[{running[0].id}].")
+            return None
+        job = self.jobs.submit(
+            tool_name, self.loaded_tools[tool_name],
+            on_done=self._job_done if self.notify_jobs else None,
+            spool=spool
+        )
+        self.write(f"[{job.id}] Started '{tool_name}'.")
+        return job.id
+
+    def _job_done(self, job):
+        """Announce a finished background job."""
+        self.write(f"[{job.id}] {job.status.capitalize()}: '{job.tool_name}' "
+                   f"({job.elapsed:.3f}s). Use 'wait {job.id}' for the "
+                   f"result.")
+
+    def do_jobs(self, command):
+        """List the background jobs."""
+        if not self.jobs.jobs:
+            self.write("No jobs.")
+        for job in self.jobs.jobs.values():
+            self.write(f"[{job.id}] {job.status:<9} {job.elapsed:9.3f}s  "
+                       f"{job.tool_name}")
+
+    def do_wait(self, command):
+        """Wait for background jobs and show their results."""
+        try:
+            job_ids = [int(job_id) for job_id in command[1:]] or None
+            jobs = self.jobs.wait(job_ids)
+        except (KeyError, ValueError):
+            self.error("Usage: wait [<job id> ...]")
+            return None
+        results = {}
+        for job in jobs:
+            label = f"[{job.id}] {job.tool_name}"
+            if job.status == "done" and job.streamed:
+                summary = job.result()
+                spool = summary.get('spool')
+                if spool is None:
+                    for record in summary['tail']:
+                        self.write_record(record)
+                    if len(summary['tail']) < summary['records']:
+                        self.write(f"Last {len(summary['tail'])} record(s) "
+                                   f"shown.")
+                results[job.id] = self.show_summary(label, summary, spool)
+            elif job.status == "done":
+                results[job.id] = self.show_result(
+                    label, self.loaded_tools[job.tool_name], job.result())
+            elif job.status == "failed":
+                self.error(f"[{job.id}] Error from '{job.tool_name}': "
+                           f"{job.future.exception()}")
+            else:
+                self.write(f"[{job.id}] '{job.tool_name}' was cancelled.")
+        self.jobs.forget([job.id for job in jobs])
+        return results
+
+    def parse_pipeline(self, command):
+        """
+        Builds a pipeline from the words of a pipe command.
+
+        :param command: Command words, 'pipe <tool> [<input>=<output> ...]
+            | <tool> ...'
+        :return: Pipeline of the loaded tools
+        :raises PipelineError: If a stage is malformed or not loaded
+        """
+        stages = []
+        words = command[1:]
+        while words:
+            try:
+                end = words.index("|")
+            except ValueError:
+                end = len(words)
+            spec, words = words[:end], words[end + 1:]
+            if not spec:
+                raise PipelineError("Empty pipeline stage.")
+            tool_name = spec[0]
+            if tool_name not in self.loaded_tools:
+                raise PipelineError(
+                    f"Tool '{tool_name}' is not loaded. "
+                    f"Use 'load {tool_name}' first."
+                )
+            mapping = {}
+            for pair in spec[1:]:
+                input_name, _, output_name = pair.partition("=")
+                if not input_name or not output_name:
+                    raise PipelineError(
+                        f"Invalid mapping '{pair}', expected "
+                        f"<input>=<output>.")
+                mapping[input_name] = output_name
+            stages.append(
+                Stage(tool_name, self.loaded_tools[tool_name], mapping))
+        return Pipeline(stages)
+
+    def do_pipe(self, command):
+        """
+        Run loaded tools as a linear pipeline, each stage fed by the
+        previous one. Stages run copies of the tools, whose inputs are left
+        as they were, and their runs are not recorded in the history.
+        Outputs are connected to inputs of the same name, or as mapped with
+        '<input>=<output>'. The last stage's records are printed, or
+        appended to a file with '--spool <file>', or rendered with
+        '--format <format>' and '--out <file>', followed by the metrics of
+        every stage.
+        """
+        try:
+            command, options = split_options(command, RUN_OPTIONS)
+            check_export_options(options)
+        except ValueError as e:
+            self.error(e)
+            return None
+        if len(command) < 2:
+            self.error("Usage: pipe <tool> [<input>=<output> ...] | <tool> "
+                       "... [--spool <file>] [--format <format>] "
+                       "[--out <file>]")
+            return None
+        try:
+            pipeline = self.parse_pipeline(command)
+        except PipelineError as e:
+            self.error(e)
+            return None
+        last = pipeline.stages[-1]
+        spool = options.get('spool')
+        out = options.get('out')
+        on_record = None if spool else self.write_record
+        serializer = None
+        if out is not None or 'format' in options:
+            serializer_class = get_serializer(options.get('format', "ndjson"))
+            if out is not None:
+                serializer = serializer_class.open(out)
+            else:
+                serializer = serializer_class(self.out or sys.stdout)
+            on_record = serializer.write
+        try:
+            summary = drain(
+                last.tool, pipeline.run(),
+                on_record=on_record,
+                spool=spool,
+                tail_size=last.tool.output_tail_size
+            )
+        except PipelineError as e:
+            self.error(e)
+            return None
+        finally:
+            if serializer is not None:
+                serializer.close()
+        where = f" spooled to '{spool}'" if spool else ""
+        if out is not None:
+            where += f" written to '{out}' as {serializer_class.name}"
+        self.write(f"Result from pipeline: {summary['records']} record(s)"
+                   f"{where} in {pipeline.elapsed:.3f}s.")
+        for metrics in pipeline.metrics():
+            self.write(
+                f"  {metrics['stage']}: in={metrics['items_in']} "
+                f"out={metrics['items_out']} runs={metrics['runs']} "
+                f"busy={metrics['busy_seconds']:.3f}s "
+                f"max_queue={metrics['max_queue_depth']}"
+            )
+        summary['metrics'] = pipeline.metrics()
+        return summary
+
+    def do_exit(self, command):
+        """Stop the command loop, cancelling any running jobs."""
+        running = self.jobs.running()
+        if running:
+            self.write(f"Cancelling {len(running)} running job(s).")
+        self.jobs.shutdown()
+        self.write("Exiting Swiss Army Knife application.")
+        self.running = False
+
+    def do_help(self, command):
+        """List the available commands."""
+        self.write("Available commands:")
+        for name in sorted(self.commands):
+            self.write(f"  - {name}")
+        self.write("Commands for a loaded tool: <tool> "
+                   f"{'|'.join(sorted(self.tool_commands))}")
+
+    def do_cache(self, command):
+        """Show the counters of, or clear, the response caches."""
+        action = command[1] if len(command) > 1 else "stats"
+        names = command[2:] or sorted(CACHES)
+        unknown = [name for name in names if name not in CACHES]
+        if unknown:
+            self.error(f"Unknown cache: {', '.join(unknown)}. "
+                       f"Available caches: {', '.join(sorted(CACHES))}.")
+            return None
+        if action == "stats":
+            stats = {name: CACHES[name].stats() for name in names}
+            if not stats:
+                self.write("No caches are in use.")
+            for name, counters in stats.items():
+                self.write(f"Cache '{name}':", ", ".join(
+                    f"{counter}={value}" for counter, value in counters.items()
+                ))
+            return stats
+        if action == "clear":
+            for name in names:
+                CACHES[name].clear()
+                self.write(f"Cache '{name}' cleared.")
+            return None
+        self.error("Usage: cache stats|clear [<cache> ...]")
+        return None
+
+    def do_limits(self, command):
+        """Show the counters of the rate limiters of remote APIs."""
+        if len(command) > 1:
+            self.error("Usage: limits")
+            return None
+        stats = {limiter.name: limiter.stats()
+                 for limiter in list(LIMITERS.values())}
+        if not stats:
+            self.write("No rate limiters are in use.")
+        for name, counters in stats.items():
+            self.write(f"Limiter '{name}':", ", ".join(
+                f"{counter}={value}" for counter, value in counters.items()
+            ))
+        return stats
+
+    def do_stats(self, command):
+        """
+        Show the timing metrics of the tool lifecycle phases.
+        'stats json' and 'stats prometheus' export them, 'stats reset'
+        drops them and 'stats memory on|off' traces allocations.
+        """
+        action = command[1] if len(command) > 1 else "table"
+        if action == "json":
+            self.write(INSTRUMENTATION.to_json())
+        elif action == "prometheus":
+            self.write(INSTRUMENTATION.to_prometheus().rstrip("\n"))
+        elif action == "reset":
+            INSTRUMENTATION.reset()
+            self.write("Statistics reset.")
+            return None
+        elif action == "memory" and len(command) == 3 \
+                and command[2] in ("on", "off"):
+            trace_allocations(command[2] == "on")
+            self.write(f"Allocation tracing {command[2]}.")
+            return None
+        elif action == "table":
+            rows = INSTRUMENTATION.snapshot()
+            if not rows:
+                self.write("No statistics recorded.")
+            for row in rows:
+                self.write(
+                    f"{row['phase']:<11} {row['tool']:<20} "
+                    f"calls={row['calls']} errors={row['errors']} "
+                    f"wall={row['wall_seconds']:.6f}s "
+                    f"max={row['wall_max_seconds']:.6f}s "
+                    f"cpu={row['cpu_seconds']:.6f}s "
+                    f"alloc={row['alloc_bytes']} "
+                    f"peak={row['alloc_peak_bytes']}"
+                )
+        else:
+            self.error(
+                "Usage: stats [json|prometheus|reset|memory on|off]")
+            return None
+        return INSTRUMENTATION.snapshot()
+
+    def do_profile(self, command):
+        """
+        Run a loaded tool under cProfile and tracemalloc and show where its
+        time and memory went. The run happens in this process and bypasses
+        the memo cache, so the tool's own work is profiled.
+        """
+        try:
+            command, options = split_options(command, PROFILE_OPTIONS)
+            limit = int(options.get('limit', 20))
+        except ValueError as e:
+            self.error(e)
+            return None
+        if len(command) != 3 or command[2] != "run":
+            self.error("Usage: profile <tool> run [--sort <key>] "
+                       "[--limit <n>] [--out <file>]")
+            return None
+        tool_name = command[1]
+        if tool_name not in self.loaded_tools:
+            self.error(f"Tool '{tool_name}' is not loaded. "
+                       f"Use 'load {tool_name}' first.")
+            return None
+        sort = options.get('sort', "cumulative")
+        if sort not in profile_sort_keys():
+            self.error(f"Unknown sort key '{sort}'. Available keys: "
+                       f"{', '.join(profile_sort_keys())}.")
+            return None
+        tool_instance = self.loaded_tools[tool_name]
+
+        def run():
+            result = tool_instance.run()
+            if not is_stream(result):
+                return self.show_result(tool_name, tool_instance, result)
+            # Drained in this thread: prefetching would produce the records
+            # on a thread the profiler does not see
+            return self.show_summary(tool_name, drain(
+                tool_instance, result, on_record=self.write_record,
+                tail_size=tool_instance.output_tail_size))
+
+        try:
+            result, report, profiler = profile(run, sort=sort, limit=limit)
+        except Exception as e:  # pylint: disable=broad-except
+            self.error(f"Error from '{tool_name}': {e}")
+            return None
+        self.write(report.rstrip("\n"))
+        if options.get('out'):
+            profiler.dump_stats(options['out'])
+            self.write(f"Profile written to '{options['out']}'.")
+        return result
+
+    def do_history(self, command):
+        """
+        Query the history of tool runs.
+        'history query' lists runs, most recent first, a page at a time;
+        the next page starts '--after' the last run shown. 'history show'
+        prints a run and its output records, 'history stats' the counters
+        of the history writer and 'history clear' deletes every run.
+        """
+        usage = ("Usage: history query [--tool <name>] [--status <status>] "
+                 "[--inputs <hash>] [--since <date>] [--after <run id>] "
+                 "[--limit <n>] | history show <run id> [--limit <n>] | "
+                 "history stats | history clear")
+        try:
+            command, options = split_options(command, HISTORY_OPTIONS)
+            limit = int(options.get('limit', 20))
+            after = int(options['after']) if 'after' in options else None
+            since = datetime.datetime.fromisoformat(
+                options['since']).timestamp() if 'since' in options else None
+        except ValueError as e:
+            self.error(e)
+            return None
+        action = command[1] if len(command) > 1 else "query"
+        try:
+            if action == "query" and len(command) <= 2:
+                return self.show_history(options, since, after, limit)
+            if action == "show" and len(command) == 3:
+                return self.show_run(int(command[2]), limit)
+        except ValueError as e:
+            self.error(e)
+            return None
+        except sqlite3.Error as e:
+            self.error(f"Error reading the history: {e}")
+            return None
+        if action == "stats" and len(command) == 2:
+            stats = history.HISTORY.stats()
+            self.write("History:", ", ".join(
+                f"{counter}={value}" for counter, value in stats.items()))
+            return stats
+        if action == "clear" and len(command) == 2:
+            history.HISTORY.clear()
+            self.write("History cleared.")
+            return None
+        self.error(usage)
+        return None
+
+    def show_history(self, options, since, after, limit):
+        """Write a page of the run history and return its runs."""
+        runs = history.HISTORY.query(
+            tool=options.get('tool'), status=options.get('status'),
+            inputs=options.get('inputs'), since=since, after=after,
+            limit=limit)
+        if not runs:
+            self.write("No runs found.")
+            return runs
+        for run in runs:
+            started = datetime.datetime.fromtimestamp(run['started_at'])
+            self.write(
+                f"{run['id']:>6} {started:%Y-%m-%d %H:%M:%S} "
+                f"{run['tool']:<20} {run['status']:<10} "
+                f"wall={run['wall_seconds']:.6f}s "
+                f"records={run['records']} size={run['output_size']} "
+                f"inputs={run['inputs_hash'][:12]}"
+            )
+        if len(runs) == limit:
+            words = [f"--{name} {value}" for name, value in options.items()
+                     if name != 'after']
+            self.write("Next page: " + " ".join(
+                ["history query"] + words + [f"--after {runs[-1]['id']}"]))
+        return runs
+
+    def show_run(self, run_id, limit):
+        """Write a run and the first records of its output."""
+        run = history.HISTORY.get(run_id)
+        if run is None:
+            self.error(f"No run with id {run_id}.")
+            return None
+        for column, value in run.items():
+            self.write(f"{column}: {value}")
+        shown = 0
+        for record in history.HISTORY.iter_output(run_id):
+            if shown == limit:
+                self.write(f"... {run['records'] - shown} more record(s).")
+                break
+            self.write_record(record)
+            shown += 1
+        return run
+
+    def do_tool_get(self, tool_instance, command):
+        """Show a tool's inputs, configuration or outputs."""
+        if len(command) < 3:
+            self.error("Usage: <tool> get inputs|configs|outputs")
+        elif command[2] == "inputs":
+            self.write("Required inputs:",
+                       list(tool_instance.required_inputs))
+            self.write("Optional inputs:",
+                       list(tool_instance.optional_inputs))
+            self.write("Values:", tool_instance.input_values)
+        elif command[2].startswith("config"):
+            self.write(
+                f"Configuration for '{tool_instance.name}': "
+                f"{tool_instance.configurations}"
+            )
+        elif command[2] == "outputs":
+            self.write("Outputs:", tool_instance.output_values)
+        else:
+            self.error(f"Unknown input type: {command[2]}. "
+                       f"Available inputs: inputs, configs.")
+
+    def do_tool_info(self, tool_instance, command):
+        """Show the metadata of a loaded tool."""
+        self.write(f"Tool Name: {tool_instance.name}")
+        self.write(f"Description: {tool_instance.description}")
+        self.write(f"Version: {tool_instance.version}")
+        self.write(f"Author: {tool_instance.author}")
+        self.write("Required Inputs:", list(tool_instance.required_inputs))
+        self.write("Optional Inputs:", list(tool_instance.optional_inputs))
+        self.write("Configuration Parameters:",
+                   list(tool_instance.configuration_parameters))
+        self.write("Credentials Required:",
+                   tool_instance.credentials_required)
+        self.write("API Key Required:", tool_instance.api_key_required)
+
+    def do_tool_run(self, tool_instance, command):
+        """Run a loaded tool, in the background if followed by '&'."""
+        try:
+            command, options = split_options(command, RUN_OPTIONS)
+            check_export_options(options)
+        except ValueError as e:
+            self.error(e)
+            return None
+        if command[-1] == "&":
+            return self.start_job(command[0], options.get('spool'))
+        return self.run_one(tool_instance.name, tool_instance, options)
+
+    def do_tool_save(self, tool_instance, command):
+        """Save a tool's configuration or credentials."""
+        if len(command) < 3:
+            self.error("Usage: <tool> save configs|credentials")
+        elif command[2].startswith("config"):
+            tool_instance.save_configuration()
+            self.write(f"Configuration for '{tool_instance.name}' saved.")
+        elif command[2] == "credentials":
+            try:
+                tool_instance.save_credentials()
+            except ValueError as e:
+                self.error(e)
+                return
+            self.write(f"Credentials for '{tool_instance.name}' saved.")
+        else:
+            self.error(f"Unknown save type: {command[2]}. "
+                       f"Available types: configs.")
+
+    def do_tool_load(self, tool_instance, command):
+        """Load a tool's configuration or credentials."""
+        if len(command) < 3:
+            self.error("Usage: <tool> load configs|credentials")
+        elif command[2].startswith("config"):
+            tool_instance.load_configuration()
+            self.write(f"Configuration for '{tool_instance.name}' loaded.")
+        elif command[2] == "credentials":
+            try:
+                tool_instance.load_credentials()
+            except ValueError as e:
+                self.error(e)
+                return
+            self.write(f"Credentials for '{tool_instance.name}' loaded.")
+        else:
+            self.error(f"Unknown load type: {command[2]}. "
+                       f"Available types: configs.")
+
+    def do_tool_set(self, tool_instance, command):
+        """Set an input, the API key or the credentials of a tool."""
+        if len(command) > 2 and command[2] == "help":
+            self.write("Available commands:")
+            self.write("  - api_key: Set the API key for the tool.")
+            self.write("  - credentials: Set the credentials for the tool:"
+                       f"  {tool_instance} set <username> <password>")
+            self.write("  - <input_name>: Set the value for a specific input.")
+            return
+        if len(command) < 4:
+            self.error("Usage: <tool> set <input_name> <value>")
+            return
+        input_name = command[2]
+        value = " ".join(command[3:])
+        if input_name == "api_key":
+            try:
+                tool_instance.set_api_key(value)
+                self.write(f"API key set to '{value}'.")
+            except ValueError as e:
+                self.error(e)
+        elif input_name == "credentials":
+            if len(command) < 5:
+                self.error("Usage: <tool> set credentials "
+                           "<username> <password>")
+                return
+            credentials = {
+                'username': command[3],
+                'password': command[4]
+            }
+            try:
+                tool_instance.add_credentials(**credentials)
+                self.write(
+                    f"Credentials added for '{credentials['username']}'."
+                )
+            except ValueError as e:
+                self.error(e)
+        else:
+            try:
+                tool_instance.set_input_value(input_name, value)
+                self.completion.value_set(command[0], input_name, value)
+                self.write(f"Input '{input_name}' set to '{value}'.")
+            except ValueError as e:
+                self.error(e)
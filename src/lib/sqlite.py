@@ -2,30 +2,184 @@
 A simple SQLite database interface for Python developers.
 This module provides basic functionality to connect to a SQLite database,
 execute queries, and manage data.
+Connections are long-lived: each thread keeps one connection per database
+file, opened in WAL mode with tuned pragmas and a prepared statement cache,
+and Database objects borrow it instead of reconnecting. A thread's
+connections are closed when the thread exits.
 """
 
+import atexit
+import os
 import sqlite3
+import threading
+import weakref
+
+
+# Pragmas applied to every new connection
+DEFAULT_PRAGMAS = (
+    ("journal_mode", "WAL"),
+    ("synchronous", "NORMAL"),
+    ("temp_store", "MEMORY"),
+    ("cache_size", -8000),
+    ("busy_timeout", 5000),
+)
+# Number of prepared statements each connection keeps cached
+STATEMENT_CACHE_SIZE = 256
+
+_local = threading.local()
+# Every open pooled connection -> the absolute path of its database
+_connections = {}
+# Absolute database path -> number of times its connections were closed;
+# a thread's cached connection from an older generation is not reused
+_generations = {}
+_connections_lock = threading.Lock()
+
+
+def open_connection(db_path):
+    """Open a new connection to a database with the default pragmas.
+    :param db_path: Path to the SQLite database file
+    :return: sqlite3.Connection
+    """
+    connection = sqlite3.connect(
+        db_path,
+        cached_statements=STATEMENT_CACHE_SIZE,
+        # Pooled connections are only used by the thread that opened them,
+        # but close_all() and thread exit may close them on another thread.
+        check_same_thread=False,
+    )
+    for pragma, value in DEFAULT_PRAGMAS:
+        connection.execute(f"PRAGMA {pragma} = {value}")
+    return connection
+
+
+def _release(connections):
+    """Close the connections a thread cached, once the thread is gone."""
+    with _connections_lock:
+        for connection, _ in connections.values():
+            _connections.pop(connection, None)
+    for connection, _ in connections.values():
+        try:
+            connection.close()
+        except sqlite3.Error:
+            pass
+    connections.clear()
+
+
+class _Pool:
+    """The connections cached by one thread."""
+
+    __slots__ = ('connections', '__weakref__')
+
+    def __init__(self):
+        # Absolute database path -> (connection, generation)
+        self.connections = {}
+        # A thread's locals are dropped when it exits, and with them the
+        # pool, so short-lived threads do not leave connections open
+        weakref.finalize(self, _release, self.connections)
+
+
+def pooled_connection(db_path):
+    """Return the calling thread's connection to a database.
+    The connection is opened on first use and reused afterwards, until it
+    is closed by close_all() or close_database() or its thread exits.
+    :param db_path: Path to the SQLite database file
+    :return: sqlite3.Connection
+    """
+    pool = getattr(_local, 'pool', None)
+    if pool is None:
+        pool = _local.pool = _Pool()
+    key = os.path.abspath(db_path)
+    generation = _generations.get(key, 0)
+    entry = pool.connections.get(key)
+    if entry is not None and entry[1] == generation:
+        return entry[0]
+    connection = open_connection(db_path)
+    with _connections_lock:
+        _connections[connection] = key
+    pool.connections[key] = (connection, generation)
+    return connection
+
+
+def _close(keys=None):
+    """Close the pooled connections to some databases, or to all of them."""
+    with _connections_lock:
+        connections = [connection for connection, key in _connections.items()
+                       if keys is None or key in keys]
+        for connection in connections:
+            key = _connections.pop(connection)
+            _generations[key] = _generations.get(key, 0) + 1
+    for connection in connections:
+        try:
+            connection.close()
+        except sqlite3.Error:
+            pass
+
+
+def close_database(db_path):
+    """Close every pooled connection to one database, in all threads."""
+    _close({os.path.abspath(db_path)})
+
+
+def close_all():
+    """Close every pooled connection, in all threads."""
+    _close()
+
+
+def open_connections():
+    """Return the number of pooled connections that are open."""
+    with _connections_lock:
+        return len(_connections)
+
+
+atexit.register(close_all)
 
 
 class Database:
     """A simple SQLite database interface."""
 
-    def __init__(self, db_path):
+    def __init__(self, db_path, pooled=True):
+        """
+        :param db_path: Path to the SQLite database file
+        :param pooled: Borrow the thread's long-lived connection rather than
+            opening and closing a private one
+        """
         self.db_path = db_path
+        self.pooled = pooled and db_path != ":memory:"
         self.connection = None
 
     def connect(self):
         """Establish a connection to the SQLite database.
         If the connection already exists, it will be reused.
         """
-        self.connection = sqlite3.connect(self.db_path)
+        if self.connection:
+            return
+        if self.pooled:
+            self.connection = pooled_connection(self.db_path)
+        else:
+            self.connection = open_connection(self.db_path)
 
     def close(self):
-        """Close the database connection if it exists."""
+        """Close the database connection if it exists.
+        Pooled connections are released back to the pool, not closed.
+        """
         if self.connection:
-            self.connection.close()
+            if not self.pooled:
+                self.connection.close()
             self.connection = None
 
+    def __enter__(self):
+        self.connect()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if exc_type is None:
+                self.commit()
+            elif self.connection:
+                self.connection.rollback()
+        finally:
+            self.close()
+
     def execute_query(self, query, params=None):
         """Execute a SQL query and return the results.
         :param query: SQL query to execute
@@ -34,9 +188,27 @@ class Database:
         """
         if not self.connection:
             raise RuntimeError("Database connection is not established.")
-        cursor = self.connection.cursor()
-        cursor.execute(query, params or [])
-        return cursor.fetchall()
+        return self.connection.execute(query, params or []).fetchall()
+
+    def execute_update(self, query, params=None):
+        """Execute a data-modifying SQL statement.
+        :param query: SQL statement to execute
+        :param params: Optional parameters for the statement
+        :return: Number of rows changed by the statement
+        """
+        if not self.connection:
+            raise RuntimeError("Database connection is not established.")
+        return self.connection.execute(query, params or []).rowcount
+
+    def execute_many(self, query, params_seq):
+        """Execute a SQL statement once for every set of parameters.
+        :param query: SQL statement to execute
+        :param params_seq: Iterable of parameter tuples
+        :return: Number of rows changed
+        """
+        if not self.connection:
+            raise RuntimeError("Database connection is not established.")
+        return self.connection.executemany(query, params_seq).rowcount
 
     def query_table(self, table_name, columns='*', where=None):
         """Query a table in the database.
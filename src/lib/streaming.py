@@ -0,0 +1,121 @@
+"""src/lib/streaming.py
+Incremental consumption of tool outputs.
+A tool's run method may return an iterator, typically by being a generator,
+that yields output records one at a time. Records are handed on as they are
+produced and only a bounded tail of them is kept on the tool, so memory use
+does not grow with the size of the output.
+"""
+
+import collections
+import collections.abc
+import queue
+import threading
+import types
+
+from src.lib.serializers import dumps
+
+
+# Number of records kept in a tool's output_values after a streamed run
+DEFAULT_TAIL_SIZE = 100
+# Number of records the producer may run ahead of the consumer
+DEFAULT_QUEUE_SIZE = 1000
+
+_END = object()
+
+
+def is_stream(result):
+    """Return True if a run result is a stream of records."""
+    return isinstance(result, (types.GeneratorType, collections.abc.Iterator))
+
+
+class _Failure:
+    """An exception raised by the producer, passed to the consumer."""
+
+    def __init__(self, error):
+        self.error = error
+
+
+def prefetch(records, maxsize=DEFAULT_QUEUE_SIZE):
+    """
+    Yields records produced by a background thread.
+    The producer runs ahead of the consumer by at most maxsize records and
+    blocks when the queue is full, so a slow consumer applies backpressure
+    instead of letting records pile up in memory.
+
+    :param records: Iterable of records
+    :param maxsize: Bound of the queue between producer and consumer
+    """
+    buffer = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+
+    def produce():
+        try:
+            for record in records:
+                if stop.is_set():
+                    return
+                buffer.put(record)
+        except Exception as e:  # pylint: disable=broad-except
+            buffer.put(_Failure(e))
+            return
+        buffer.put(_END)
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    try:
+        while True:
+            record = buffer.get()
+            if record is _END:
+                return
+            if isinstance(record, _Failure):
+                raise record.error
+            yield record
+    finally:
+        stop.set()
+        # Unblock a producer waiting on a full queue
+        while producer.is_alive():
+            try:
+                buffer.get_nowait()
+            except queue.Empty:
+                producer.join(0.01)
+
+
+def write_record(stream, record):
+    """Write a record to a text stream as one compact JSON line."""
+    stream.write(dumps(record))
+    stream.write("\n")
+
+
+def drain(tool, records, on_record=None, spool=None,
+          tail_size=DEFAULT_TAIL_SIZE):
+    """
+    Consumes a stream of records produced by a tool run.
+    Each record is passed to on_record and/or written to the spool file as
+    it arrives. Afterwards the tool's output_values hold the number of
+    records and the last tail_size of them.
+
+    :param tool: Tool that produced the records
+    :param records: Iterable of records
+    :param on_record: Optional callable receiving each record
+    :param spool: Optional path of a file to append records to as JSON lines
+    :param tail_size: Number of records to keep on the tool
+    :return: Summary dictionary with the record count and the tail
+    """
+    tail = collections.deque(maxlen=tail_size)
+    count = 0
+    spool_file = open(spool, "a", encoding="utf-8") if spool else None
+    try:
+        for record in records:
+            count += 1
+            tail.append(record)
+            if on_record is not None:
+                on_record(record)
+            if spool_file is not None:
+                write_record(spool_file, record)
+    finally:
+        if spool_file is not None:
+            spool_file.close()
+    summary = {'records': count, 'tail': list(tail)}
+    if spool:
+        summary['spool'] = spool
+    tool.output_values = summary
+    return summary
@@ -2,36 +2,206 @@
 Define a class representing a tool with metadata, including inputs and outputs.
 """
 
+import copy
 
-import keyring
-
+from src.lib.credentials import CREDENTIALS
+from src.lib.executors import get_executor
+from src.lib.instrumentation import timed, timed_each
+from src.lib.migrations import ensure_schema
 from src.lib.sqlite import Database
+from src.lib.streaming import DEFAULT_TAIL_SIZE
+
+
+DB_PATH = "dbs/tools.db"
+# Upper bound on the number of tool names bound to one IN (...) query
+_MAX_QUERY_VARIABLES = 500
+
+
+class ToolSpec:
+    """
+    The immutable metadata of a tool.
+    A spec is shared by every instance of a tool class. Input, output and
+    parameter names are kept in declaration order as tuples and as
+    frozensets for constant-time validation. Specs derived from one with
+    derive() are remembered, so tools building their metadata field by
+    field in __init__ end up sharing specs as well.
+    """
+
+    __slots__ = (
+        'name', 'description', 'version', 'author',
+        'required_inputs', 'optional_inputs', 'outputs',
+        'configuration_parameters', 'credentials_required',
+        'api_key_required', 'inputs', 'output_names', 'parameter_names',
+        '_derived',
+    )
+
+    # Fields accepted by the constructor and replace()
+    FIELDS = __slots__[:10]
+
+    def __init__(self, name, description="", version="", author="",
+                 required_inputs=(), optional_inputs=(), outputs=(),
+                 configuration_parameters=(), credentials_required=False,
+                 api_key_required=False):
+        """
+        :param name: Name of the tool
+        :param description: Description of the tool
+        :param version: Version of the tool, part of its memo keys
+        :param author: Author of the tool
+        :param required_inputs: Names of the required inputs
+        :param optional_inputs: Names of the optional inputs
+        :param outputs: Names of the outputs
+        :param configuration_parameters: Names of the configuration
+            parameters
+        :param credentials_required: Are credentials required for the tool?
+        :param api_key_required: Is an API key required for the tool?
+        """
+        values = {
+            'name': name,
+            'description': description,
+            'version': version,
+            'author': author,
+            'required_inputs': tuple(required_inputs),
+            'optional_inputs': tuple(optional_inputs),
+            'outputs': tuple(outputs),
+            'configuration_parameters': tuple(configuration_parameters),
+            'credentials_required': bool(credentials_required),
+            'api_key_required': bool(api_key_required),
+        }
+        values['inputs'] = frozenset(
+            values['required_inputs'] + values['optional_inputs'])
+        values['output_names'] = frozenset(values['outputs'])
+        values['parameter_names'] = frozenset(
+            values['configuration_parameters'])
+        # (field, value) -> spec derived from this one
+        values['_derived'] = {}
+        for field, value in values.items():
+            object.__setattr__(self, field, value)
+
+    def __setattr__(self, field, value):
+        raise AttributeError("ToolSpec is immutable, use replace().")
+
+    def __delattr__(self, field):
+        raise AttributeError("ToolSpec is immutable, use replace().")
+
+    def replace(self, **changes):
+        """Return a copy of the spec with some fields changed."""
+        values = {field: getattr(self, field) for field in self.FIELDS}
+        values.update(changes)
+        return ToolSpec(**values)
+
+    def derive(self, field, value):
+        """
+        Return the spec with one field changed, reusing the spec returned
+        by an earlier call with the same arguments.
+        """
+        key = (field, value)
+        spec = self._derived.get(key)
+        if spec is None:
+            spec = self._derived[key] = self.replace(**{field: value})
+        return spec
+
+    def append(self, field, name):
+        """Return the spec with a name added to one of its tuples."""
+        return self.derive(field, getattr(self, field) + (name,))
+
+    def __eq__(self, other):
+        if not isinstance(other, ToolSpec):
+            return NotImplemented
+        return all(getattr(self, field) == getattr(other, field)
+                   for field in self.FIELDS)
+
+    def __hash__(self):
+        return hash(tuple(getattr(self, field) for field in self.FIELDS))
+
+    def __repr__(self):
+        return "ToolSpec(" + ", ".join(
+            f"{field}={getattr(self, field)!r}" for field in self.FIELDS
+        ) + ")"
+
+
+# Base of the specs of tools without a class-level tool_spec
+_EMPTY_SPEC = ToolSpec(None, None, None, None)
+
+
+def _spec_field(field, doc):
+    """Return a property reading a field of the tool's spec."""
+    return property(lambda self: getattr(self._spec, field), doc=doc)
+
+
+def _spec_flag(field, doc):
+    """Return a property for a flag of the tool's spec, settable on the
+    instance by replacing its spec."""
+    def set_flag(self, value):
+        self._spec = self._spec.derive(field, bool(value))
+    return property(lambda self: getattr(self._spec, field), set_flag,
+                    doc=doc)
 
 
 class Tool:
     """
     A class representing a tool with metadata.
+    Tool classes declare their metadata once, as a ToolSpec in the
+    tool_spec class attribute, and every instance shares it. The add_*
+    methods still work: they give the instance a modified copy of the spec.
     """
 
-    def __init__(self, name, description, version, author):
-        self.name = name
-        self.description = description
-        self.version = version
-        self.author = author
-        self.required_inputs = []  # List of required inputs for the tool
-        self.optional_inputs = []  # List of optional inputs for the tool
-        self.outputs = []  # List of outputs produced by the tool
+    __slots__ = ('_spec', 'input_values', 'output_values', 'configurations',
+                 'credentials')
+
+    # Metadata shared by every instance of the class
+    tool_spec = None
+    # Backend the tool runs on, see src.lib.executors. CPU-bound tools set
+    # this to "process" to run in a worker process, which sends the result
+    # back whole: tools that stream their result must stay on "thread".
+    executor = "thread"
+    # Number of records kept in output_values when run yields a stream
+    output_tail_size = DEFAULT_TAIL_SIZE
+    # Set by tools whose result depends only on their inputs and
+    # configuration, so repeat runs are served from src.lib.memo
+    deterministic = False
+
+    def __init__(self, name=None, description=None, version=None,
+                 author=None):
+        """
+        :param name: Name of the tool, overriding the class's tool_spec
+        :param description: Description of the tool, likewise
+        :param version: Version of the tool, likewise
+        :param author: Author of the tool, likewise
+        """
+        spec = type(self).tool_spec or _EMPTY_SPEC
+        for field, value in (('name', name), ('description', description),
+                             ('version', version), ('author', author)):
+            if value is not None and getattr(spec, field) != value:
+                spec = spec.derive(field, value)
+        self._spec = spec
         self.input_values = {}  # Dictionary to hold input values
         self.output_values = {}  # Dictionary to hold output values
-        # List of configuration parameters for the tool
-        self.configuration_parameters = []
         # Dictionary to hold configurations for the tool
         self.configurations = {}
         # Dictionary to hold credentials for the tool
         self.credentials = {}
-        # Are credentials required for the tool?
-        self.credentials_required = False
-        self.api_key_required = False
+
+    @property
+    def spec(self):
+        """The ToolSpec of this instance."""
+        return self._spec
+
+    name = _spec_field('name', "Name of the tool")
+    description = _spec_field('description', "Description of the tool")
+    version = _spec_field('version', "Version of the tool")
+    author = _spec_field('author', "Author of the tool")
+    required_inputs = _spec_field(
+        'required_inputs', "Tuple of required inputs for the tool")
+    optional_inputs = _spec_field(
+        'optional_inputs', "Tuple of optional inputs for the tool")
+    outputs = _spec_field('outputs', "Tuple of outputs produced by the tool")
+    configuration_parameters = _spec_field(
+        'configuration_parameters',
+        "Tuple of configuration parameters for the tool")
+    credentials_required = _spec_flag(
+        'credentials_required', "Are credentials required for the tool?")
+    api_key_required = _spec_flag(
+        'api_key_required', "Is an API key required for the tool?")
 
     def add_required_input(self, input_name):
         """
@@ -39,7 +209,7 @@ class Tool:
 
         :param input_name: Name of the required input
         """
-        self.required_inputs.append(input_name)
+        self._spec = self._spec.append('required_inputs', input_name)
 
     def add_optional_input(self, input_name):
         """
@@ -47,13 +217,13 @@ class Tool:
 
         :param input_name: Name of the optional input
         """
-        self.optional_inputs.append(input_name)
+        self._spec = self._spec.append('optional_inputs', input_name)
 
     def add_output(self, output_name):
         """
         Adds an output to the tool.
         """
-        self.outputs.append(output_name)
+        self._spec = self._spec.append('outputs', output_name)
 
     def set_input_value(self, input_name, value):
         """
@@ -62,10 +232,7 @@ class Tool:
         :param input_name: Name of the input
         :param value: Value to set for the input
         """
-        if (
-            input_name in self.required_inputs
-            or input_name in self.optional_inputs
-        ):
+        if input_name in self._spec.inputs:
             self.input_values[input_name] = value
         else:
             raise ValueError(
@@ -78,7 +245,7 @@ class Tool:
         :param output_name: Name of the output
         :param value: Value to set for the output
         """
-        if output_name in self.outputs:
+        if output_name in self._spec.output_names:
             self.output_values[output_name] = value
         else:
             raise ValueError(
@@ -90,7 +257,8 @@ class Tool:
 
         :param parameter_name: Name of the configuration parameter
         """
-        self.configuration_parameters.append(parameter_name)
+        self._spec = self._spec.append(
+            'configuration_parameters', parameter_name)
 
     def set_configuration(self, parameter_name, value):
         """
@@ -99,7 +267,7 @@ class Tool:
         :param parameter_name: Name of the configuration parameter
         :param value: Value to set for the configuration
         """
-        if parameter_name in self.configuration_parameters:
+        if parameter_name in self._spec.parameter_names:
             self.configurations[parameter_name] = (
                 value
             )
@@ -115,54 +283,42 @@ class Tool:
         This method can be overridden by subclasses to implement specific
         loading logic.
         """
-        db = Database("dbs/tools.db")
-        db.connect()
-        try:
-            for param in self.configuration_parameters:
-                query = (
-                    "SELECT value FROM configurations "
-                    "WHERE tool-name = ? AND parameter = ?"
-                )
-                result = db.execute_query(query, (self.name, param))
-                if result:
-                    self.configurations[param] = result[0][0]
-        finally:
-            db.close()
+        load_all_configurations([self])
 
     def save_configuration(self):
         """
         Saves the configuration for the tool.
+        All parameters are written in a single transaction.
         This method can be overridden by subclasses to implement specific
         saving logic.
         """
-        db = Database("dbs/tools.db")
-        db.connect()
-        try:
-            for param, value in self.configurations.items():
-                query = (
-                    "INSERT OR REPLACE INTO configurations "
-                    "(tool-name, parameter, value) VALUES (?, ?, ?)"
-                )
-                db.execute_query(query, (self.name, param, value))
-            db.commit()
-        finally:
-            db.close()
+        with timed("configure", self.name), Database(DB_PATH) as db:
+            ensure_schema(db)
+            db.execute_many(
+                "INSERT OR REPLACE INTO configurations "
+                "(tool_name, parameter, value) VALUES (?, ?, ?)",
+                [(self.name, param, value)
+                 for param, value in self.configurations.items()]
+            )
 
     def add_credentials(self, username, password):
         """
         Adds credentials for the tool.
+        The password is stored in the keyring and kept in the credential
+        cache.
 
         :param username: Username for the credentials
         :param password: Password for the credentials
         """
         self.credentials['username'] = username
-        keyring.set_password(
-            self.name, username, password
-        )
+        with timed("credentials", self.name):
+            CREDENTIALS.set(self.name, username, password)
 
     def get_credentials(self):
         """
         Retrieves credentials for the tool.
+        The keyring is only queried when the credential cache has no fresh
+        copy of the password.
 
         :param username: Username for which to retrieve the password
         :return: Password for the given username
@@ -170,20 +326,87 @@ class Tool:
         username = self.credentials.get('username')
         if not username:
             raise ValueError("No username set for credentials.")
-        # Retrieve the password from the keyring
-        self.credentials['password'] = keyring.get_password(
-            self.name, username
-        )
+        with timed("credentials", self.name):
+            self.credentials['password'] = CREDENTIALS.get(
+                self.name, username
+            )
         return self.credentials
 
+    def credential_key(self):
+        """
+        Returns the (service, username) pair of the tool's credentials.
+
+        :return: The pair, or None if no username is set
+        """
+        username = self.credentials.get('username')
+        return (self.name, username) if username else None
+
+    def load_credentials(self):
+        """Reloads the tool's credentials from the keyring."""
+        key = self.credential_key()
+        if key is None:
+            raise ValueError("No username set for credentials.")
+        CREDENTIALS.invalidate(*key)
+        return self.get_credentials()
+
+    def save_credentials(self):
+        """Stores the tool's current credentials in the keyring."""
+        if not self.credentials.get('username') \
+                or self.credentials.get('password') is None:
+            raise ValueError("No credentials set for this tool.")
+        self.add_credentials(
+            self.credentials['username'], self.credentials['password'])
+
     def run(self):
         """
         Runs the tool's main functionality.
         This method should be overridden by subclasses to implement specific
-        tool logic.
+        tool logic. It may return a single result, or yield output records
+        one at a time for outputs too large to hold in memory; tools that
+        yield records cannot run on the "process" executor.
         """
         raise NotImplementedError("Subclasses must implement the run method.")
 
+    async def run_async(self):
+        """
+        Runs the tool without blocking the event loop.
+        The default implementation runs the synchronous run method on the
+        tool's executor: the loop's default thread pool, or a worker process
+        for CPU-bound tools. I/O-bound subclasses can override it with a
+        native coroutine.
+
+        :return: The result of the run
+        """
+        return await get_executor(self.executor).run_async(self)
+
+    def cache_key(self):
+        """
+        Returns the key the result of the next run is memoized under.
+        Deterministic tools are keyed on their inputs and configuration;
+        tools can override this to memoize on a key of their own.
+
+        :return: JSON-serializable key, or None to run without memoizing
+        """
+        if not self.deterministic:
+            return None
+        return [self.input_values, self.configurations]
+
+    def clone(self):
+        """
+        Returns a copy of the tool that can be given inputs and run
+        independently of it. The copy shares the tool's spec and any other
+        state, such as API clients, but has its own inputs, outputs,
+        configuration and credentials.
+
+        :return: New instance of the tool's class
+        """
+        twin = copy.copy(self)
+        twin.input_values = dict(self.input_values)
+        twin.output_values = {}
+        twin.configurations = dict(self.configurations)
+        twin.credentials = dict(self.credentials)
+        return twin
+
     def get_outputs(self):
         """
         Returns the outputs produced by the tool.
@@ -199,3 +422,33 @@ class Tool:
             f"required_inputs={self.required_inputs}, "
             f"optional_inputs={self.optional_inputs}, outputs={self.outputs}"
         )
+
+
+def load_all_configurations(tools):
+    """
+    Loads the saved configuration of several tools with one query.
+
+    :param tools: Iterable of Tool instances
+    """
+    by_name = {}
+    for tool in tools:
+        if tool.configuration_parameters:
+            by_name.setdefault(tool.name, []).append(tool)
+    if not by_name:
+        return
+    names = list(by_name)
+    # Measured once for the whole batch, a share recorded for each tool
+    with timed_each("configure", names), Database(DB_PATH) as db:
+        ensure_schema(db)
+        for start in range(0, len(names), _MAX_QUERY_VARIABLES):
+            chunk = names[start:start + _MAX_QUERY_VARIABLES]
+            placeholders = ", ".join("?" * len(chunk))
+            rows = db.execute_query(
+                "SELECT tool_name, parameter, value FROM configurations "
+                f"WHERE tool_name IN ({placeholders})",
+                chunk
+            )
+            for tool_name, param, value in rows:
+                for tool in by_name[tool_name]:
+                    if param in tool.spec.parameter_names:
+                        tool.configurations[param] = value
@@ -0,0 +1,39 @@
+"""A CPU-bound example tool that computes an iterated hash chain."""
+
+import hashlib
+
+from src.lib.tool import Tool, ToolSpec
+
+
+class HashChainTool(Tool):
+    """A CPU-bound example tool that computes an iterated hash chain."""
+
+    __slots__ = ()
+
+    tool_spec = ToolSpec(
+        name="HashChain",
+        description=(
+            "Hashes the input data repeatedly, feeding each digest into "
+            "the next round."
+        ),
+        version="1.0.0",
+        author="Tony Steckman",
+        required_inputs=("data",),
+        optional_inputs=("rounds", "algorithm"),
+        outputs=("digest",),
+    )
+    executor = "process"
+    deterministic = True
+
+    def run(self):
+        """Execute the tool's main functionality."""
+        data = self.input_values.get("data")
+        if data is None:
+            raise ValueError("Data input is required.")
+        rounds = int(self.input_values.get("rounds", 100000))
+        algorithm = self.input_values.get("algorithm", "sha256")
+        digest = data.encode("utf-8")
+        for _ in range(rounds):
+            digest = hashlib.new(algorithm, digest).digest()
+        self.output_values['digest'] = digest.hex()
+        return self.output_values['digest']
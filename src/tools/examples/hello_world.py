@@ -1,20 +1,21 @@
 """A simple tool that prints 'Hello, World!'.   """
 
-from src.lib.tool import Tool
+from src.lib.tool import Tool, ToolSpec
 
 
 class HelloWorldTool(Tool):
     """A simple tool that prints 'Hello, World!'.   """
 
-    def __init__(self):
-        super().__init__(
-            name="HelloWorld",
-            description="A simple tool that prints 'Hello, World!'",
-            version="1.0.0",
-            author="Tony Steckman"
-        )
-        self.add_output("greeting")
-        self.add_optional_input("name")
+    __slots__ = ()
+
+    tool_spec = ToolSpec(
+        name="HelloWorld",
+        description="A simple tool that prints 'Hello, World!'",
+        version="1.0.0",
+        author="Tony Steckman",
+        optional_inputs=("name",),
+        outputs=("greeting",),
+    )
 
     def run(self):
         """Execute the tool's main functionality."""
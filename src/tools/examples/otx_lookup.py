@@ -1,12 +1,137 @@
 # pylint: disable=missing-module-docstring
-import json
+import os
+import sys
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import urlparse
 
 
-from OTXv2 import OTXv2  # type: ignore
-from OTXv2 import IndicatorTypes
+# OTXv2 and requests are imported when the tool first talks to OTX, so
+# loading the tool, or the shell listing it, does not pay for them.
+from src.lib import pulses
+from src.lib.cache import STALE, get_cache
+from src.lib.ratelimit import DEFAULT_MAX_RETRIES, check_status, get_limiter
+from src.lib.serializers import NDJSONSerializer
+from src.lib.tool import Tool, ToolSpec
 
 
-from src.lib.tool import Tool
+DEFAULT_SERVER = "https://otx.alienvault.com"
+DEFAULT_WORKERS = 8
+DEFAULT_MAX_PER_HOST = 8
+# Pulses requested per page while syncing the pulse index
+SYNC_PAGE_SIZE = 50
+# Refreshes stale cache entries for every OTXLookup tool and its clones.
+# Its threads are only started by the first refresh. _REFRESHING holds the
+# (indicator type, indicator, section) keys being refreshed, so that each
+# entry is refreshed once at a time.
+_REFRESH_POOL = ThreadPoolExecutor(max_workers=2,
+                                   thread_name_prefix="otx-refresh")
+_REFRESHING = set()
+_REFRESH_LOCK = threading.Lock()
+# OTX clients of this process by (API key, server, workers), shared by every
+# OTXLookup tool and its clones
+_CLIENTS = {}
+_CLIENTS_LOCK = threading.Lock()
+
+# Lookup modes: "online" looks every indicator up in OTX, "prefilter" looks
+# up only those in a synced pulse, "offline" only matches against the pulse
+# index and "sync" updates the index with the subscribed pulses.
+MODES = ("online", "prefilter", "offline", "sync")
+
+# Seconds each section of an indicator's details stays fresh in the cache
+SECTION_TTLS = {
+    "general": 3600,
+    "reputation": 3600,
+    "malware": 3600,
+    "url_list": 3600,
+    "passive_dns": 6 * 3600,
+    "http_scans": 24 * 3600,
+    "geo": 7 * 24 * 3600,
+    "whois": 7 * 24 * 3600,
+    "analysis": 7 * 24 * 3600,
+}
+
+# Indicator type -> name of the matching OTXv2.IndicatorTypes attribute
+INDICATOR_TYPES = {
+    "ip": "IPv4",
+    "domain": "DOMAIN",
+    "hostname": "HOSTNAME",
+    "url": "URL",
+    "file": "FILE_HASH_MD5"
+}
+
+
+def otx_indicator_type(indicator_type):
+    """
+    Returns the OTXv2 indicator type for one of the keys of INDICATOR_TYPES.
+
+    :raises ValueError: If the indicator type is unknown
+    """
+    name = INDICATOR_TYPES.get(indicator_type)
+    if name is None:
+        raise ValueError(
+            f"Unknown indicator type '{indicator_type}'. Available "
+            f"types: {', '.join(INDICATOR_TYPES)}.")
+    # pylint: disable=import-outside-toplevel
+    from OTXv2 import IndicatorTypes
+
+    return getattr(IndicatorTypes, name)
+
+
+def _check_response(response, *args, **kwargs):
+    """
+    Raises for throttled and failed responses of the OTX session, before
+    OTXv2 turns them into generic errors, so they keep their Retry-After.
+    """
+    if response.status_code >= 429:
+        # Read the body so the connection can be reused
+        _ = response.content
+        check_status(response.status_code, response.headers)
+    return response
+
+
+def _create_client(api_key, server, workers):
+    """Create an OTX client whose session is pooled for the workers."""
+    # pylint: disable=import-outside-toplevel
+    from OTXv2 import OTXv2  # type: ignore
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    otx = OTXv2(api_key, server=server)
+    adapter = HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=workers,
+        max_retries=Retry(total=0),
+    )
+    session = otx.session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.hooks["response"].append(_check_response)
+    return otx
+
+
+def read_indicators(value):
+    """
+    Yields indicators from a bulk input value.
+
+    :param value: "-" to read stdin, the path of a file with one indicator
+        per line, or a comma or whitespace separated list of indicators
+    """
+    if value == "-":
+        source = sys.stdin
+    elif os.path.isfile(value):
+        with open(value, encoding="utf-8") as indicator_file:
+            for line in indicator_file:
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    yield line
+        return
+    else:
+        source = value.replace(",", " ").split()
+    for line in source:
+        line = line.strip()
+        if line and not line.startswith('#'):
+            yield line
 
 
 class OTXLookupTool(Tool):
@@ -14,43 +139,291 @@ class OTXLookupTool(Tool):
     A tool for looking up information from the Open Threat Exchange (OTX).
     """
 
-    def __init__(self):
-        super().__init__(
-            name="OTXLookup",
-            description=(
-                (
-                    "A tool to look up information from the Open Threat "
-                    "Exchange (OTX)."
-                )
-            ),
-            version="1.0.0",
-            author="Tony Steckman"
+    __slots__ = ()
+
+    tool_spec = ToolSpec(
+        name="OTXLookup",
+        description=(
+            "A tool to look up information from the Open Threat "
+            "Exchange (OTX)."
+        ),
+        version="1.0.0",
+        author="Tony Steckman",
+        required_inputs=("indicator", "indicator_type"),
+        optional_inputs=("indicators", "output_file", "mode"),
+        outputs=("otx_data",),
+        configuration_parameters=("server", "workers", "max_per_host",
+                                  "cache", "rate_limit", "max_retries"),
+        credentials_required=False,
+        api_key_required=True,
+    )
+
+    def _setting(self, parameter, default, kind=int):
+        """Return a numeric configuration value, or its default."""
+        try:
+            return kind(self.configurations.get(parameter, default))
+        except (TypeError, ValueError):
+            return default
+
+    def _client(self):
+        """
+        Returns the OTX client, creating it on first use.
+        The client is shared by all lookups of every tool with the same API
+        key, server and number of workers, and its HTTP session keeps a
+        connection pool sized for the workers. The session does not retry
+        by itself: throttled and failed requests raise, and are retried by
+        the rate limiter.
+        """
+        server = self.configurations.get("server") or DEFAULT_SERVER
+        workers = self._setting("workers", DEFAULT_WORKERS)
+        settings = (self.get_api_key(), server, workers)
+        with _CLIENTS_LOCK:
+            otx = _CLIENTS.get(settings)
+            if otx is None:
+                otx = _CLIENTS[settings] = _create_client(*settings)
+        return otx
+
+    def _limiter(self, otx):
+        """
+        Return the rate limiter of the OTX host and API key, shared with
+        every other tool calling it with the same key.
+        """
+        return get_limiter(
+            urlparse(otx.server).netloc, otx.key,
+            rate=self._setting("rate_limit", 0, float),
+            max_concurrency=self._setting(
+                "max_per_host", DEFAULT_MAX_PER_HOST),
+            max_retries=self._setting("max_retries", DEFAULT_MAX_RETRIES),
+        )
+
+    def _fetch_section(self, otx, indicator_type, indicator, section):
+        """Fetch one section of an indicator's details."""
+        return self._limiter(otx).call(
+            otx.get_indicator_details_by_section,
+            indicator_type=indicator_type,
+            indicator=indicator,
+            section=section
         )
-        self.add_required_input("indicator")
-        self.add_required_input("indicator_type")
-        self.add_output("otx_data")
-        self.credentials_required = False
-        self.api_key_required = True
+
+    def lookup_many(self, indicators, indicator_type="ip"):
+        """
+        Looks up many indicators concurrently.
+        The sections of every indicator are fetched in parallel by a bounded
+        thread pool. Indicators are consumed lazily, so any iterable, such as
+        an open file, can be passed.
+
+        :param indicators: Iterable of indicators
+        :param indicator_type: One of the keys of INDICATOR_TYPES
+        :return: Generator of (indicator, details) tuples in completion
+            order; a section that failed holds {"error": message}
+        """
+        otx_type = otx_indicator_type(indicator_type)
+        sections = list(otx_type.sections)
+        workers = self._setting("workers", DEFAULT_WORKERS)
+        cache = self._cache()
+        otx = None
+        indicators = enumerate(indicators)
+        pending = {}
+        # Sequence number -> sections fetched so far; the same indicator
+        # may appear more than once in a stream.
+        results = {}
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            exhausted = False
+            while True:
+                # Keep the number of queued requests bounded so a large
+                # stream of indicators is not read into memory up front.
+                while not exhausted and len(pending) < workers * 2:
+                    item = next(indicators, None)
+                    if item is None:
+                        exhausted = True
+                        break
+                    sequence, indicator = item
+                    details = {}
+                    for section in sections:
+                        if cache is not None:
+                            data, state = cache.get(
+                                indicator_type, indicator, section)
+                            if state is not None:
+                                details[section] = data
+                                if state == STALE:
+                                    self._revalidate(
+                                        otx_type, indicator_type,
+                                        indicator, section)
+                                continue
+                        if otx is None:
+                            otx = self._client()
+                        future = pool.submit(
+                            self._fetch_section, otx, otx_type,
+                            indicator, section)
+                        pending[future] = (sequence, indicator, section)
+                    if len(details) == len(sections):
+                        yield indicator, details
+                    else:
+                        results[sequence] = details
+                if not pending:
+                    break
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    sequence, indicator, section = pending.pop(future)
+                    try:
+                        data = future.result()
+                        if cache is not None:
+                            cache.put(indicator_type, indicator, section, data)
+                    except Exception as e:  # pylint: disable=broad-except
+                        data = {"error": str(e)}
+                    details = results[sequence]
+                    details[section] = data
+                    if len(details) == len(sections):
+                        del results[sequence]
+                        yield indicator, {
+                            name: details[name] for name in sections}
+
+    def _cache(self):
+        """Return the response cache, or None if caching is turned off."""
+        if self.configurations.get("cache", "on") == "off":
+            return None
+        return get_cache("otx", ttls=SECTION_TTLS)
+
+    def _revalidate(self, otx_type, indicator_type, indicator, section):
+        """
+        Refreshes a stale cache entry in the background.
+        The stale value has already been served; the fresh one replaces it
+        in the cache once it arrives.
+        """
+        key = (indicator_type, indicator, section)
+        with _REFRESH_LOCK:
+            if key in _REFRESHING:
+                return
+            _REFRESHING.add(key)
+
+        def refresh():
+            try:
+                data = self._fetch_section(
+                    self._client(), otx_type, indicator, section)
+                self._cache().put(indicator_type, indicator, section, data)
+            finally:
+                with _REFRESH_LOCK:
+                    _REFRESHING.discard(key)
+
+        _REFRESH_POOL.submit(refresh)
+
+    def sync_pulses(self):
+        """
+        Updates the pulse index with the pulses subscribed to that were
+        modified since the last sync.
+
+        :return: Dictionary summarizing the sync
+        """
+        # pylint: disable=import-outside-toplevel
+        from OTXv2 import SUBSCRIBED
+
+        otx = self._client()
+        limiter = self._limiter(otx)
+        arguments = {"limit": SYNC_PAGE_SIZE}
+        cursor = pulses.PULSES.cursor()
+        if cursor:
+            arguments["modified_since"] = cursor
+
+        def subscribed():
+            url = otx.create_url(SUBSCRIBED, **arguments)
+            while url:
+                page = limiter.call(otx.get, url)
+                yield from page.get("results") or ()
+                url = page.get("next")
+
+        return pulses.PULSES.sync(subscribed())
+
+    def lookup_hits(self, indicators, indicator_type="ip"):
+        """
+        Looks up only the indicators listed in a synced pulse.
+        Indicators are matched against the local pulse index first; those in
+        no pulse are dropped without a request.
+
+        :return: Generator of (indicator, pulses, details) tuples
+        """
+        hits = {}
+
+        def escalated():
+            for indicator, matched in pulses.PULSES.match(indicators):
+                entry = hits.setdefault(indicator, [matched, 0])
+                entry[1] += 1
+                yield indicator
+
+        for indicator, details in self.lookup_many(
+                escalated(), indicator_type):
+            entry = hits[indicator]
+            entry[1] -= 1
+            if not entry[1]:
+                del hits[indicator]
+            yield indicator, entry[0], details
 
     def run(self):
         """Execute the tool's main functionality."""
+        indicator_type = self.input_values.get("indicator_type", "ip")
+        mode = self.input_values.get("mode") or "online"
+        if mode not in MODES:
+            raise ValueError(f"Unknown mode '{mode}'. Available modes: "
+                             f"{', '.join(MODES)}.")
+        if mode == "sync":
+            self.output_values['otx_data'] = self.sync_pulses()
+            return self.output_values['otx_data']
+        bulk = self.input_values.get("indicators")
+        if bulk:
+            return self._run_bulk(self._records(
+                read_indicators(bulk), indicator_type, mode))
         indicator = self.input_values.get("indicator")
         if not indicator:
             raise ValueError("Indicator input is required.")
-        indicator_type = {
-            "ip": IndicatorTypes.IPv4,
-            "domain": IndicatorTypes.DOMAIN,
-            "hostname": IndicatorTypes.HOSTNAME,
-            "url": IndicatorTypes.URL,
-            "file": IndicatorTypes.FILE_HASH_MD5
-        }
-        otx = OTXv2(self.get_api_key())
-        otx_data = otx.get_indicator_details_full(
-            indicator=indicator,
-            indicator_type=indicator_type.get(
-                self.input_values.get("indicator_type", "ip"))
-        )
-        self.output_values['otx_data'] = json.dumps(otx_data, indent=3)
+        if mode == "online":
+            _, otx_data = next(self.lookup_many([indicator], indicator_type))
+            errors = [data["error"] for data in otx_data.values()
+                      if isinstance(data, dict) and set(data) == {"error"}]
+            if errors and len(errors) == len(otx_data):
+                # Nothing was looked up: fail the run rather than report it
+                # as ok with only errors in it
+                raise RuntimeError(
+                    f"Lookup of '{indicator}' failed: {errors[0]}")
+        else:
+            otx_data = next(
+                self._records([indicator], indicator_type, mode),
+                {"indicator": indicator, "pulses": []})
+        self.output_values['otx_data'] = otx_data
+        return self.output_values['otx_data']
+
+    def _records(self, indicators, indicator_type, mode):
+        """
+        Returns a generator of the output records of a lookup. Outside of
+        online mode, only indicators in a synced pulse have records.
+        """
+        if mode == "offline":
+            return ({"indicator": indicator, "pulses": matched}
+                    for indicator, matched in pulses.PULSES.match(indicators))
+        if mode == "prefilter":
+            return ({"indicator": indicator, "pulses": matched,
+                     "otx_data": details}
+                    for indicator, matched, details in self.lookup_hits(
+                        indicators, indicator_type))
+        return ({"indicator": indicator, "otx_data": details}
+                for indicator, details in self.lookup_many(
+                    indicators, indicator_type))
+
+    def _run_bulk(self, records):
+        """
+        Produces the records of a stream of indicators.
+        Results are yielded as output records as soon as they complete.
+        With an output_file input set, they are appended to it as JSON lines
+        instead and only a summary is returned.
+        """
+        output_file = self.input_values.get("output_file")
+        if not output_file:
+            return records
+        with NDJSONSerializer.open(output_file, append=True) as out:
+            for record in records:
+                out.write(record)
+                # Completed lookups show up in the file as they finish
+                out.stream.flush()
+        self.output_values['otx_data'] = {
+            "indicators": out.records, "output_file": output_file}
         return self.output_values['otx_data']
 
     def set_api_key(self, api_key):
@@ -59,4 +432,6 @@ class OTXLookupTool(Tool):
 
     def get_api_key(self):
         """Get the API key for OTX."""
-        return self.credentials.get("otx_api_key", None)
+        if not self.credentials.get('username'):
+            self.credentials['username'] = "otx_api_key"
+        return self.get_credentials().get('password')
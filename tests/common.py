@@ -0,0 +1,48 @@
+"""tests/common.py
+Shared helpers for the tests.
+"""
+
+import contextlib
+import os
+import shutil
+import tempfile
+import unittest
+
+from src.lib import history, memo
+from src.lib import tool as tool_module
+from src.lib.sqlite import close_database
+
+
+@contextlib.contextmanager
+def scratch_database(prefix="sak-test-"):
+    """
+    Points tool configurations, the run history and the memo cache at a
+    temporary database, so tests never write to the repository's one.
+
+    :param prefix: Prefix of the temporary directory
+    :return: Context manager yielding the path of the database
+    """
+    workdir = tempfile.mkdtemp(prefix=prefix)
+    db_path = os.path.join(workdir, "tools.db")
+    db_path_before = tool_module.DB_PATH
+    history_before = history.HISTORY
+    memo_path_before = memo.MEMO.db_path
+    tool_module.DB_PATH = db_path
+    history.HISTORY = history.RunHistory(db_path)
+    memo.MEMO.db_path = db_path
+    try:
+        yield db_path
+    finally:
+        history.HISTORY.flush()
+        history.HISTORY = history_before
+        tool_module.DB_PATH = db_path_before
+        memo.MEMO.db_path = memo_path_before
+        close_database(db_path)
+        shutil.rmtree(workdir)
+
+
+class ScratchDatabaseTestCase(unittest.TestCase):
+    """Runs every test against a scratch database, see scratch_database()."""
+
+    def setUp(self):
+        self.db_path = self.enterContext(scratch_database())
@@ -0,0 +1,59 @@
+"""tests/test_batch.py
+Script mode writes one JSON Lines record per command, and the records a
+tool streams as lines of their own rather than as part of the output.
+"""
+
+import io
+import json
+import unittest
+
+from src.lib.batch import run_script
+from src.lib.shell import Shell
+from src.lib.tool import Tool
+from tests.common import ScratchDatabaseTestCase
+
+
+class CountTool(Tool):
+    """Streams a few records."""
+
+    def run(self):
+        for number in range(3):
+            yield {'number': number}
+
+
+class RunScriptTest(ScratchDatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.shell = Shell()
+        self.shell.loaded_tools['count'] = CountTool("Count")
+
+    def run_script(self, script):
+        out = io.StringIO()
+        failures = run_script(self.shell, io.StringIO(script), out)
+        return failures, [json.loads(line)
+                          for line in out.getvalue().splitlines()]
+
+    def test_streamed_records_are_lines_of_their_own(self):
+        failures, lines = self.run_script("run count\n")
+        self.assertEqual(failures, 0)
+        self.assertEqual(
+            [line['record'] for line in lines[:3]],
+            [{'number': 0}, {'number': 1}, {'number': 2}])
+        self.assertEqual({(line['command'], line['line'])
+                          for line in lines[:3]}, {("run count", 1)})
+        outcome = lines[3]
+        self.assertEqual((outcome['status'], outcome['records']), ("ok", 3))
+        self.assertEqual(outcome['output'],
+                         "Result from 'count': 3 record(s).\n")
+
+    def test_unknown_tool_is_one_error_record(self):
+        failures, lines = self.run_script("load examples.no_such_tool\n")
+        self.assertEqual(failures, 1)
+        self.assertEqual(len(lines), 1)
+        self.assertEqual(lines[0]['status'], "error")
+        self.assertIsNone(self.shell.record_sink)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+"""tests/test_benchmark_runner.py
+Smoke test of the benchmark runner: the whole suite runs end to end, every
+module's results are stored, and a run compares cleanly with itself.
+The suite runs in a scratch working directory, so the repository's
+databases are not touched.
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from benchmarks import run
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class BenchmarkRunnerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp(prefix="sak-test-runner-")
+        for name in ("sak.py", "src", "benchmarks"):
+            os.symlink(os.path.join(ROOT, name),
+                       os.path.join(self.workdir, name))
+        os.mkdir(os.path.join(self.workdir, "dbs"))
+        self.db_path = os.path.join(self.workdir, "results.db")
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def runner(self, *args):
+        return subprocess.run(
+            [sys.executable, "-m", "benchmarks.run", "--db", self.db_path,
+             *args], cwd=self.workdir, capture_output=True, text=True,
+            check=False)
+
+    def test_suite_runs_end_to_end(self):
+        result = self.runner("run", "--label", "smoke")
+        self.assertEqual(result.returncode, 0, result.stderr)
+        samples = run.load_samples("smoke", self.db_path)
+        self.assertEqual({module for module, _ in samples},
+                         set(run.discover()))
+        result = self.runner("compare", "smoke", "smoke")
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertIn(f"{len(samples)} benchmark(s) compared, "
+                      f"0 regression(s).", result.stdout)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,116 @@
+"""tests/test_cache.py
+Caches registered by name are reported and cleared by the shell. The
+response cache table is created by the schema migrations, and stale OTX
+entries are refreshed by one pool shared by every tool.
+"""
+
+import io
+import threading
+import time
+import unittest
+
+from src.lib.cache import CACHES, ResponseCache, register_cache
+from src.lib.migrations import MIGRATIONS
+from src.lib.shell import Shell
+from src.lib.sqlite import Database
+from src.tools.examples import otx_lookup
+from tests.common import ScratchDatabaseTestCase
+
+
+class RegisteredCache:
+    """Counts how often it was cleared, and ignores what is stored."""
+
+    def __init__(self):
+        self.cleared = 0
+
+    def stats(self):
+        return {'cleared': self.cleared}
+
+    def clear(self):
+        self.cleared += 1
+
+    def put(self, kind, key, section, value):
+        pass
+
+
+class RegisterCacheTest(unittest.TestCase):
+
+    def tearDown(self):
+        CACHES.pop('test', None)
+
+    def test_library_caches_are_registered(self):
+        # pylint: disable=import-outside-toplevel,unused-import
+        import src.lib.credentials
+        import src.lib.memo
+        import src.lib.pulses
+
+        self.assertLessEqual({'credentials', 'memo', 'pulses'}, set(CACHES))
+
+    def test_registered_cache_is_cleared_by_the_shell(self):
+        registered = register_cache('test', RegisteredCache())
+        shell = Shell(out=io.StringIO())
+        self.assertEqual(shell.execute("cache stats test"),
+                         {'test': {'cleared': 0}})
+        shell.execute("cache clear test")
+        self.assertEqual(registered.cleared, 1)
+
+
+class ResponseCacheSchemaTest(ScratchDatabaseTestCase):
+
+    def test_table_is_created_by_the_migrations(self):
+        cache = ResponseCache("test", db_path=self.db_path)
+        cache.put("ip", "10.0.0.1", "general", {'pulses': 1})
+        self.assertEqual(cache.get("ip", "10.0.0.1", "general")[0],
+                         {'pulses': 1})
+        db = Database(self.db_path)
+        db.connect()
+        version = db.execute_query("PRAGMA user_version")[0][0]
+        self.assertEqual(version, MIGRATIONS[-1][0])
+
+
+class BlockingLookupTool(otx_lookup.OTXLookupTool):
+    """Refreshes entries until it is released."""
+
+    __slots__ = ()
+
+    release = threading.Event()
+    fetched = []
+
+    def _client(self):
+        return None
+
+    def _fetch_section(self, otx, indicator_type, indicator, section):
+        self.release.wait(5)
+        self.fetched.append((indicator, section))
+        return {}
+
+    def _cache(self):
+        return RegisteredCache()
+
+
+class RefreshPoolTest(unittest.TestCase):
+
+    def test_clones_share_one_refresh_pool(self):
+        tool = BlockingLookupTool()
+        clone = tool.clone()
+        instances = (tool, clone, clone.clone())
+        threads_before = threading.active_count()
+        try:
+            for _ in range(2):
+                for number, instance in enumerate(instances):
+                    instance._revalidate(
+                        "IPv4", "ip", f"10.0.0.{number}", "general")
+            self.assertLessEqual(threading.active_count() - threads_before,
+                                 2)
+        finally:
+            BlockingLookupTool.release.set()
+        deadline = time.monotonic() + 5
+        while len(BlockingLookupTool.fetched) < len(instances):
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+        self.assertEqual(sorted(BlockingLookupTool.fetched),
+                         [(f"10.0.0.{number}", "general")
+                          for number in range(len(instances))])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+"""tests/test_executors.py
+The process executor runs tools in worker processes and refuses tools that
+stream their result, which it would have to collect whole. Runs served from
+the memo cache are recorded in the history as replays.
+"""
+
+import io
+import unittest
+
+from src.lib import history
+from src.lib.executors import ProcessBackend, ThreadBackend
+from src.lib.shell import Shell
+from src.lib.tool import Tool, ToolSpec
+from tests.common import ScratchDatabaseTestCase
+
+
+class SquareTool(Tool):
+    """Squares a number."""
+
+    tool_spec = ToolSpec(name="Square", required_inputs=("number",),
+                         outputs=("square",))
+    executor = "process"
+
+    def run(self):
+        self.output_values['square'] = self.input_values['number'] ** 2
+        return self.output_values['square']
+
+
+class CountTool(Tool):
+    """Streams a few numbers."""
+
+    tool_spec = ToolSpec(name="Count")
+    executor = "process"
+
+    def run(self):
+        yield from range(3)
+
+
+class ProcessBackendTest(ScratchDatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.backend = ProcessBackend(workers=1)
+
+    def tearDown(self):
+        self.backend.shutdown()
+        super().tearDown()
+
+    def test_result_comes_back(self):
+        tool = SquareTool()
+        tool.set_input_value("number", 7)
+        self.assertEqual(self.backend.run(tool), 49)
+        self.assertEqual(tool.output_values, {'square': 49})
+
+    def test_streamed_result_is_refused(self):
+        with self.assertRaisesRegex(ValueError, "process executor"):
+            self.backend.run(CountTool())
+
+
+class CubeTool(Tool):
+    """Cubes a number, counting its runs."""
+
+    tool_spec = ToolSpec(name="Cube", required_inputs=("number",))
+    deterministic = True
+    runs = 0
+
+    def run(self):
+        CubeTool.runs += 1
+        return self.input_values['number'] ** 3
+
+
+class MemoReplayTest(ScratchDatabaseTestCase):
+
+    def test_memo_hits_are_recorded_as_replays(self):
+        tool = CubeTool()
+        tool.set_input_value("number", id(self))
+        runs_before = CubeTool.runs
+        for _ in range(2):
+            self.assertEqual(ThreadBackend().run(tool), id(self) ** 3)
+        self.assertEqual(CubeTool.runs - runs_before, 1)
+        statuses = [run['status'] for run in history.HISTORY.query()]
+        self.assertEqual(statuses, ["replay", "ok"])
+
+    def test_shell_reads_the_current_history(self):
+        tool = CubeTool()
+        tool.set_input_value("number", 2)
+        ThreadBackend().run(tool)
+        shell = Shell(out=io.StringIO())
+        runs = shell.execute("history query --tool Cube")
+        self.assertEqual([run['tool'] for run in runs], ["Cube"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+"""tests/test_history.py
+The background writer of the run history keeps running after errors, and
+flushes do not wait for a writer that is gone.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from src.lib.history import RunHistory
+from src.lib.sqlite import close_database
+from src.tools.examples.hello_world import HelloWorldTool
+
+
+class HistoryWriterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp(prefix="sak-test-history-")
+        self.db_path = os.path.join(self.workdir, "tools.db")
+        self.history = RunHistory(self.db_path, linger=0.01)
+        self.tool = HelloWorldTool()
+
+    def tearDown(self):
+        self.history.flush(timeout=5)
+        close_database(self.db_path)
+        shutil.rmtree(self.workdir)
+
+    def record(self):
+        run = self.history.start(self.tool)
+        self.history.finish(run, self.tool.run())
+
+    def test_writer_survives_unexpected_errors(self):
+        write = self.history._write
+        failures = []
+
+        def write_once_failing(entries):
+            if not failures:
+                failures.append(entries)
+                raise RuntimeError("boom")
+            write(entries)
+
+        self.history._write = write_once_failing
+        with self.assertLogs("src.lib.history", "ERROR"):
+            self.record()
+            self.assertTrue(self.history.flush(timeout=5))
+        self.assertEqual(self.history.errors, 1)
+        self.assertEqual(self.history.last_error, "boom")
+        self.record()
+        self.assertTrue(self.history.flush(timeout=5))
+        self.assertEqual(len(self.history.query()), 1)
+
+    def test_flush_gives_up_when_the_writer_is_gone(self):
+        # A writer that exits without writing anything
+        self.history._write_loop = lambda: None
+        self.record()
+        self.history._writer.join()
+        self.assertFalse(self.history.flush())
+
+
+if __name__ == "__main__":
+    unittest.main()
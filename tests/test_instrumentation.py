@@ -0,0 +1,109 @@
+"""tests/test_instrumentation.py
+Lifecycle phases are recorded under the name of a single tool, even when
+several tools share one measured block. Streamed runs are measured until
+their records are consumed, and allocation peaks are those of each phase.
+"""
+
+import time
+import tracemalloc
+import unittest
+
+from src.lib.executors import ThreadBackend
+from src.lib.instrumentation import Instrumentation, INSTRUMENTATION
+from src.lib.tool import Tool, ToolSpec, load_all_configurations
+from tests.common import ScratchDatabaseTestCase, scratch_database
+
+
+class AlphaTool(Tool):
+    """A tool with one configuration parameter."""
+
+    tool_spec = ToolSpec(name="Alpha", configuration_parameters=("limit",))
+
+
+class BetaTool(Tool):
+    """Another tool with one configuration parameter."""
+
+    tool_spec = ToolSpec(name="Beta", configuration_parameters=("limit",))
+
+
+class SlowStreamTool(Tool):
+    """Streams records that take a while to produce."""
+
+    tool_spec = ToolSpec(name="SlowStream")
+
+    def run(self):
+        for number in range(3):
+            time.sleep(0.05)
+            yield number
+
+
+class TimedCallTest(unittest.TestCase):
+
+    def test_stream_is_timed_as_it_is_consumed(self):
+        instrumentation = Instrumentation()
+        records = instrumentation.timed_call(
+            "run", "Slow", SlowStreamTool().run)
+        self.assertEqual(instrumentation.snapshot(), [])
+        self.assertEqual(list(records), [0, 1, 2])
+        row, = instrumentation.snapshot()
+        self.assertEqual((row['calls'], row['errors']), (1, 0))
+        self.assertGreaterEqual(row['wall_seconds'], 0.15)
+
+    def test_streamed_run_phase_covers_its_records(self):
+        INSTRUMENTATION.reset()
+        with scratch_database():
+            list(ThreadBackend().run(SlowStreamTool()))
+        row, = [row for row in INSTRUMENTATION.snapshot()
+                if row['phase'] == "run"]
+        self.assertGreaterEqual(row['wall_seconds'], 0.15)
+
+    def test_peak_is_that_of_each_phase(self):
+        instrumentation = Instrumentation()
+        tracemalloc.start()
+        try:
+            with instrumentation.timed("run", "Large"):
+                buffer = bytearray(4 * 1024 * 1024)
+                del buffer
+            with instrumentation.timed("run", "Small"):
+                pass
+        finally:
+            tracemalloc.stop()
+        peaks = {row['tool']: row['alloc_peak_bytes']
+                 for row in instrumentation.snapshot()}
+        self.assertGreaterEqual(peaks['Large'], 4 * 1024 * 1024)
+        self.assertLess(peaks['Small'], 1024 * 1024)
+
+
+class TimedEachTest(unittest.TestCase):
+
+    def test_each_tool_gets_a_share(self):
+        instrumentation = Instrumentation()
+        with instrumentation.timed_each("configure", ["A", "B"]):
+            pass
+        rows = instrumentation.snapshot()
+        self.assertEqual([row['tool'] for row in rows], ["A", "B"])
+        self.assertEqual([row['calls'] for row in rows], [1, 1])
+        self.assertEqual(rows[0]['wall_seconds'], rows[1]['wall_seconds'])
+
+    def test_failure_is_recorded_for_each_tool(self):
+        instrumentation = Instrumentation()
+        with self.assertRaises(ValueError):
+            with instrumentation.timed_each("configure", ["A", "B"]):
+                raise ValueError("failed")
+        self.assertEqual([row['errors']
+                          for row in instrumentation.snapshot()], [1, 1])
+
+
+class ConfigurationLabelTest(ScratchDatabaseTestCase):
+
+    def test_batch_is_recorded_per_tool(self):
+        tools = [AlphaTool(), BetaTool()]
+        INSTRUMENTATION.reset()
+        load_all_configurations(tools)
+        labels = {row['tool'] for row in INSTRUMENTATION.snapshot()
+                  if row['phase'] == "configure"}
+        self.assertEqual(labels, {"Alpha", "Beta"})
+
+
+if __name__ == "__main__":
+    unittest.main()
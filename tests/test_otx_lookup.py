@@ -0,0 +1,57 @@
+"""tests/test_otx_lookup.py
+A single OTX lookup against the local stub: it returns every section, and
+fails when no section could be fetched. Tools and their clones share the
+OTX client of their settings.
+"""
+
+import unittest
+
+from benchmarks.bench_otx import make_tool
+from benchmarks.otx_stub import OTXStubServer
+from src.lib import ratelimit
+
+
+class SingleLookupTest(unittest.TestCase):
+
+    def setUp(self):
+        self.limiters_before = dict(ratelimit.LIMITERS)
+        ratelimit.LIMITERS.clear()
+
+    def tearDown(self):
+        ratelimit.LIMITERS.clear()
+        ratelimit.LIMITERS.update(self.limiters_before)
+
+    def lookup(self, server):
+        tool = make_tool(server.url, 2)
+        tool.set_configuration("max_retries", 0)
+        tool.set_input_value("indicator", "10.0.0.1")
+        return tool.run()
+
+    def test_lookup_returns_every_section(self):
+        with OTXStubServer() as server:
+            otx_data = self.lookup(server)
+        self.assertTrue(otx_data)
+        self.assertTrue(all("error" not in data
+                            for data in otx_data.values()))
+
+    def test_lookup_fails_when_every_section_fails(self):
+        with OTXStubServer(error_rate=1.0) as server:
+            with self.assertRaisesRegex(RuntimeError,
+                                        "Lookup of '10.0.0.1' failed"):
+                self.lookup(server)
+
+
+class SharedClientTest(unittest.TestCase):
+
+    def test_clones_share_the_client_of_their_settings(self):
+        tool = make_tool("http://127.0.0.1:9", 2)
+        clone = tool.clone()
+        self.assertIs(clone._client(), tool._client())
+        self.assertIs(make_tool("http://127.0.0.1:9", 2)._client(),
+                      tool._client())
+        clone.set_configuration("workers", 4)
+        self.assertIsNot(clone._client(), tool._client())
+
+
+if __name__ == "__main__":
+    unittest.main()
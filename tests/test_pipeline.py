@@ -0,0 +1,86 @@
+"""tests/test_pipeline.py
+Pipelines feed each stage from the previous one and leave the tools they
+were built from unchanged.
+"""
+
+import unittest
+
+from src.lib import history
+from src.lib.pipeline import Pipeline, PipelineError, Stage
+from src.lib.tool import Tool, ToolSpec
+from tests.common import ScratchDatabaseTestCase
+
+
+class NumbersTool(Tool):
+    """Streams the numbers below its count."""
+
+    __slots__ = ()
+
+    tool_spec = ToolSpec(name="Numbers", optional_inputs=("count",),
+                         outputs=("number",))
+
+    def run(self):
+        for number in range(int(self.input_values.get("count", 3))):
+            yield {'number': number}
+
+
+class DoubleTool(Tool):
+    """Doubles a number."""
+
+    __slots__ = ()
+
+    tool_spec = ToolSpec(name="Double", required_inputs=("number",),
+                         outputs=("double",))
+
+    def run(self):
+        self.output_values['double'] = self.input_values['number'] * 2
+        return self.output_values['double']
+
+
+class PipelineTest(ScratchDatabaseTestCase):
+
+    def test_stages_are_chained(self):
+        pipeline = Pipeline([Stage("numbers", NumbersTool()),
+                             Stage("double", DoubleTool())])
+        self.assertEqual([item['double'] for item in pipeline.run()],
+                         [0, 2, 4])
+        self.assertEqual([metrics['items_out']
+                          for metrics in pipeline.metrics()], [3, 3])
+
+    def test_loaded_tools_are_not_changed(self):
+        numbers, double = NumbersTool(), DoubleTool()
+        numbers.set_input_value("count", 2)
+        list(Pipeline([Stage("numbers", numbers),
+                       Stage("double", double)]).run())
+        self.assertEqual(numbers.input_values, {'count': 2})
+        self.assertEqual(double.input_values, {})
+        self.assertEqual(double.output_values, {})
+
+    def test_same_tool_twice_is_refused(self):
+        numbers = NumbersTool()
+        with self.assertRaises(PipelineError):
+            Pipeline([Stage("a", numbers), Stage("b", numbers)])
+
+    def test_missing_output_does_not_reuse_previous_item(self):
+        stage = Stage("double", DoubleTool(), {'number': "value"})
+        stage.feed({'value': 3})
+        self.assertEqual(stage.tool.input_values, {'number': 3})
+        stage.feed({})
+        self.assertEqual(stage.tool.input_values, {})
+
+    def test_missing_output_restores_input_set_before(self):
+        double = DoubleTool()
+        double.set_input_value("number", 5)
+        stage = Stage("double", double, {'number': "value"})
+        stage.feed({'value': 3})
+        stage.feed({})
+        self.assertEqual(stage.tool.input_values, {'number': 5})
+
+    def test_stage_runs_are_not_recorded(self):
+        list(Pipeline([Stage("numbers", NumbersTool()),
+                       Stage("double", DoubleTool())]).run())
+        self.assertEqual(history.HISTORY.query(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,145 @@
+"""tests/test_ratelimit.py
+The rate limiter against the local OTX stub, which answers 429 Too Many
+Requests past a rate or a number of concurrent requests and can fail
+requests with 503.
+"""
+
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from benchmarks.otx_stub import OTXStubServer
+from src.lib.ratelimit import (
+    CircuitBreaker,
+    CircuitOpen,
+    Limiter,
+    RetryableError,
+    check_status,
+)
+
+
+PATH = "/api/v1/indicators/IPv4/10.0.0.1/general"
+
+
+def fetch(session, url):
+    """Make one request, raising for throttled and failed responses."""
+    response = session.get(url)
+    check_status(response.status_code, response.headers)
+    return response.json()
+
+
+class StubTestCase(unittest.TestCase):
+    """Starts a stub server and a session for every test."""
+
+    server_options = {}
+
+    def setUp(self):
+        self.server = OTXStubServer(**self.server_options)
+        self.server.__enter__()
+        self.session = requests.Session()
+        self.session.mount("http://", requests.adapters.HTTPAdapter(
+            pool_maxsize=16))
+        self.url = self.server.url + PATH
+
+    def tearDown(self):
+        self.session.close()
+        self.server.__exit__(None, None, None)
+
+    def fire(self, limiter, requests_made, clients):
+        """Make requests from several threads through a limiter."""
+        with ThreadPoolExecutor(max_workers=clients) as pool:
+            return list(pool.map(
+                lambda _: limiter.call(fetch, self.session, self.url),
+                range(requests_made)))
+
+
+class TokenBucketTest(StubTestCase):
+
+    # The stub refuses requests beyond 25 per second
+    server_options = {'rate': 25}
+
+    def test_requests_keep_to_the_rate(self):
+        limiter = Limiter("test", rate=20, burst=1, max_retries=0)
+        start = time.monotonic()
+        results = self.fire(limiter, 21, clients=8)
+        elapsed = time.monotonic() - start
+        self.assertEqual(len(results), 21)
+        # 21 requests at 20 per second, the first one without waiting
+        self.assertGreaterEqual(elapsed, 0.95)
+        self.assertEqual(self.server.throttled, 0)
+        self.assertEqual(limiter.stats()['throttled'], 0)
+
+
+class AdaptiveConcurrencyTest(StubTestCase):
+
+    # The stub serves two requests at once and refuses the rest
+    server_options = {'latency': 0.02, 'max_concurrent': 2}
+
+    def test_limit_backs_off_when_throttled(self):
+        limiter = Limiter("test", max_concurrency=8, backoff_base=0.01,
+                          max_retries=20)
+        results = self.fire(limiter, 60, clients=8)
+        self.assertEqual(len(results), 60)
+        self.assertGreater(self.server.throttled, 0)
+        self.assertGreater(limiter.concurrency.decreases, 0)
+        self.assertLess(limiter.concurrency.limit, 8)
+        self.assertEqual(limiter.stats()['failures'], 0)
+
+
+class RetryAfterTest(StubTestCase):
+
+    # One request per second, refusals ask to retry after a second
+    server_options = {'rate': 1, 'retry_after': 1}
+
+    def test_retry_waits_as_long_as_asked(self):
+        limiter = Limiter("test", backoff_base=0.01)
+        limiter.call(fetch, self.session, self.url)
+        start = time.monotonic()
+        limiter.call(fetch, self.session, self.url)
+        self.assertGreaterEqual(time.monotonic() - start, 1.0)
+        stats = limiter.stats()
+        self.assertEqual((stats['throttled'], stats['retries']), (1, 1))
+        self.assertEqual(self.server.throttled, 1)
+
+
+class CircuitBreakerTest(StubTestCase):
+
+    # Every request fails with 503 until the test heals the stub
+    server_options = {'error_rate': 1.0}
+
+    def test_circuit_opens_then_goes_half_open(self):
+        limiter = Limiter("test", max_retries=0, failure_threshold=3,
+                          reset_timeout=0.2)
+        breaker = limiter.breaker
+        for _ in range(3):
+            with self.assertRaises(RetryableError):
+                limiter.call(fetch, self.session, self.url)
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        requests_made = self.server.requests
+        with self.assertRaises(CircuitOpen):
+            limiter.call(fetch, self.session, self.url)
+        # Refused without reaching the server
+        self.assertEqual(self.server.requests, requests_made)
+
+        # After the reset timeout a single trial call is let through, and
+        # its failure opens the circuit again
+        time.sleep(0.25)
+        breaker.before()
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        with self.assertRaises(CircuitOpen):
+            breaker.before()
+        breaker.failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertEqual(breaker.opened, 2)
+
+        # A successful trial closes it
+        self.server.error_rate = 0.0
+        time.sleep(0.25)
+        limiter.call(fetch, self.session, self.url)
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+
+if __name__ == "__main__":
+    unittest.main()
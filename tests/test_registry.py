@@ -0,0 +1,60 @@
+"""tests/test_registry.py
+The registry lists the tools under its root, and leaves out the modules that
+do not define one.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from src.lib.registry import ToolRegistry
+
+
+TOOL_SOURCE = '''
+from src.lib.tool import Tool, ToolSpec
+
+
+class GreetTool(Tool):
+    """Greets."""
+
+    tool_spec = ToolSpec(name="Greet")
+'''
+
+HELPER_SOURCE = '''
+def greeting(name):
+    return f"Hello, {name}!"
+'''
+
+
+class ToolNamesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp(prefix="sak-registry-")
+        self.addCleanup(shutil.rmtree, self.workdir)
+        package = os.path.join(self.workdir, "tools", "examples")
+        os.makedirs(package)
+        for name, source in (("greet.py", TOOL_SOURCE),
+                             ("helpers.py", HELPER_SOURCE)):
+            with open(os.path.join(package, name), "w",
+                      encoding="utf-8") as module:
+                module.write(source)
+        self.registry = ToolRegistry(
+            os.path.join(self.workdir, "tools"),
+            os.path.join(self.workdir, "registry.json"))
+
+    def test_modules_without_a_tool_are_not_listed(self):
+        self.registry.refresh()
+        self.assertEqual(self.registry.tool_names(), ["examples.greet"])
+        self.assertEqual(len(self.registry), 1)
+        self.assertIn("examples.greet", self.registry)
+        self.assertNotIn("examples.helpers", self.registry)
+
+    def test_modules_without_a_tool_are_not_parsed_again(self):
+        self.registry.refresh()
+        self.assertFalse(ToolRegistry(
+            self.registry.root, self.registry.index_path).refresh())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,157 @@
+"""tests/test_shell.py
+Commands of the shell: errors are reported instead of raised, and output
+records are printed as JSON.
+"""
+
+import contextlib
+import io
+import threading
+import unittest
+from unittest import mock
+
+from src.lib.credentials import CREDENTIALS
+from src.lib.shell import Shell
+from src.lib.tool import Tool
+from tests.common import ScratchDatabaseTestCase
+
+
+class CountTool(Tool):
+    """Streams a few records."""
+
+    def run(self):
+        for number in range(3):
+            yield {'number': number, 'text': f"record {number}"}
+
+
+def produce_profiled_record(number):
+    """Makes a record, to be found in a profile."""
+    return {'number': number}
+
+
+class ProfiledTool(Tool):
+    """Streams records made by a function of its own."""
+
+    def run(self):
+        for number in range(3):
+            yield produce_profiled_record(number)
+
+
+class SignalTool(Tool):
+    """Streams records, signalling each one it produces."""
+
+    def __init__(self, name, count=3, barrier=None):
+        super().__init__(name)
+        self.count = count
+        self.barrier = barrier
+        self.produced = threading.Event()
+
+    def run(self):
+        for number in range(self.count):
+            if self.barrier is not None:
+                # Waits for the other tool to produce as well
+                self.barrier.wait(timeout=5)
+            self.produced.set()
+            yield {'number': number}
+
+
+class ShellTestCase(ScratchDatabaseTestCase):
+    """A shell with the OTX tool loaded and a scratch database."""
+
+    def setUp(self):
+        super().setUp()
+        self.shell = Shell(out=io.StringIO())
+        self.shell.execute("load examples.otx_lookup")
+
+
+class ShellErrorTest(ShellTestCase):
+
+    def test_tool_run_error_is_reported(self):
+        self.assertIsNone(self.shell.execute("examples.otx_lookup run"))
+        self.assertEqual(self.shell.last_error,
+                         "Error from 'OTXLookup': Indicator input is required.")
+
+    def test_run_error_is_reported(self):
+        self.assertIsNone(self.shell.execute("run examples.otx_lookup"))
+        self.assertIn("Indicator input is required", self.shell.last_error)
+        self.assertTrue(self.shell.running)
+
+    def test_load_error_is_reported(self):
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout):
+            self.shell.execute("load examples.no_such_tool")
+        self.assertEqual(stdout.getvalue(), "")
+        self.assertEqual(
+            self.shell.last_error,
+            "Error loading tool 'examples.no_such_tool': "
+            "No module named 'src.tools.examples.no_such_tool'")
+
+    def test_prefetch_error_is_reported(self):
+        shell = Shell(out=io.StringIO())
+        with mock.patch.object(Tool, "credential_key",
+                               return_value=("OTXLookup", "otx_api_key")), \
+                mock.patch.object(CREDENTIALS, "prefetch",
+                                  side_effect=OSError("Keyring is locked")):
+            shell.execute("load examples.otx_lookup")
+        self.assertEqual(
+            shell.last_error,
+            "Credentials could not be prefetched: Keyring is locked")
+
+    def test_api_key_is_not_fetched_on_load(self):
+        tool_instance = self.shell.loaded_tools['examples.otx_lookup']
+        self.assertIsNone(tool_instance.credential_key())
+
+
+class ShellOutputTest(ShellTestCase):
+
+    def test_streamed_records_print_as_json(self):
+        self.shell.loaded_tools['count'] = CountTool("Count")
+        self.shell.execute("run count")
+        lines = self.shell.out.getvalue().splitlines()
+        self.assertEqual(lines[-4:], [
+            '{"number":0,"text":"record 0"}',
+            '{"number":1,"text":"record 1"}',
+            '{"number":2,"text":"record 2"}',
+            "Result from 'count': 3 record(s).",
+        ])
+
+
+    def test_profile_covers_streamed_records(self):
+        self.shell.loaded_tools['profiled'] = ProfiledTool("Profiled")
+        summary = self.shell.execute("profile profiled run")
+        self.assertEqual(summary['records'], 3)
+        self.assertIn("produce_profiled_record",
+                      self.shell.out.getvalue())
+
+
+class ShellJobTest(ShellTestCase):
+
+    def test_background_stream_is_produced_before_wait(self):
+        tool_instance = SignalTool("Signal", count=150)
+        self.shell.loaded_tools['signal'] = tool_instance
+        job_id = self.shell.execute("run signal &")[0]
+        self.assertTrue(tool_instance.produced.wait(5))
+        job = self.shell.jobs.jobs[job_id]
+        job.future.result(5)
+        self.assertEqual(job.status, "done")
+        self.shell.execute("wait")
+        lines = self.shell.out.getvalue().splitlines()
+        self.assertEqual(lines[-3:], [
+            '{"number":149}',
+            "Last 100 record(s) shown.",
+            "Result from '[1] signal': 150 record(s).",
+        ])
+
+    def test_streams_of_concurrent_runs_are_drained_concurrently(self):
+        barrier = threading.Barrier(2)
+        self.shell.loaded_tools['a'] = SignalTool("A", barrier=barrier)
+        self.shell.loaded_tools['b'] = SignalTool("B", barrier=barrier)
+        results = self.shell.execute("run a b")
+        self.assertIsNone(self.shell.last_error)
+        self.assertEqual([results[name]['records'] for name in ("a", "b")],
+                         [3, 3])
+        lines = self.shell.out.getvalue().splitlines()
+        self.assertEqual(lines.count('{"number":2}'), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
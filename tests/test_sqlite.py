@@ -0,0 +1,83 @@
+"""tests/test_sqlite.py
+The connection pool: connections are reused within a thread, released when
+their thread exits, and invalidated in every thread by close_all().
+"""
+
+import gc
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from src.lib import sqlite
+from src.lib.sqlite import Database
+
+
+THREADS = 50
+
+
+class ConnectionPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        sqlite.close_all()
+        self.workdir = tempfile.mkdtemp(prefix="sak-test-sqlite-")
+        self.db_path = os.path.join(self.workdir, "test.db")
+
+    def tearDown(self):
+        sqlite.close_all()
+        shutil.rmtree(self.workdir)
+
+    def query(self):
+        with Database(self.db_path) as db:
+            return db.execute_query("SELECT 1")
+
+    def test_connection_is_reused_within_a_thread(self):
+        self.assertIs(sqlite.pooled_connection(self.db_path),
+                      sqlite.pooled_connection(self.db_path))
+        self.assertEqual(sqlite.open_connections(), 1)
+
+    def test_connections_are_released_when_threads_exit(self):
+        threads = [threading.Thread(target=self.query)
+                   for _ in range(THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        gc.collect()
+        self.assertEqual(sqlite.open_connections(), 0)
+
+    def test_close_all_invalidates_every_thread(self):
+        opened = threading.Event()
+        closed = threading.Event()
+        results = []
+
+        def worker():
+            self.query()
+            opened.set()
+            closed.wait()
+            # The cached connection was closed on the main thread
+            results.append(self.query())
+
+        thread = threading.Thread(target=worker)
+        thread.start()
+        opened.wait()
+        self.assertEqual(sqlite.open_connections(), 1)
+        sqlite.close_all()
+        self.assertEqual(sqlite.open_connections(), 0)
+        closed.set()
+        thread.join()
+        self.assertEqual(results, [[(1,)]])
+
+    def test_close_database_only_closes_that_database(self):
+        other_path = os.path.join(self.workdir, "other.db")
+        other = sqlite.pooled_connection(other_path)
+        self.query()
+        sqlite.close_database(self.db_path)
+        self.assertEqual(sqlite.open_connections(), 1)
+        self.assertIs(sqlite.pooled_connection(other_path), other)
+        self.assertEqual(self.query(), [(1,)])
+
+
+if __name__ == "__main__":
+    unittest.main()